@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import deque
+from loguru import logger
+from config import Config
+from username_generator import get_username_issuer
+
+
+class AccountPool:
+    """预先创建好的随机账户池，随机创建请求直接取用
+
+    - 池中的客户端已创建账户并解析好INBOX，取出后即可使用
+    - 库存低于低水位时后台线程补充到高水位，补充速度受 refill_rate 限制，避免突发时冲击上游
+    - 每轮补充所需的用户名一次批量签发，不会因用户名冲突浪费创建请求
+    - 池为空时返回None，由调用方回退到同步创建
+    """
+
+    def __init__(self, factory, low=None, high=None, refill_rate=None, issuer=None):
+        self.factory = factory  # factory(username) -> 已初始化的客户端
+        self.issuer = issuer or get_username_issuer()
+        self.low = Config.ACCOUNT_POOL_LOW if low is None else low
+        self.high = max(self.low, Config.ACCOUNT_POOL_HIGH if high is None else high)
+        self.refill_rate = refill_rate or Config.ACCOUNT_POOL_REFILL_RATE  # 每秒最多创建的账户数
+
+        self._clients = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._hits = 0
+        self._misses = 0
+        self._created = 0
+        self._failed = 0
+
+    @property
+    def enabled(self):
+        return self.high > 0
+
+    def start(self):
+        """启动后台补充线程"""
+        if not self.enabled:
+            return
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._refill_loop, name="account-pool", daemon=True)
+            self._thread.start()
+        logger.info(f"账户池启动，低水位: {self.low}，高水位: {self.high}")
+
+    def pop(self):
+        """取出一个就绪的客户端，池为空时返回None"""
+        if not self.enabled:
+            return None
+        self.start()
+        with self._cond:
+            if self._clients:
+                client = self._clients.popleft()
+                self._hits += 1
+            else:
+                client = None
+                self._misses += 1
+            if len(self._clients) < self.low:
+                self._cond.notify()
+            return client
+
+    def stats(self):
+        """返回账户池统计信息"""
+        with self._cond:
+            requests = self._hits + self._misses
+            return {
+                "depth": len(self._clients),
+                "low": self.low,
+                "high": self.high,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / requests, 4) if requests else 0.0,
+                "created": self._created,
+                "failed": self._failed,
+            }
+
+    def _refill_loop(self):
+        """低于低水位时补充到高水位，两次创建之间至少间隔 1/refill_rate 秒"""
+        min_gap = 1.0 / self.refill_rate
+        while True:
+            with self._cond:
+                while len(self._clients) >= self.low and self._clients:
+                    self._cond.wait()
+                target = self.high - len(self._clients)
+            logger.info(f"账户池补充 {target} 个账户")
+
+            usernames = deque(self.issuer.generate_batch(target))
+            while target > 0:
+                started = time.monotonic()
+                try:
+                    client = self.factory(usernames.popleft() if usernames else self.issuer.next_username())
+                except Exception as e:
+                    with self._cond:
+                        self._failed += 1
+                    logger.warning(f"账户池创建账户失败: {e}")
+                    time.sleep(Config.POLL_ERROR_INTERVAL)
+                    continue
+                with self._cond:
+                    self._clients.append(client)
+                    self._created += 1
+                    target = self.high - len(self._clients)
+                time.sleep(max(0.0, min_gap - (time.monotonic() - started)))
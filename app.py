@@ -1,6 +1,29 @@
-from flask import Flask, jsonify, request
+# 协作式并发模式（eventlet/gevent）需要在导入其他模块之前打猴子补丁
+from concurrency import setup_async_mode
+ASYNC_MODE = setup_async_mode()
+
+from flask import Flask, Response, jsonify, request, send_file
 from flask_socketio import SocketIO, emit, join_room, leave_room
-from mail_client import MailTmClient
+from mail_client import MailTmClient, resolve_mailbox
+from smtp_api import SMTPDevAPI, SMTPDevAPIError
+from http_transport import get_transport
+from resolution_cache import get_resolution_cache
+from message_cache import get_message_cache
+from download_spool import get_download_spool
+from delivery_store import get_delivery_store
+from rate_budget import get_rate_budget
+from resilience import get_resilience
+from client_registry import ClientRegistry
+from poll_scheduler import PollScheduler
+from mercure_listener import MercureListener
+from waiters import WaiterRegistry
+from batch_provisioner import BatchProvisioner
+from account_pool import AccountPool
+from username_generator import get_username_issuer
+from cluster import ClusterCoordinator, create_state_store
+from metrics import registry, polls_total, wait_duration, delivery_latency, created_at_age
+from config import Config
+import os
 import threading
 import time
 from loguru import logger
@@ -8,11 +31,17 @@ from datetime import datetime
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+# 多worker运行时经消息队列（Redis）广播，任意worker都能推送给任意worker上的订阅者
+message_queue = Config.SOCKETIO_MESSAGE_QUEUE or (
+    Config.CLUSTER_STATE_URL if Config.CLUSTER_STATE_URL.startswith(("redis://", "rediss://")) else None)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE, message_queue=message_queue)
 
-# 存储邮箱客户端实例的字典
-email_clients = {}
-# 用于线程安全的锁
+# 各邮箱水位线和待取邮件的本地持久化（未配置路径时关闭），重启后从这里恢复客户端
+delivery_store = get_delivery_store()
+# 邮箱客户端登记表（容量受限，空闲客户端会被淘汰并在再次访问时透明重建）
+email_clients = ClientRegistry(factory=lambda email, state: MailTmClient(email=email, state=state),
+                               store=delivery_store)
+# 保护WebSocket连接映射和监控器表的锁（只用于更新映射，不在持锁期间访问上游）
 clients_lock = threading.Lock()
 
 
@@ -20,37 +49,37 @@ clients_lock = threading.Lock()
 def get_email_content(email_address):
     """获取指定邮箱的邮件内容"""
     try:
-        # 检查是否已有该邮箱的客户端实例
-        with clients_lock:
-            if email_address in email_clients:
-                client = email_clients[email_address]
-            else:
-                # 创建邮箱客户端实例（用于现有账户）
-                try:
-                    client = MailTmClient(email=email_address)
-                    email_clients[email_address] = client
-                except Exception as e:
-                    return jsonify({
-                        "success": False,
-                        "email": email_address,
-                        "error": f"无法初始化邮箱客户端: {str(e)}"
-                    }), 500
-
-        # 获取邮件内容
-        message = client.wait_for_message(60)  # 等待60秒
+        # 获取或创建邮箱客户端实例（用于现有账户，同一地址的并发初始化只执行一次）
+        # 挂起等待前先建立水位线，此后到达的邮件都会被当作新邮件；取得时即固定，直到关注接管
+        try:
+            client = email_clients.get_or_create(email_address, prepare=MailTmClient.hydrate, pin=True)
+        except Exception as e:
+            return jsonify({
+                "success": False,
+                "email": email_address,
+                "error": f"无法初始化邮箱客户端: {str(e)}"
+            }), 500
+
+        # 获取邮件内容：请求只挂起在等待者上，由邮箱的共享轮询/推送唤醒
+        timeout = 60  # 等待60秒
+        started = time.monotonic()
+        try:
+            waiter = waiter_registry.register(email_address, timeout)
+            cluster.drain(email_address)  # 多worker时先取其他worker暂存的新邮件
+            _watch_mailbox(email_address, client)
+        finally:
+            email_clients.unpin(email_address)
+        try:
+            poll_scheduler.trigger(email_address)  # 立即检查一次，与原先的行为一致
+            message = waiter_registry.wait(waiter, timeout)
+        finally:
+            _unwatch_mailbox(email_address, client)
+        _observe_wait("single", started, [message] if message else [])
         if message:
-            # 提取邮件正文部分（完整HTML）
-            html_content = ""
-            if isinstance(message, dict) and 'html' in message and message['html'] and len(message['html']) > 0:
-                html_content = message['html'][0]
-            elif isinstance(message, str):
-                # 如果返回的是字符串，直接使用
-                html_content = message
-            
             return jsonify({
                 "success": True,
                 "email": email_address,
-                "content": html_content
+                "content": _message_content(message)
             })
         else:
             return jsonify({
@@ -67,19 +96,269 @@ def get_email_content(email_address):
         }), 500
 
 
+def _observe_wait(endpoint, started, messages):
+    """记录长轮询等待时长，以及收到的邮件从createdAt到交付的时长"""
+    wait_duration.observe(time.monotonic() - started, endpoint, "message" if messages else "timeout")
+    for message in messages:
+        age = created_at_age(message)
+        if age is not None:
+            delivery_latency.observe(age, "longpoll")
+
+
+def _message_content(message):
+    """提取邮件正文部分（完整HTML）"""
+    if isinstance(message, dict) and 'html' in message and message['html'] and len(message['html']) > 0:
+        return message['html'][0]
+    elif isinstance(message, str):
+        # 如果返回的是字符串，直接使用
+        return message
+    return ""
+
+
+@app.route('/api/emails/wait', methods=['POST'])
+def wait_for_emails():
+    """同时等待多个邮箱，任意一个（或quorum个）收到邮件即返回"""
+    try:
+        data = request.get_json(silent=True) or {}
+        emails = data.get('emails')
+        if not isinstance(emails, list) or not emails or not all(isinstance(e, str) and e for e in emails):
+            return jsonify({
+                "success": False,
+                "error": "emails 必须是非空的邮箱地址列表"
+            }), 400
+        emails = list(dict.fromkeys(emails))  # 去重并保持顺序
+        if len(emails) > Config.WAIT_MAX_ADDRESSES:
+            return jsonify({
+                "success": False,
+                "error": f"单次最多等待 {Config.WAIT_MAX_ADDRESSES} 个邮箱"
+            }), 400
+        timeout = data.get('timeout', 60)
+        quorum = data.get('quorum', 1)
+        if not isinstance(timeout, (int, float)) or isinstance(timeout, bool) or not 0 <= timeout <= 60:
+            return jsonify({
+                "success": False,
+                "error": "timeout 必须是 0 到 60 之间的秒数"
+            }), 400
+        if not isinstance(quorum, int) or isinstance(quorum, bool) or not 1 <= quorum <= len(emails):
+            return jsonify({
+                "success": False,
+                "error": "quorum 必须是 1 到邮箱数量之间的整数"
+            }), 400
+        
+        # 并发初始化各邮箱客户端（耗时约为一次上游往返，与邮箱数无关），失败的邮箱单独报告，不影响其余邮箱
+        clients = {}
+        errors = {}
+        for email_address, future in email_clients.prefetch(emails, MailTmClient.hydrate, pin=True).items():
+            try:
+                clients[email_address] = future.result()
+            except Exception as e:
+                errors[email_address] = f"无法初始化邮箱客户端: {str(e)}"
+        
+        received = {}
+        started = time.monotonic()
+        if clients:
+            # 所有邮箱共享一个就绪信号，请求线程只挂起一次，由各邮箱的共享轮询/推送唤醒
+            try:
+                group = waiter_registry.register_group(list(clients), min(quorum, len(clients)), timeout)
+                for email_address, client in clients.items():
+                    cluster.drain(email_address)
+                    _watch_mailbox(email_address, client)
+            finally:
+                for email_address in clients:
+                    email_clients.unpin(email_address)
+            try:
+                for email_address in clients:
+                    poll_scheduler.trigger(email_address)
+                received = waiter_registry.wait_group(group, timeout)
+            finally:
+                for email_address, client in clients.items():
+                    _unwatch_mailbox(email_address, client)
+            _observe_wait("group", started, list(received.values()))
+        
+        results = []
+        for email_address in emails:
+            item = {"email": email_address, "received": email_address in received}
+            if email_address in received:
+                item["content"] = _message_content(received[email_address])
+            elif email_address in errors:
+                item["error"] = errors[email_address]
+            results.append(item)
+        
+        response = {
+            "success": len(received) >= quorum,
+            "quorum": quorum,
+            "received": len(received),
+            "results": results
+        }
+        if response["success"]:
+            return jsonify(response)
+        response["error"] = "未收到足够的邮件或超时"
+        return jsonify(response), 404
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route('/api/email/<email_address>/messages/<message_id>', methods=['GET'])
+def get_email_message(email_address, message_id):
+    """按ID获取指定邮箱的一封邮件（优先从邮件详情缓存读取）"""
+    try:
+        # 按ID读取只需解析账户和INBOX，不必建立水位线
+        try:
+            client = email_clients.get_or_create(email_address, prepare=MailTmClient.resolve)
+        except Exception as e:
+            return jsonify({
+                "success": False,
+                "email": email_address,
+                "error": f"无法初始化邮箱客户端: {str(e)}"
+            }), 500
+        
+        try:
+            message = client.get_message(message_id)
+        except SMTPDevAPIError as e:
+            return jsonify({
+                "success": False,
+                "email": email_address,
+                "error": f"上游请求失败: {str(e)}"
+            }), 502
+        if message:
+            return jsonify({
+                "success": True,
+                "email": email_address,
+                "message": message
+            })
+        else:
+            return jsonify({
+                "success": False,
+                "email": email_address,
+                "error": "邮件不存在"
+            }), 404
+            
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "email": email_address,
+            "error": str(e)
+        }), 500
+
+
+# 从上游响应原样转发给客户端的响应头
+_STREAM_HEADERS = ("Content-Type", "Content-Length", "Content-Range", "Accept-Ranges",
+                   "Content-Disposition", "ETag", "Last-Modified")
+
+
+@app.route('/api/email/<email_address>/messages/<message_id>/source', methods=['GET'],
+           defaults={'part': 'source', 'attachment_id': None})
+@app.route('/api/email/<email_address>/messages/<message_id>/download', methods=['GET'],
+           defaults={'part': 'download', 'attachment_id': None})
+@app.route('/api/email/<email_address>/messages/<message_id>/attachments/<attachment_id>', methods=['GET'],
+           defaults={'part': 'attachment'})
+def stream_email_part(email_address, message_id, part, attachment_id):
+    """流式转发邮件原文、EML下载或附件（支持Range，可选磁盘缓存），内存占用与邮件大小无关"""
+    try:
+        # 按ID读取只需解析账户和INBOX，不必建立水位线
+        try:
+            client = email_clients.get_or_create(email_address, prepare=MailTmClient.resolve)
+        except Exception as e:
+            return jsonify({
+                "success": False,
+                "email": email_address,
+                "error": f"无法初始化邮箱客户端: {str(e)}"
+            }), 500
+        
+        spool = get_download_spool()
+        spool_key = f"{message_id}/{part}/{attachment_id or ''}"
+        range_header = request.headers.get('Range')
+        
+        # 磁盘缓存命中：直接从本地文件发送，Range由send_file处理
+        if spool.enabled:
+            cached = spool.lookup(spool_key, client.mailbox_id)
+            if cached:
+                path, meta = cached
+                response = send_file(path, mimetype=meta.get("content_type"), conditional=True)
+                if meta.get("content_disposition"):
+                    response.headers["Content-Disposition"] = meta["content_disposition"]
+                return response
+        
+        upstream = client.api.open_message_stream(
+            client.account_id, client.mailbox_id, message_id,
+            part=part, attachment_id=attachment_id, range_header=range_header
+        )
+        if upstream is None:
+            return jsonify({
+                "success": False,
+                "email": email_address,
+                "error": "上游请求失败"
+            }), 502
+        if upstream.status_code not in (200, 206):
+            upstream.close()
+            if upstream.status_code == 416:
+                return jsonify({
+                    "success": False,
+                    "email": email_address,
+                    "error": "请求的范围无效"
+                }), 416
+            not_found = upstream.status_code == 404
+            if not_found:
+                # 邮件已被删除：丢弃缓存的详情（单个邮件的404不代表解析结果失效，不重新解析）
+                get_message_cache().invalidate(message_id)
+            return jsonify({
+                "success": False,
+                "email": email_address,
+                "error": "邮件或附件不存在" if not_found else f"上游返回错误: {upstream.status_code}"
+            }), 404 if not_found else 502
+        
+        # 只缓存完整内容；Range请求直接透传，不写磁盘
+        writer = None
+        if spool.enabled and upstream.status_code == 200:
+            writer = spool.open_writer(spool_key, {
+                "mailbox_id": client.mailbox_id,
+                "content_type": upstream.headers.get("Content-Type"),
+                "content_disposition": upstream.headers.get("Content-Disposition"),
+            })
+        
+        def generate():
+            spooling = writer
+            try:
+                for chunk in upstream.raw.stream(Config.DOWNLOAD_CHUNK_SIZE, decode_content=False):
+                    if spooling:
+                        spooling.write(chunk)
+                    yield chunk
+                if spooling:
+                    spooling.commit()
+                    spooling = None
+            finally:
+                # 客户端中途断开时丢弃不完整的缓存文件
+                if spooling:
+                    spooling.abort()
+                upstream.close()
+        
+        headers = {name: upstream.headers[name] for name in _STREAM_HEADERS if name in upstream.headers}
+        return Response(generate(), status=upstream.status_code, headers=headers, direct_passthrough=True)
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "email": email_address,
+            "error": str(e)
+        }), 500
+
+
 @app.route('/api/email', methods=['POST'])
 def get_or_create_email():
     """获取或创建指定邮箱账户（支持向后兼容）"""
     try:
         # 检查请求体是否为空（向后兼容原调用方式）
         if not request.is_json or not request.get_json():
-            # 原来的调用方式：创建随机新账户
-            client = MailTmClient()
+            # 原来的调用方式：创建随机新账户（优先从预创建账户池取用，池空时同步创建）
+            client = account_pool.pop() or MailTmClient()
             email_address = client.get_email()
             
             # 保存客户端实例
-            with clients_lock:
-                email_clients[email_address] = client
+            email_clients.put(email_address, client)
             
             return jsonify({
                 "success": True,
@@ -96,45 +375,81 @@ def get_or_create_email():
             }), 400
         
         # 检查是否已有该邮箱的客户端实例
-        with clients_lock:
-            if email_address in email_clients:
-                client = email_clients[email_address]
+        if email_address in email_clients:
+            return jsonify({
+                "success": True,
+                "email": email_address,
+                "message": "使用现有邮箱账户"
+            })
+        
+        # 尝试通过邮箱地址查找现有账户
+        try:
+            resolved = resolve_mailbox(SMTPDevAPI(), email_address)
+            
+            if resolved:
+                # 找到现有账户，直接返回（不创建新客户端实例）；记下该用户名，随机签发时避开
+                get_username_issuer().mark_existing(email_address.split('@')[0])
                 return jsonify({
                     "success": True,
                     "email": email_address,
                     "message": "使用现有邮箱账户"
                 })
             else:
-                # 尝试通过邮箱地址查找现有账户
-                try:
-                    from smtp_api import SMTPDevAPI
-                    api = SMTPDevAPI()
-                    account_data = api.get_account_by_email(email_address)
-                    
-                    if account_data:
-                        # 找到现有账户，直接返回（不创建新客户端实例）
-                        return jsonify({
-                            "success": True,
-                            "email": email_address,
-                            "message": "使用现有邮箱账户"
-                        })
-                    else:
-                        # 账户不存在，创建新账户
-                        client = MailTmClient(email_address.split('@')[0])
-                        email_clients[email_address] = client
-                        return jsonify({
-                            "success": True,
-                            "email": email_address,
-                            "message": "创建新邮箱账户"
-                        })
-                        
-                except Exception as e:
-                    return jsonify({
-                        "success": False,
-                        "email": email_address,
-                        "error": f"处理邮箱账户时出错: {str(e)}"
-                    }), 500
+                # 账户不存在，创建新账户（同一地址的并发创建只执行一次）
+                email_clients.get_or_create(
+                    email_address,
+                    factory=lambda email, state: MailTmClient(username=email.split('@')[0])
+                )
+                return jsonify({
+                    "success": True,
+                    "email": email_address,
+                    "message": "创建新邮箱账户"
+                })
                 
+        except Exception as e:
+            return jsonify({
+                "success": False,
+                "email": email_address,
+                "error": f"处理邮箱账户时出错: {str(e)}"
+            }), 500
+                
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+
+@app.route('/api/emails/batch', methods=['POST'])
+def create_emails_batch():
+    """批量创建随机新邮箱账户（有界并发，失败项自动重试，逐项返回结果）"""
+    try:
+        data = request.get_json(silent=True) or {}
+        count = data.get('count')
+        if not isinstance(count, int) or isinstance(count, bool) or not 1 <= count <= Config.BATCH_MAX_COUNT:
+            return jsonify({
+                "success": False,
+                "error": f"count 必须是 1 到 {Config.BATCH_MAX_COUNT} 之间的整数"
+            }), 400
+        
+        results = []
+        for index, (client, error, attempts) in enumerate(batch_provisioner.provision(count)):
+            if client is not None:
+                email_address = client.get_email()
+                email_clients.put(email_address, client)
+                results.append({"index": index, "success": True, "email": email_address, "attempts": attempts})
+            else:
+                results.append({"index": index, "success": False, "error": error, "attempts": attempts})
+        
+        created = sum(1 for item in results if item["success"])
+        return jsonify({
+            "success": created == count,
+            "requested": count,
+            "created": created,
+            "failed": count - created,
+            "results": results
+        })
+        
     except Exception as e:
         return jsonify({
             "success": False,
@@ -142,10 +457,133 @@ def get_or_create_email():
         }), 500
 
 
+# 批量创建账户（所有批次共享有界并发）
+batch_provisioner = BatchProvisioner(factory=lambda username: MailTmClient(username=username))
+# 预创建的随机账户池
+account_pool = AccountPool(factory=lambda username: MailTmClient(username=username))
+
 # WebSocket相关变量
-ws_connections = {}  # {email: [sid1, sid2, ...]} - WebSocket连接映射
+ws_connections = {}  # {email: {sid1, sid2, ...}} - WebSocket连接映射（集合，断开时O(1)移除）
 connection_emails = {}  # {sid: email} - 连接到邮箱的映射
-monitoring_threads = {}  # 邮件监控线程
+monitoring_threads = {}  # {email: EmailMonitor} - 邮件监控器（由共享调度器驱动）
+waiter_registry = WaiterRegistry()  # HTTP长轮询等待者
+# 所有邮箱共享的轮询调度器（自适应间隔，截止时间近的等待者优先，受全局上游请求预算约束）
+poll_scheduler = PollScheduler(deadline_of=waiter_registry.deadline)
+mailbox_watchers = {}  # {email: 引用计数} - 需要轮询的邮箱（WebSocket监控 + 长轮询等待）
+watchers_lock = threading.Lock()
+# 多worker协调：每个邮箱只由持有租约的worker轮询，新邮件跨worker分发（未配置共享存储时关闭）
+cluster = ClusterCoordinator(waiters=waiter_registry, store=create_state_store(Config.CLUSTER_STATE_URL))
+
+
+def _watch_mailbox(email_address, client):
+    """登记对邮箱的关注，首个关注者注册共享轮询任务和推送订阅
+
+    关注期间客户端保持固定；调用方应以 get_or_create(..., pin=True) 取得客户端，登记关注后再解除自己的固定，
+    客户端在两者之间不会被淘汰
+    """
+    with watchers_lock:
+        count = mailbox_watchers.get(email_address, 0)
+        mailbox_watchers[email_address] = count + 1
+        email_clients.pin(email_address)
+        if count == 0:
+            poll_scheduler.schedule(email_address, lambda: _poll_mailbox(email_address))
+            mercure_listener.watch(client.account_id, email_address)
+
+
+def _unwatch_mailbox(email_address, client):
+    """取消关注，最后一个关注者离开时注销轮询任务和推送订阅，并释放轮询租约"""
+    with watchers_lock:
+        count = mailbox_watchers.get(email_address, 0) - 1
+        email_clients.unpin(email_address)
+        if count > 0:
+            mailbox_watchers[email_address] = count
+            return
+        mailbox_watchers.pop(email_address, None)
+        poll_scheduler.cancel(email_address)
+        mercure_listener.unwatch(client.account_id)
+    # 释放租约要访问共享存储，不持有全局锁
+    cluster.release(email_address)
+
+
+def _poll_mailbox(email_address):
+    """邮箱共享轮询任务：检查一次新邮件并分发给WebSocket订阅者和长轮询等待者"""
+    client = email_clients.get(email_address)
+    with clients_lock:
+        monitor = monitoring_threads.get(email_address)
+    if client is None:
+        return None
+    
+    try:
+        if cluster.enabled:
+            # 多worker时只有持有租约的worker访问上游，其余worker定期尝试接管
+            if not cluster.acquire(email_address, client):
+                polls_total.inc("standby")
+                return cluster.lease_ttl / 3
+            message = client.get_latest_message()
+            if message and not cluster.confirm(email_address):
+                # 轮询期间租约被接管：接管者会从共享游标再取到这封邮件，这里不再分发
+                polls_total.inc("standby")
+                return cluster.lease_ttl / 3
+            if message:
+                polls_total.inc("message")
+                monitored = monitor is not None or cluster.is_monitored(email_address)
+                cluster.dispatch(email_address, message, monitored)
+                if monitored:
+                    _push_new_email(email_address, message)
+            # 交付之后才保存推进后的游标：交付前崩溃时接管者或重启后会重新交付，而不是丢失
+            cluster.save(email_address, client)
+            if message:
+                _commit_delivery(email_address, client)
+                return 0
+        else:
+            message = client.get_latest_message()
+            if message:
+                polls_total.inc("message")
+                # 已有WebSocket订阅者收到推送时不再为后续的长轮询暂存
+                waiter_registry.deliver(email_address, message, stash=monitor is None)
+                if monitor:
+                    monitor._push_new_email(message)
+                _commit_delivery(email_address, client)
+                # get_latest_message每次只返回一封，立即再查一次以尽快取完积压邮件
+                return 0
+    except Exception:
+        polls_total.inc("error")
+        raise
+    
+    polls_total.inc("empty")
+    # 推送连接可用时只做低频兜底轮询，断开时回退到默认间隔
+    if mercure_listener.is_live(client.account_id):
+        return Config.MERCURE_FALLBACK_INTERVAL
+    return None
+
+
+def _commit_delivery(email_address, client):
+    """邮件交付给等待者和WebSocket推送之后，等推进后的投递状态提交到磁盘
+    
+    至少一次交付：交付与提交之间崩溃时，重启后这封邮件会再交付一次，但不会丢失；
+    提交完成后重启不会重复交付。
+    """
+    delivery_store.save(email_address, client.export_state(), wait=True)
+
+
+def _on_push_message(email_address):
+    """Mercure新邮件事件：立即触发一次邮箱轮询"""
+    client = email_clients.get(email_address)
+    if client:
+        client.notify_new_mail()
+    poll_scheduler.trigger(email_address)
+
+
+def _on_push_state(email_address, live):
+    """Mercure连接状态变化：切换兜底轮询频率，恢复连接时补查一次"""
+    client = email_clients.get(email_address)
+    if client:
+        client.push_active = live
+        client.notify_new_mail()
+    poll_scheduler.trigger(email_address)
+
+
+mercure_listener = MercureListener(on_message=_on_push_message, on_state=_on_push_state)
 
 class EmailMonitor:
     """邮件监控类，用于WebSocket实时推送"""
@@ -154,63 +592,110 @@ class EmailMonitor:
         self.email_address = email_address
         self.client = client
         self.is_running = False
+        self._stopped = False
+        # 启停在释放clients_lock后进行，可能乱序：先到的停止使之后的启动不再生效
+        self._lock = threading.Lock()
         
     def start_monitoring(self):
-        """开始监控邮件"""
-        self.is_running = True
-        thread = threading.Thread(target=self._monitor_loop, daemon=True)
-        thread.start()
-        return thread
-        
-    def stop_monitoring(self):
-        """停止监控邮件"""
-        self.is_running = False
-        
-    def _monitor_loop(self):
-        """邮件监控循环"""
+        """开始监控邮件（由邮箱的共享轮询任务驱动；会访问共享存储，不能在持有clients_lock时调用）"""
+        with self._lock:
+            if self.is_running or self._stopped:
+                return
+            self.is_running = True
+            cluster.add_monitor(self.email_address)
+            _watch_mailbox(self.email_address, self.client)
         logger.info(f"WebSocket开始监控邮箱: {self.email_address}")
         
-        while self.is_running:
-            try:
-                # 检查新邮件
-                message = self.client.get_latest_message()
-                if message:
-                    # 有新邮件，推送给WebSocket客户端
-                    self._push_new_email(message)
-                    
-                time.sleep(2)  # 每2秒检查一次
-                
-            except Exception as e:
-                logger.error(f"WebSocket邮件监控出错 {self.email_address}: {e}")
-                time.sleep(5)
-                
+    def stop_monitoring(self):
+        """停止监控邮件（会访问共享存储，不能在持有clients_lock时调用）"""
+        with self._lock:
+            self._stopped = True
+            if not self.is_running:
+                return
+            self.is_running = False
+            cluster.remove_monitor(self.email_address)
+            _unwatch_mailbox(self.email_address, self.client)
         logger.info(f"WebSocket停止监控邮箱: {self.email_address}")
         
     def _push_new_email(self, message):
         """推送新邮件到WebSocket客户端"""
-        try:
-            email_data = {
-                'type': 'new_mail',
-                'timestamp': datetime.now().isoformat(),
-                'data': {
-                    'email': self.email_address,
-                    'subject': message.get('subject', ''),
-                    'from': message.get('from', {}),
-                    'date': message.get('date', ''),
-                    'html': message.get('html', []),
-                    'text': message.get('text', [])
-                }
+        _push_new_email(self.email_address, message)
+
+
+def _push_new_email(email_address, message):
+    """推送新邮件到邮箱房间内的所有WebSocket客户端（多worker时经消息队列到达其他worker）"""
+    try:
+        email_data = {
+            'type': 'new_mail',
+            'timestamp': datetime.now().isoformat(),
+            'data': {
+                'email': email_address,
+                'subject': message.get('subject', ''),
+                'from': message.get('from', {}),
+                'date': message.get('date', ''),
+                'html': message.get('html', []),
+                'text': message.get('text', [])
             }
-            
-            # 推送给所有连接该邮箱的WebSocket客户端
-            with clients_lock:
-                if self.email_address in ws_connections:
-                    for sid in ws_connections[self.email_address]:
-                        socketio.emit('email_notification', email_data, room=sid)
-                        logger.info(f"WebSocket推送新邮件到客户端 {sid}")
-                        
-        except Exception as e:
-            logger.error(f"WebSocket推送邮件失败: {e}")
+        }
+        
+        # 以邮箱地址为房间整体广播：负载只序列化一次，且不持有全局锁
+        socketio.emit('email_notification', email_data, to=email_address)
+        logger.info(f"WebSocket推送新邮件到房间 {email_address}")
+        age = created_at_age(message)
+        if age is not None:
+            delivery_latency.observe(age, "websocket")
+                    
+    except Exception as e:
+        logger.error(f"WebSocket推送邮件失败: {e}")
+
+
+@app.route('/api/monitor/stats', methods=['GET'])
+def get_monitor_stats():
+    """获取邮件监控调度器的运行状态"""
+    return jsonify({
+        "success": True,
+        "monitors": len(monitoring_threads),
+        "scheduler": poll_scheduler.stats(),
+        "mercure": mercure_listener.stats(),
+        "waiters": waiter_registry.stats(),
+        "transport": get_transport().stats(),
+        "budget": get_rate_budget().stats(),
+        "breakers": get_resilience().stats(),
+        "resolution_cache": get_resolution_cache().stats(),
+        "message_cache": get_message_cache().stats(),
+        "download_spool": get_download_spool().stats(),
+        "delivery_store": delivery_store.stats(),
+        "clients": email_clients.stats(),
+        "batch": batch_provisioner.stats(),
+        "account_pool": account_pool.stats(),
+        "usernames": get_username_issuer().stats(),
+        "cluster": cluster.stats()
+    })
+
+def _websocket_connections():
+    """连接数最多的 METRICS_ADDRESS_LIMIT 个邮箱的WebSocket连接数（限制标签基数）"""
+    with clients_lock:
+        counts = [(email, len(sids)) for email, sids in ws_connections.items()]
+    counts.sort(key=lambda item: item[1], reverse=True)
+    return [((email,), count) for email, count in counts[:Config.METRICS_ADDRESS_LIMIT]]
+
+
+registry.gauge("emailapi_monitors", "活跃的WebSocket邮件监控器数", lambda: len(monitoring_threads))
+registry.gauge("emailapi_websocket_connections_total", "已认证的WebSocket连接总数", lambda: len(connection_emails))
+registry.gauge("emailapi_websocket_connections", "每个邮箱的WebSocket连接数（只导出连接最多的邮箱）",
+               _websocket_connections, ("email",))
+registry.gauge("emailapi_email_clients", "内存中的邮箱客户端数", lambda: email_clients.stats()["size"])
+registry.gauge("emailapi_waiters", "挂起的长轮询等待者数", lambda: waiter_registry.stats()["waiters"])
+registry.gauge("emailapi_poll_lag_seconds", "最近一次轮询相对计划时间的延迟", lambda: poll_scheduler.stats()["lag_last"])
+registry.gauge("emailapi_breaker_open", "上游端点熔断器是否处于非关闭状态（open/half_open为1）",
+               lambda: [((endpoint,), int(stats["state"] != "closed"))
+                        for endpoint, stats in get_resilience().stats().items()], ("endpoint",))
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus格式的运行指标"""
+    return Response(registry.render(), content_type=registry.CONTENT_TYPE)
 
 # WebSocket事件处理器
 @socketio.on('connect')
@@ -229,19 +714,34 @@ def handle_disconnect():
     sid = request.sid
     logger.info(f"WebSocket客户端断开: {sid}")
     
+    # 断开的连接由Socket.IO自动移出房间，这里只维护映射和监控器
+    stopped = []
     with clients_lock:
-        if sid in connection_emails:
-            email = connection_emails[sid]
-            if email in ws_connections:
-                ws_connections[email].remove(sid)
-                if not ws_connections[email]:
-                    # 该邮箱没有其他WebSocket连接，停止监控
-                    del ws_connections[email]
-                    if email in monitoring_threads:
-                        monitoring_threads[email].stop_monitoring()
-                        del monitoring_threads[email]
-                        logger.info(f"停止WebSocket监控邮箱: {email}")
-            del connection_emails[sid]
+        _remove_connection(sid, stopped)
+    for monitor in stopped:
+        monitor.stop_monitoring()
+
+
+def _remove_connection(sid, stopped):
+    """
+    移除连接映射，邮箱没有其他连接时移除监控器（调用方需持有clients_lock）
+
+    移除的监控器追加到stopped，由调用方在释放clients_lock后停止：停止监控要访问共享存储
+    """
+    email = connection_emails.pop(sid, None)
+    if email is None:
+        return None
+    sids = ws_connections.get(email)
+    if sids is not None:
+        sids.discard(sid)
+        if not sids:
+            # 该邮箱没有其他WebSocket连接，停止监控
+            del ws_connections[email]
+            monitor = monitoring_threads.pop(email, None)
+            if monitor:
+                stopped.append(monitor)
+                logger.info(f"停止WebSocket监控邮箱: {email}")
+    return email
 
 @socketio.on('authenticate')
 def handle_authenticate(data):
@@ -259,33 +759,45 @@ def handle_authenticate(data):
         sid = request.sid
         logger.info(f"WebSocket认证: {sid} -> {email_address}")
         
+        # 确保邮箱客户端存在并已建立水位线（被淘汰过的会透明重建，不持有全局锁）；取得时即固定，直到监控接管
+        try:
+            client = email_clients.get_or_create(email_address, prepare=MailTmClient.hydrate, pin=True)
+        except Exception as e:
+            emit('auth_response', {
+                'type': 'auth_error',
+                'timestamp': datetime.now().isoformat(),
+                'message': f'无法初始化邮箱客户端: {str(e)}'
+            })
+            return
+        
+        # 全局锁内只更新映射，监控的启停（访问共享存储）在释放锁后进行
+        stopped = []
+        started = None
         with clients_lock:
-            # 确保邮箱客户端存在
-            if email_address not in email_clients:
-                try:
-                    client = MailTmClient(email=email_address)
-                    email_clients[email_address] = client
-                except Exception as e:
-                    emit('auth_response', {
-                        'type': 'auth_error',
-                        'timestamp': datetime.now().isoformat(),
-                        'message': f'无法初始化邮箱客户端: {str(e)}'
-                    })
-                    return
+            # 同一连接改为监控其他邮箱时，先退出原邮箱
+            previous = connection_emails.get(sid)
+            if previous != email_address:
+                previous = _remove_connection(sid, stopped)
             
             # 添加WebSocket连接映射
-            if email_address not in ws_connections:
-                ws_connections[email_address] = []
-            ws_connections[email_address].append(sid)
+            ws_connections.setdefault(email_address, set()).add(sid)
             connection_emails[sid] = email_address
             
             # 启动邮件监控（如果还没有启动）
             if email_address not in monitoring_threads:
-                monitor = EmailMonitor(email_address, email_clients[email_address])
-                monitor.start_monitoring()
-                monitoring_threads[email_address] = monitor
+                started = monitoring_threads[email_address] = EmailMonitor(email_address, client)
                 logger.info(f"启动WebSocket邮件监控: {email_address}")
         
+        try:
+            for monitor in stopped:
+                monitor.stop_monitoring()
+            if started:
+                started.start_monitoring()
+        finally:
+            email_clients.unpin(email_address)
+        
+        if previous and previous != email_address:
+            leave_room(previous)
         join_room(email_address)
         
         emit('auth_response', {
@@ -310,19 +822,38 @@ def handle_heartbeat():
         'timestamp': datetime.now().isoformat()
     })
 
+def _warm_up():
+    """启动后在后台加载首个请求会用到的本地状态（解析缓存快照、下载缓存索引、用户名过滤器），不占用请求路径"""
+    started = time.monotonic()
+    try:
+        get_resolution_cache()
+        get_download_spool()
+        get_message_cache()
+        get_username_issuer()
+    except Exception as e:
+        logger.warning(f"启动预热失败: {e}")
+        return
+    logger.info(f"启动预热完成，用时 {time.monotonic() - started:.3f} 秒")
+
+
+threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+
 if __name__ == '__main__':
-    import os
-    logger.info("启动邮件API服务器 (HTTP + WebSocket)...")
+    logger.info(f"启动邮件API服务器 (HTTP + WebSocket)，并发模式: {ASYNC_MODE}...")
     
     # 设置环境变量明确指定为开发环境
     os.environ['FLASK_ENV'] = 'development'
     
+    # 预热账户池（使用重载器时只在实际提供服务的子进程中预热）
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        account_pool.start()
+    
     # 使用更安全的启动方式
     socketio.run(
         app, 
         debug=True, 
         host='0.0.0.0', 
-        port=5000, 
+        port=Config.SERVER_PORT, 
         allow_unsafe_werkzeug=True,
         use_reloader=True,
         log_output=False  # 减少日志输出
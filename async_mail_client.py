@@ -0,0 +1,164 @@
+import asyncio
+import time
+from collections import deque
+from loguru import logger
+from username_generator import get_username_issuer
+from async_smtp_api import AsyncSMTPDevAPI
+from smtp_api import SMTPDevAPIError
+from message_cursor import MessageCursor
+from poll_scheduler import adaptive_interval
+from config import Config
+
+
+class AsyncMailTmClient:
+    """异步版邮件客户端，接口与 MailTmClient 对应
+
+    构造函数不访问网络，请使用 `await AsyncMailTmClient.create(...)` 完成初始化。
+    多个客户端应共享同一个 AsyncSMTPDevAPI，以便一个事件循环驱动大量邮箱。
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.email = None
+        self.account_id = None
+        self.mailbox_id = None
+        self.cursor = MessageCursor()  # 已见邮件的水位线
+        self.pending_ids = deque()  # 已发现但尚未取回详情的新邮件ID，旧邮件在前
+        self.push_active = False  # 实时推送可用时降低轮询频率
+        self._new_mail = asyncio.Event()
+
+    @classmethod
+    async def create(cls, email=None, username=None, api=None):
+        """创建并初始化客户端，支持现有账户和创建新账户"""
+        client = cls(api or AsyncSMTPDevAPI())
+        if email:
+            await client._initialize_existing_account(email)
+        else:
+            if username is None:
+                username = get_username_issuer().next_username()
+            await client._create_new_account(username)
+        return client
+
+    async def _find_inbox(self):
+        """获取INBOX邮箱ID"""
+        mailboxes = await self.api.get_mailboxes(self.account_id)
+        for mailbox in mailboxes or []:
+            if mailbox["path"] == "INBOX":
+                return mailbox["id"]
+        return None
+
+    async def _initialize_existing_account(self, email):
+        """初始化现有账户"""
+        # 请求失败时抛出异常，避免把上游故障当作"账户不存在"
+        account_data = await self.api.get_account_by_email(email, raise_on_error=True)
+        if not account_data:
+            raise Exception(f"未找到邮箱账户: {email}")
+
+        self.email = email
+        self.account_id = account_data["id"]
+        get_username_issuer().mark_existing(email.split('@')[0])
+        self.mailbox_id = await self._find_inbox()
+        if not self.mailbox_id:
+            raise Exception(f"无法获取邮箱 {email} 的INBOX")
+
+        logger.info(f"现有账户初始化成功: {self.email}")
+        await self._initialize_watermark()
+
+    async def _initialize_watermark(self):
+        """以第一页邮件建立水位线，避免将旧邮件当作新邮件
+
+        上游故障时抛出SMTPDevAPIError且不建立水位线，否则已有的旧邮件会被当作新邮件交付
+        """
+        messages, _ = await self.api.get_messages_page(self.account_id, self.mailbox_id, 1, raise_on_error=True)
+        if messages:
+            self.cursor.advance(reversed(messages))
+        logger.info(f"初始化已完成邮件跟踪，水位线: {self.cursor.watermark or '无'}")
+
+    async def _create_new_account(self, username):
+        """创建新账户"""
+        account_data = await self.api.create_account(
+            username + "@" + Config.MAIL_TM_DOMAIN,
+            Config.DEFAULT_PASSWORD
+        )
+        if not account_data:
+            raise Exception("无法创建新账户")
+
+        self.email = account_data["address"]
+        self.account_id = account_data["id"]
+        self.mailbox_id = await self._find_inbox()
+        if not self.mailbox_id:
+            raise Exception(f"无法获取新账户 {self.email} 的INBOX")
+        logger.info(f"新账户创建成功: {self.email}")
+
+    def get_email(self):
+        """获取邮箱地址"""
+        return self.email
+
+    async def fetch_new_messages(self):
+        """增量获取水位线之后的新邮件摘要（旧邮件在前），逻辑同 MailTmClient.fetch_new_messages
+
+        Raises:
+            SMTPDevAPIError: 上游故障（与"没有新邮件"区分），水位线不推进
+        """
+        new_messages = []
+        for page in range(1, Config.MESSAGE_SCAN_MAX_PAGES + 1):
+            # 部分页失败时不推进水位线，下次轮询重新扫描，避免跳过较旧的新邮件
+            messages, has_next = await self.api.get_messages_page(
+                self.account_id, self.mailbox_id, page, raise_on_error=True
+            )
+            page_new, reached = self.cursor.scan_page(messages)
+            new_messages.extend(page_new)
+            if reached or not has_next:
+                break
+        else:
+            logger.warning(f"{self.email} 新邮件超过 {Config.MESSAGE_SCAN_MAX_PAGES} 页，更早的新邮件将被跳过")
+
+        new_messages.reverse()
+        self.cursor.advance(new_messages)
+        return new_messages
+
+    async def get_latest_message(self):
+        """获取下一封未处理的消息（按到达顺序）；上游故障时抛出SMTPDevAPIError"""
+        if not all([self.account_id, self.mailbox_id]):
+            raise Exception("账户未正确初始化")
+
+        if not self.pending_ids:
+            self.pending_ids.extend(message["id"] for message in await self.fetch_new_messages())
+        if not self.pending_ids:
+            return None
+
+        # 邮件已被删除（404）时视为已处理；上游故障时保留在待取队列，下次轮询重试
+        message = await self.api.get_message_detail(self.account_id, self.mailbox_id, self.pending_ids[0],
+                                                    raise_on_error=True)
+        self.pending_ids.popleft()
+        return message
+
+    def notify_new_mail(self):
+        """唤醒正在等待的wait_for_message立即重新检查（需在事件循环线程中调用）"""
+        self._new_mail.set()
+
+    async def wait_for_message(self, timeout=60):
+        """等待新消息到达"""
+        start_time = time.monotonic()
+        idle_polls = 0
+        while time.monotonic() - start_time < timeout:
+            self._new_mail.clear()
+            try:
+                message = await self.get_latest_message()
+            except SMTPDevAPIError as e:
+                # 上游故障（已重试或已熔断）时按出错间隔等待，不再连续请求
+                logger.warning(f"检查新邮件失败: {e}")
+                interval = Config.POLL_ERROR_INTERVAL
+            else:
+                if message:
+                    return message
+                interval = Config.MERCURE_FALLBACK_INTERVAL if self.push_active else adaptive_interval(idle_polls, True)
+                idle_polls += 1
+            remaining = timeout - (time.monotonic() - start_time)
+            try:
+                await asyncio.wait_for(self._new_mail.wait(), max(0, min(interval, remaining)))
+            except asyncio.TimeoutError:
+                pass
+
+        logger.warning(f"等待消息超时: {timeout}秒")
+        return None
@@ -0,0 +1,260 @@
+import asyncio
+import time
+import httpx
+from loguru import logger
+from config import Config
+from smtp_api import SMTPDevAPI, SMTPDevAPIError
+from rate_budget import get_rate_budget, parse_retry_after
+from resilience import get_resilience
+from metrics import upstream_latency
+
+
+def _build_client(http2=None):
+    """创建带连接池的异步HTTP客户端；未安装h2时回退到HTTP/1.1"""
+    http2 = Config.HTTP2_ENABLED if http2 is None else http2
+    limits = httpx.Limits(
+        max_connections=Config.HTTP_POOL_MAXSIZE,
+        max_keepalive_connections=Config.HTTP_POOL_MAXSIZE
+    )
+    timeout = httpx.Timeout(Config.HTTP_READ_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT)
+    try:
+        return httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
+    except ImportError:
+        logger.warning("未安装h2，异步客户端回退到HTTP/1.1")
+        return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+class AsyncSMTPDevAPI:
+    """SMTP.dev邮件服务器API异步客户端，接口与 SMTPDevAPI 一一对应
+
+    一个实例可以被任意数量的 AsyncMailTmClient 共享，所有请求复用同一个连接池。
+    """
+
+    BASE_URL = SMTPDevAPI.BASE_URL
+    DEFAULT_HEADERS = SMTPDevAPI.DEFAULT_HEADERS
+
+    def __init__(self, client=None, http2=None):
+        self._owns_client = client is None
+        self.client = client or _build_client(http2)
+
+    async def aclose(self):
+        """关闭自己创建的HTTP客户端"""
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def _request(self, endpoint, method, path, idempotent=True, **kwargs):
+        """发送请求，与同步客户端共享上游请求预算、熔断器和重试策略"""
+        budget = get_rate_budget()
+        resilience = get_resilience()
+        breaker = resilience.breaker(endpoint)
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise httpx.TransportError(f"上游端点 {endpoint} 熔断中")
+            try:
+                wait = budget.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                started = time.perf_counter()
+                response = await self.client.request(method, f"{self.BASE_URL}{path}",
+                                                     headers=self.DEFAULT_HEADERS, **kwargs)
+            except httpx.TransportError as e:
+                upstream_latency.observe(time.perf_counter() - started, endpoint, "error")
+                breaker.record_failure()
+                delay = resilience.retry_delay(attempt, idempotent, unsent=isinstance(e, httpx.ConnectTimeout))
+                if delay is None:
+                    raise
+                logger.warning(f"{endpoint} 请求出错，{delay:.2f} 秒后重试: {e}")
+            except Exception:
+                # 解码错误等非网络异常同样算作失败，否则半开状态的探测名额不会归还（熔断器与同步客户端共享）
+                breaker.record_failure()
+                raise
+            except BaseException:
+                # 被取消（如 asyncio.wait_for 超时）：结果未知，只归还探测名额
+                breaker.release()
+                raise
+            else:
+                upstream_latency.observe(time.perf_counter() - started, endpoint, str(response.status_code))
+                if response.status_code == 429:
+                    budget.throttled(parse_retry_after(response.headers.get("Retry-After")))
+                delay = resilience.record_response(endpoint, response, attempt, idempotent)
+                if delay is None:
+                    return response
+            attempt += 1
+            resilience.count_retry(endpoint)
+            await asyncio.sleep(delay)
+
+    async def _get(self, endpoint, path, **kwargs):
+        return await self._request(endpoint, "GET", path, **kwargs)
+
+    async def create_account(self, email, password):
+        """
+        创建新账户
+
+        Args:
+            email (str): 邮箱地址
+            password (str): 密码
+
+        Returns:
+            dict: 账户信息或None（失败时）
+        """
+        try:
+            response = await self._request(
+                "accounts.create", "POST",
+                "/accounts",
+                idempotent=False,
+                json={"address": email, "password": password}
+            )
+            if response.status_code in [200, 201]:
+                logger.info(f"账户创建成功: {email}")
+                return response.json()
+            logger.error(f"账户创建失败: {response.status_code} - {response.text}")
+            return None
+        except httpx.HTTPError as e:
+            logger.error(f"创建账户请求出错: {str(e)}")
+            return None
+
+    async def get_account_by_email(self, email, raise_on_error=False):
+        """
+        通过邮箱地址查找账户
+
+        Args:
+            email (str): 邮箱地址
+            raise_on_error (bool): 请求失败时抛出SMTPDevAPIError，而不是与"未找到"一样返回None
+
+        Returns:
+            dict: 账户信息或None（未找到时）
+        """
+        try:
+            response = await self._get("accounts.list", "/accounts", params={"address": email})
+            if response.status_code != 200:
+                logger.error(f"获取账户列表失败: {response.status_code}, 响应: {response.text[:500]}")
+                if raise_on_error:
+                    raise SMTPDevAPIError(f"获取账户列表失败: {response.status_code}")
+                return None
+
+            data = response.json()
+            accounts = data.get("member", []) if isinstance(data, dict) and "member" in data else data
+            for account in accounts:
+                if account.get("address") == email:
+                    detail_response = await self._get("accounts.get", f"/accounts/{account['id']}")
+                    if detail_response.status_code == 200:
+                        return detail_response.json()
+                    logger.warning(f"获取账户详情失败，使用基础信息: {detail_response.status_code}")
+                    return account
+
+            logger.warning(f"未找到邮箱地址 {email} 对应的账户")
+            return None
+        except SMTPDevAPIError:
+            raise
+        except httpx.HTTPError as e:
+            logger.error(f"查找账户请求出错: {str(e)}")
+            if raise_on_error:
+                raise SMTPDevAPIError(f"查找账户请求出错: {str(e)}")
+            return None
+        except Exception as e:
+            logger.error(f"查找账户时发生未知错误: {str(e)}")
+            if raise_on_error:
+                raise SMTPDevAPIError(f"查找账户时发生未知错误: {str(e)}")
+            return None
+
+    async def get_mailboxes(self, account_id):
+        """
+        获取账户的邮箱列表
+
+        Args:
+            account_id (str): 账户ID
+
+        Returns:
+            list: 邮箱列表或None（失败时）
+        """
+        try:
+            response = await self._get("mailboxes.list", f"/accounts/{account_id}/mailboxes")
+            if response.status_code == 200:
+                data = response.json()
+                # JSON-LD格式的集合在member中，普通JSON格式直接是列表
+                return data.get("member", []) if isinstance(data, dict) else data
+            logger.error(f"获取邮箱列表失败: {response.status_code}")
+            return None
+        except httpx.HTTPError as e:
+            logger.error(f"获取邮箱列表请求出错: {str(e)}")
+            return None
+
+    async def get_messages(self, account_id, mailbox_id, page=1):
+        """
+        获取邮箱中的消息列表（单页，新邮件在前）
+
+        Args:
+            account_id (str): 账户ID
+            mailbox_id (str): 邮箱ID
+            page (int): 页码，从1开始
+
+        Returns:
+            list: 消息列表或None（失败时）
+        """
+        result = await self.get_messages_page(account_id, mailbox_id, page)
+        return result[0] if result is not None else None
+
+    async def get_messages_page(self, account_id, mailbox_id, page=1, raise_on_error=False):
+        """
+        获取一页消息，并判断是否还有下一页
+
+        Args:
+            raise_on_error (bool): 失败时抛出SMTPDevAPIError，而不是返回None
+
+        Returns:
+            tuple: (消息列表, 是否有下一页) 或None（失败时）
+        """
+        try:
+            response = await self._get(
+                "messages.list",
+                f"/accounts/{account_id}/mailboxes/{mailbox_id}/messages",
+                params={"page": page}
+            )
+            if response.status_code == 200:
+                return SMTPDevAPI.parse_messages_page(response.json())
+            logger.error(f"获取消息列表失败: {response.status_code}")
+            if raise_on_error:
+                raise SMTPDevAPIError(f"获取消息列表失败: {response.status_code}")
+            return None
+        except httpx.HTTPError as e:
+            logger.error(f"获取消息列表请求出错: {str(e)}")
+            if raise_on_error:
+                raise SMTPDevAPIError(f"获取消息列表请求出错: {str(e)}")
+            return None
+
+    async def get_message_detail(self, account_id, mailbox_id, message_id, raise_on_error=False):
+        """
+        获取消息详情
+
+        Args:
+            account_id (str): 账户ID
+            mailbox_id (str): 邮箱ID
+            message_id (str): 消息ID
+            raise_on_error (bool): 请求失败时抛出SMTPDevAPIError；邮件不存在（404）时仍返回None
+
+        Returns:
+            dict: 消息详情或None（失败时）
+        """
+        try:
+            response = await self._get(
+                "messages.get",
+                f"/accounts/{account_id}/mailboxes/{mailbox_id}/messages/{message_id}"
+            )
+            if response.status_code == 200:
+                return response.json()
+            logger.error(f"获取消息详情失败: {response.status_code}")
+            if raise_on_error and response.status_code != 404:
+                raise SMTPDevAPIError(f"获取消息详情失败: {response.status_code}")
+            return None
+        except httpx.HTTPError as e:
+            logger.error(f"获取消息详情请求出错: {str(e)}")
+            if raise_on_error:
+                raise SMTPDevAPIError(f"获取消息详情请求出错: {str(e)}")
+            return None
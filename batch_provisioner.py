@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from config import Config
+from username_generator import get_username_issuer
+
+
+class BatchProvisioner:
+    """批量创建邮箱账户，向上游并发扇出
+
+    - 所有批量请求共享一个有界线程池，总并发不超过 concurrency，多个批次同时到达也不会压垮上游
+    - 一个批次的用户名一次批量签发，签发器保证互不重复且未被使用过，不必靠上游报冲突再重试
+    - 单个账户创建失败时按退避间隔重试（每次重试重新签发用户名）
+    - 结果按请求顺序逐项返回，部分失败不影响其余账户
+    """
+
+    def __init__(self, factory, concurrency=None, retries=None, retry_delay=None, issuer=None):
+        self.factory = factory  # factory(username) -> 已初始化的客户端
+        self.issuer = issuer or get_username_issuer()
+        self.concurrency = concurrency or Config.BATCH_CONCURRENCY
+        self.retries = Config.BATCH_RETRIES if retries is None else retries
+        self.retry_delay = Config.BATCH_RETRY_DELAY if retry_delay is None else retry_delay
+
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-create")
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._created = 0
+        self._failed = 0
+        self._retried = 0
+
+    def provision(self, count):
+        """
+        创建count个账户
+
+        Returns:
+            list: 每项为 (客户端或None, 错误信息或None, 尝试次数)，与请求顺序一致
+        """
+        usernames = self.issuer.generate_batch(count)
+        futures = [self._executor.submit(self._create_one, username) for username in usernames]
+        results = [future.result() for future in futures]
+
+        created = sum(1 for client, _, _ in results if client is not None)
+        with self._lock:
+            self._batches += 1
+            self._created += created
+            self._failed += count - created
+        logger.info(f"批量创建完成: 成功 {created}/{count}")
+        return results
+
+    def _create_one(self, username):
+        error = None
+        for attempt in range(1, self.retries + 2):
+            try:
+                return self.factory(username), None, attempt
+            except Exception as e:
+                error = str(e)
+                if attempt <= self.retries:
+                    username = self.issuer.next_username()
+                    with self._lock:
+                        self._retried += 1
+                    time.sleep(self.retry_delay * attempt)
+        logger.warning(f"批量创建账户失败（已尝试 {self.retries + 1} 次）: {error}")
+        return None, error, self.retries + 1
+
+    def stats(self):
+        """返回批量创建统计信息"""
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "batches": self._batches,
+                "created": self._created,
+                "failed": self._failed,
+                "retried": self._retried,
+            }
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+并发模式基准测试
+分别以 threading 和 eventlet 模式启动服务，挂起N个HTTP长轮询连接，
+对比服务进程的系统线程数和常驻内存（RSS）。
+
+用法:
+    python bench_async_mode.py --connections 2000 --modes threading eventlet
+"""
+
+import argparse
+import os
+import resource
+import socket
+import subprocess
+import sys
+import time
+import requests
+from fake_smtp_dev import FakeSMTPDev
+
+ADDRESSES = 10
+
+SERVER_CODE = """
+import app
+app.socketio.run(app.app, host="127.0.0.1", port={port}, allow_unsafe_werkzeug=True,
+                 use_reloader=False, log_output=False)
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_stats(pid):
+    """读取进程的系统线程数和RSS（KB）"""
+    stats = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("Threads", "VmRSS"):
+                stats[key] = int(value.split()[0])
+    return stats["Threads"], stats["VmRSS"]
+
+
+def wait_stable(pid, seconds=3):
+    """等待线程数稳定后返回统计"""
+    last = None
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        time.sleep(seconds)
+        current = process_stats(pid)
+        if last and current[0] == last[0]:
+            return current
+        last = current
+    return last
+
+
+def run_mode(mode, connections, fake):
+    port = free_port()
+    env = dict(os.environ,
+               ASYNC_MODE=mode,
+               MAIL_TM_BASE_URL=fake.base_url,
+               MAIL_TM_API_KEY="bench_key",
+               MAIL_TM_DOMAIN="fake.test",
+               MERCURE_ENABLED="false",
+               ACCOUNT_POOL_HIGH="0")
+    server = subprocess.Popen([sys.executable, "-c", SERVER_CODE.format(port=port)], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    sockets = []
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        for _ in range(100):
+            try:
+                requests.get(f"{base_url}/api/monitor/stats", timeout=1)
+                break
+            except requests.exceptions.RequestException:
+                time.sleep(0.2)
+        else:
+            raise Exception(f"{mode} 模式服务启动失败")
+
+        idle_threads, idle_rss = wait_stable(server.pid, 1)
+
+        # 只发送请求不读取响应：每个连接都会在服务端挂起60秒等待新邮件
+        started = time.monotonic()
+        for i in range(connections):
+            sock = socket.create_connection(("127.0.0.1", port))
+            request = f"GET /api/email/bench{i % ADDRESSES}@fake.test HTTP/1.1\r\nHost: bench\r\n\r\n"
+            sock.sendall(request.encode())
+            sockets.append(sock)
+        elapsed = time.monotonic() - started
+
+        threads, rss = wait_stable(server.pid)
+        waiters = requests.get(f"{base_url}/api/monitor/stats", timeout=30).json()["waiters"]["waiters"]
+        return {
+            "mode": mode,
+            "connections": connections,
+            "parked": waiters,
+            "connect_seconds": round(elapsed, 2),
+            "threads_idle": idle_threads,
+            "threads_loaded": threads,
+            "rss_idle_mb": round(idle_rss / 1024, 1),
+            "rss_loaded_mb": round(rss / 1024, 1),
+            "kb_per_connection": round((rss - idle_rss) / max(1, connections), 1),
+        }
+    finally:
+        for sock in sockets:
+            sock.close()
+        server.kill()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比 threading 与协作式模式挂起长轮询的资源占用")
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--modes", nargs="+", default=["threading", "eventlet"])
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    fake = FakeSMTPDev(api_key="bench_key").start()
+    for i in range(ADDRESSES):
+        fake.create_account(f"bench{i}@fake.test", "password")
+    try:
+        results = [run_mode(mode, args.connections, fake) for mode in args.modes]
+    finally:
+        fake.stop()
+
+    keys = list(results[0])
+    print("\t".join(keys))
+    for result in results:
+        print("\t".join(str(result[key]) for key in keys))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""
+端到端压测套件
+在本地SMTP.dev替身（可配置延迟、故障率和新邮件到达速率）上启动服务，分场景压测：
+- create：并发 POST /api/email 创建随机邮箱
+- longpoll：大量 GET /api/email/<addr> 长轮询等待新邮件
+- websocket：大量Socket.IO订阅者等待新邮件推送
+- startup：冷启动耗时（导入app、开始接受请求）以及首个按ID取信和首个多邮箱等待请求的延迟
+
+每个场景报告吞吐、p50/p99延迟（longpoll/websocket为从邮件投递到客户端收到的端到端延迟）、
+服务进程的峰值线程数和RSS（startup报告多次冷启动的中位数），并与 bench_baselines.json 中的基线比较，出现回退时以非0状态退出；
+压测参数与基线不同时无法比较，同样以非0状态退出（参数确需修改时用 --update-baseline 重新生成基线）。
+
+用法:
+    python bench_suite.py                      # 运行全部场景并与基线比较
+    python bench_suite.py --scenarios create   # 只运行部分场景
+    python bench_suite.py --update-baseline    # 以本次结果更新基线
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import resource
+import subprocess
+import sys
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from bench_async_mode import SERVER_CODE, free_port, process_stats
+from fake_smtp_dev import FakeSMTPDev
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baselines.json")
+SCENARIOS = ("create", "longpoll", "websocket", "startup")
+API_KEY = "bench_key"
+
+# 越大越好的指标，其余指标越小越好
+HIGHER_IS_BETTER = ("throughput", "delivered_ratio")
+# 低于这些绝对差值的波动不算回退（避免很小的基线值因噪声误报）
+ABSOLUTE_SLACK = {"p50_ms": 10, "p99_ms": 50, "threads": 8, "rss_mb": 16, "errors": 2, "delivered_ratio": 0.02,
+                  "import_ms": 100, "ready_ms": 150, "first_get_ms": 50, "first_wait_ms": 100, "first_upstream": 2}
+
+IMPORT_CODE = """
+import time
+started = time.perf_counter()
+import app
+print(time.perf_counter() - started)
+"""
+
+_SENT_PATTERN = re.compile(r'data-sent="([\d.]+)"')
+
+
+def percentile(values, p):
+    """最近秩法百分位数，无样本时返回0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def sent_latency(html):
+    """从替身投递的正文中取出投递时间，返回距今的秒数"""
+    match = _SENT_PATTERN.search(html or "")
+    return time.time() - float(match.group(1)) if match else None
+
+
+class ResourceSampler:
+    """后台采样服务进程的线程数和RSS，记录峰值"""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.threads = 0
+        self.rss_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            try:
+                threads, rss = process_stats(self.pid)
+            except OSError:
+                return
+            self.threads = max(self.threads, threads)
+            self.rss_kb = max(self.rss_kb, rss)
+            if self._stop.wait(self.interval):
+                return
+
+
+def server_env(fake, mode):
+    """待测服务的环境变量，指向本地替身"""
+    return dict(os.environ,
+                ASYNC_MODE=mode,
+                MAIL_TM_BASE_URL=fake.base_url,
+                MAIL_TM_API_KEY=API_KEY,
+                MAIL_TM_DOMAIN="fake.test",
+                DEFAULT_PASSWORD="password",
+                MERCURE_ENABLED="false",
+                ACCOUNT_POOL_HIGH="0")  # 不预创建账户，create场景测量真实的上游创建路径
+
+
+class BenchServer:
+    """以子进程启动待测服务，指向本地替身"""
+
+    def __init__(self, fake, mode):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.spawned = time.perf_counter()
+        self.ready_after = None  # 从启动进程到开始接受请求的秒数
+        self.process = subprocess.Popen([sys.executable, "-c", SERVER_CODE.format(port=self.port)],
+                                        env=server_env(fake, mode),
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def __enter__(self):
+        for _ in range(600):
+            try:
+                requests.get(f"{self.base_url}/api/monitor/stats", timeout=1)
+                self.ready_after = time.perf_counter() - self.spawned
+                return self
+            except requests.exceptions.RequestException:
+                time.sleep(0.05)
+        self.close()
+        raise Exception("压测服务启动失败")
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.process.kill()
+        self.process.wait()
+
+
+def bench_create(server, fake, args):
+    """并发创建随机邮箱：吞吐为每秒成功创建数，延迟为单个请求耗时"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = iter(range(args.create_requests))
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            started = time.perf_counter()
+            try:
+                ok = session.post(f"{server.base_url}/api/email", json={}, timeout=60).status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.create_concurrency) as executor:
+        for _ in range(args.create_concurrency):
+            executor.submit(worker)
+    elapsed = time.monotonic() - started
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "errors": errors[0],
+    }
+
+
+def _create_addresses(fake, prefix, count):
+    addresses = [f"{prefix}{i}@fake.test" for i in range(count)]
+    for address in addresses:
+        fake.create_account(address, "password")
+    return addresses
+
+
+def _run_arrivals(fake, args, addresses, expected_per_message):
+    """按到达速率投递 duration 秒，再留出交付时间，返回应交付的总数"""
+    before = fake.arrivals
+    fake.start_arrivals(args.arrival_rate, addresses)
+    time.sleep(args.duration)
+    fake.stop_arrivals()
+    arrived = fake.arrivals - before
+    time.sleep(args.drain)
+    return arrived * expected_per_message
+
+
+def bench_longpoll(server, fake, args):
+    """每个邮箱挂起多个长轮询，新邮件随机到达：每封邮件只交付给一个等待者"""
+    addresses = _create_addresses(fake, "longpoll", args.addresses)
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def poller(address):
+        session = requests.Session()
+        while not stop.is_set():
+            try:
+                response = session.get(f"{server.base_url}/api/email/{address}", timeout=90)
+            except requests.exceptions.RequestException:
+                if not stop.is_set():
+                    with lock:
+                        errors[0] += 1
+                    time.sleep(0.5)
+                continue
+            if response.status_code == 200:
+                latency = sent_latency(response.json().get("content"))
+                if latency is not None and not stop.is_set():
+                    with lock:
+                        latencies.append(latency)
+            elif response.status_code != 404:
+                with lock:
+                    errors[0] += 1
+
+    for i in range(args.pollers):
+        threading.Thread(target=poller, args=(addresses[i % len(addresses)],), daemon=True).start()
+    time.sleep(args.warmup)
+
+    started = time.monotonic()
+    expected = _run_arrivals(fake, args, addresses, 1)
+    stop.set()
+    elapsed = time.monotonic() - started
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "delivered_ratio": min(1.0, len(latencies) / expected) if expected else 1.0,
+        "errors": errors[0],
+    }
+
+
+def bench_websocket(server, fake, args):
+    """每个邮箱有多个Socket.IO订阅者：每封邮件推送给该邮箱的全部订阅者"""
+    import socketio
+    try:
+        import websocket  # noqa: F401  websocket-client，未安装时Socket.IO客户端只能使用长轮询传输
+        transports = None
+    except ImportError:
+        transports = ["polling"]
+
+    addresses = _create_addresses(fake, "websocket", args.addresses)
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    clients = []
+
+    def make_client(address):
+        client = socketio.Client(reconnection=False)
+        authenticated = threading.Event()
+
+        @client.on("auth_response")
+        def on_auth(data):
+            if data.get("type") == "auth_success":
+                authenticated.set()
+
+        @client.on("email_notification")
+        def on_notification(data):
+            latency = sent_latency((data.get("data", {}).get("html") or [""])[0])
+            if latency is not None:
+                with lock:
+                    latencies.append(latency)
+
+        client.connect(server.base_url, transports=transports, wait_timeout=30)
+        client.emit("authenticate", {"email": address})
+        if not authenticated.wait(30):
+            raise Exception(f"WebSocket认证超时: {address}")
+        return client
+
+    try:
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            futures = [executor.submit(make_client, addresses[i % len(addresses)]) for i in range(args.subscribers)]
+            for future in futures:
+                try:
+                    clients.append(future.result())
+                except Exception:
+                    errors[0] += 1
+        time.sleep(args.warmup)
+
+        per_message = len(clients) / len(addresses)
+        started = time.monotonic()
+        expected = _run_arrivals(fake, args, addresses, per_message)
+        elapsed = time.monotonic() - started
+        with lock:
+            received = list(latencies)
+    finally:
+        for client in clients:
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+    return {
+        "throughput": len(received) / elapsed,
+        "p50_ms": percentile(received, 50) * 1000,
+        "p99_ms": percentile(received, 99) * 1000,
+        "delivered_ratio": min(1.0, len(received) / expected) if expected else 1.0,
+        "errors": errors[0],
+    }
+
+
+def bench_startup(fake, args):
+    """多次冷启动服务，取中位数：
+    - import_ms：单独进程中 import app 的耗时
+    - ready_ms：从启动进程到第一次响应请求
+    - first_get_ms / first_wait_ms：启动后第一个按ID取信、第一个多邮箱等待（timeout=0）请求的耗时
+    - first_upstream：这两个请求引起的上游请求数
+    """
+    addresses = _create_addresses(fake, "startup", max(1, args.wait_addresses))
+    message_id = fake.deliver(addresses[0], subject="startup")["id"]
+    env = server_env(fake, args.mode)
+    samples = {"import_ms": [], "ready_ms": [], "first_get_ms": [], "first_wait_ms": [], "first_upstream": []}
+    errors = 0
+    for _ in range(args.startup_runs):
+        output = subprocess.run([sys.executable, "-c", IMPORT_CODE], env=env, capture_output=True, text=True,
+                                check=True).stdout
+        samples["import_ms"].append(float(output.strip().splitlines()[-1]) * 1000)
+
+        with BenchServer(fake, args.mode) as server:
+            samples["ready_ms"].append(server.ready_after * 1000)
+            before = fake.request_count
+            started = time.perf_counter()
+            response = requests.get(f"{server.base_url}/api/email/{addresses[0]}/messages/{message_id}", timeout=60)
+            samples["first_get_ms"].append((time.perf_counter() - started) * 1000)
+            errors += response.status_code != 200
+
+            started = time.perf_counter()
+            response = requests.post(f"{server.base_url}/api/emails/wait",
+                                     json={"emails": addresses, "timeout": 0}, timeout=60)
+            samples["first_wait_ms"].append((time.perf_counter() - started) * 1000)
+            samples["first_upstream"].append(fake.request_count - before)
+            # timeout=0 时没有新邮件返回404；任一邮箱初始化失败都记为错误
+            errors += response.status_code not in (200, 404) or any(
+                "error" in item for item in response.json().get("results", []))
+    result = {key: percentile(values, 50) for key, values in samples.items()}
+    result["errors"] = errors
+    return result
+
+
+BENCHMARKS = {"create": bench_create, "longpoll": bench_longpoll, "websocket": bench_websocket}
+
+
+def run_scenario(name, args):
+    """每个场景使用全新的替身和服务进程，资源统计互不影响"""
+    fake = FakeSMTPDev(api_key=API_KEY, latency=args.upstream_latency, latency_jitter=args.upstream_jitter,
+                       error_rate=args.error_rate, seed=args.seed).start()
+    try:
+        if name == "startup":
+            return {key: round(value, 3) for key, value in bench_startup(fake, args).items()}
+        with BenchServer(fake, args.mode) as server, ResourceSampler(server.process.pid) as sampler:
+            result = BENCHMARKS[name](server, fake, args)
+        result["threads"] = sampler.threads
+        result["rss_mb"] = sampler.rss_kb / 1024
+        return {key: round(value, 3) for key, value in result.items()}
+    finally:
+        fake.stop()
+
+
+def compare(results, baseline, tolerance):
+    """与基线比较，返回回退描述列表"""
+    regressions = []
+    for scenario, metrics in results.items():
+        for metric, value in metrics.items():
+            expected = baseline.get(scenario, {}).get(metric)
+            if expected is None:
+                continue
+            slack = ABSOLUTE_SLACK.get(metric, 0)
+            if metric in HIGHER_IS_BETTER:
+                worse = value < expected * (1 - tolerance) and expected - value > slack
+            else:
+                worse = value > expected * (1 + tolerance) and value - expected > slack
+            if worse:
+                regressions.append(f"{scenario}.{metric}: {value} (基线 {expected})")
+    return regressions
+
+
+def param_mismatch(params, baseline_params):
+    """返回与基线不同的压测参数描述列表"""
+    return [
+        f"{key}: {params.get(key)} (基线 {baseline_params.get(key)})"
+        for key in sorted(set(params) | set(baseline_params))
+        if params.get(key) != baseline_params.get(key)
+    ]
+
+
+def scenario_params(args):
+    """影响结果可比性的参数，与基线一起保存"""
+    keys = ("create_requests", "create_concurrency", "addresses", "pollers", "subscribers", "duration",
+            "arrival_rate", "upstream_latency", "upstream_jitter", "error_rate", "startup_runs", "wait_addresses")
+    return {key: getattr(args, key) for key in keys}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端吞吐/延迟压测，与基线比较")
+    parser.add_argument("--mode", default="threading", help="服务的并发模式（ASYNC_MODE）")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--create-requests", type=int, default=300)
+    parser.add_argument("--create-concurrency", type=int, default=20)
+    parser.add_argument("--addresses", type=int, default=20, help="longpoll/websocket场景的邮箱数")
+    parser.add_argument("--pollers", type=int, default=100, help="同时挂起的长轮询数")
+    parser.add_argument("--subscribers", type=int, default=100, help="Socket.IO订阅者数")
+    parser.add_argument("--duration", type=float, default=15, help="新邮件到达的持续秒数")
+    parser.add_argument("--startup-runs", type=int, default=5, help="startup场景的冷启动次数")
+    parser.add_argument("--wait-addresses", type=int, default=10, help="startup场景首个多邮箱等待请求的邮箱数")
+    parser.add_argument("--arrival-rate", type=float, default=10, help="每秒到达的新邮件数")
+    parser.add_argument("--warmup", type=float, default=3, help="订阅建立后等待的秒数")
+    parser.add_argument("--drain", type=float, default=5, help="停止投递后等待交付完成的秒数")
+    parser.add_argument("--upstream-latency", type=float, default=0.02, help="替身每个请求的基础延迟（秒）")
+    parser.add_argument("--upstream-jitter", type=float, default=0.01, help="替身叠加的随机延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="替身请求随机失败的概率")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许相对基线变差的比例")
+    parser.add_argument("--baseline-file", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", action="store_true", help="以本次结果更新基线")
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    results = {}
+    for name in args.scenarios:
+        results[name] = run_scenario(name, args)
+        print(f"{name}\t" + "\t".join(f"{key}={value}" for key, value in results[name].items()), flush=True)
+
+    baselines = {}
+    if os.path.exists(args.baseline_file):
+        with open(args.baseline_file, encoding="utf-8") as f:
+            baselines = json.load(f)
+    entry = baselines.get(args.mode)
+
+    if args.update_baseline:
+        scenarios = dict(entry["scenarios"]) if entry and entry["params"] == scenario_params(args) else {}
+        scenarios.update(results)
+        baselines[args.mode] = {"params": scenario_params(args), "scenarios": scenarios}
+        with open(args.baseline_file, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2, ensure_ascii=False, sort_keys=True)
+            f.write("\n")
+        print(f"基线已更新: {args.baseline_file}")
+        return 0
+
+    if not entry:
+        print(f"没有 {args.mode} 模式的基线，使用 --update-baseline 生成")
+        return 0
+    mismatch = param_mismatch(scenario_params(args), entry["params"])
+    if mismatch:
+        # 参数不同的结果不可比，不能当作通过：改用基线的参数，或确认后用 --update-baseline 重新生成基线
+        print("压测参数与基线不同，无法比较:")
+        for line in mismatch:
+            print(f"  {line}")
+        return 2
+    regressions = compare(results, entry["scenarios"], args.tolerance)
+    if regressions:
+        print("性能回退:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("未发现性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from config import Config
+
+
+class _Entry:
+    """登记表中的一个客户端"""
+
+    __slots__ = ("client", "last_used", "pins")
+
+    def __init__(self, client):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.pins = 0  # 正在被监控/等待使用时不可淘汰
+
+
+class _Flight:
+    """一次进行中的客户端初始化，同一地址的并发请求共享结果"""
+
+    __slots__ = ("event", "client", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.client = None
+        self.error = None
+
+
+class ClientRegistry:
+    """带容量上限和空闲淘汰的邮箱客户端登记表
+
+    - 超过 max_entries 时按LRU淘汰，空闲超过 idle_ttl 的客户端在访问时顺带清理
+    - 被 pin() 的客户端（WebSocket监控、长轮询等待中）不会被淘汰
+    - 淘汰时保留一份紧凑的已读状态（墓碑），再次访问时通过 factory 透明重建，
+      淘汰期间到达的新邮件不会被当作旧邮件
+    - 配置了投递状态存储时，新登记和被淘汰的客户端状态同时写入存储；没有墓碑时（如重启后）从存储恢复，
+      无需再访问上游建立水位线，停机期间到达的新邮件同样不会被当作旧邮件
+    - 同一地址的并发初始化合并为一次（single-flight），不同地址互不阻塞，
+      网络请求期间不持有登记表的锁
+    - factory 可以只返回轻量句柄，由调用方按需传入 prepare 完成初始化；prefetch() 在后台线程池中并发初始化多个地址
+    """
+
+    def __init__(self, factory, max_entries=None, idle_ttl=None, max_tombstones=None, store=None):
+        self.factory = factory  # factory(email, state) -> client
+        self.store = store  # 投递状态存储（DeliveryStore），为None时不持久化
+        self.max_entries = max_entries or Config.CLIENT_REGISTRY_MAX
+        self.idle_ttl = Config.CLIENT_IDLE_TTL if idle_ttl is None else idle_ttl
+        self.max_tombstones = max_tombstones or Config.CLIENT_TOMBSTONE_MAX
+
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()  # {email: _Entry}，最近使用的在末尾
+        self._tombstones = OrderedDict()  # {email: 客户端导出的紧凑状态}
+        self._inflight = {}  # {email: _Flight}
+        self._prefetcher = None
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._rehydrations = 0
+        self._coalesced = 0  # 合并到进行中初始化的请求数
+
+    def __contains__(self, email):
+        with self._lock:
+            return email in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, email):
+        """获取已登记的客户端，不存在时返回None"""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._touch(email, entry)
+            return entry.client
+
+    def put(self, email, client, pin=False):
+        """登记客户端（pin为True时同时固定）"""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None:
+                entry.client = client
+                self._touch(email, entry)
+            else:
+                entry = self._entries[email] = _Entry(client)
+                self._persist(email, client)
+            if pin:
+                entry.pins += 1
+            self._tombstones.pop(email, None)
+            # 其余条目都被固定时也不淘汰刚登记的客户端，超额部分在之后解除固定时淘汰
+            self._evict(keep=email)
+
+    def get_or_create(self, email, factory=None, prepare=None, pin=False):
+        """获取客户端，不存在时通过factory创建（被淘汰过的按墓碑状态重建）
+
+        同一地址同时只有一个线程执行factory，其余线程等待并共享其结果或异常。
+        prepare(client) 用于完成句柄的初始化（可重复调用）；失败时移除该句柄并抛出异常。
+        pin为True时在取得客户端的同一次加锁中固定它，与淘汰之间没有间隙，调用方负责 unpin()。
+        """
+        client = self._get_or_create(email, factory, pin)
+        if prepare is None:
+            return client
+        try:
+            prepare(client)
+        except Exception:
+            if pin:
+                self.unpin(email)
+            self.discard(email, client)
+            raise
+        with self._lock:
+            if email in self._entries:
+                self._persist(email, client)
+        return client
+
+    def prefetch(self, emails, prepare, pin=False):
+        """
+        在后台线程池中并发获取并初始化多个地址的客户端（pin的含义同 get_or_create）
+
+        Returns:
+            dict: {email: Future}，结果为客户端，初始化失败时为异常
+        """
+        if self._prefetcher is None:
+            with self._lock:
+                if self._prefetcher is None:
+                    self._prefetcher = ThreadPoolExecutor(max_workers=Config.CLIENT_PREFETCH_WORKERS,
+                                                          thread_name_prefix="client-prefetch")
+        return {email: self._prefetcher.submit(self.get_or_create, email, None, prepare, pin) for email in emails}
+
+    def discard(self, email, client):
+        """移除初始化失败的客户端（已被替换或正在使用时保留）"""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and entry.client is client and not entry.pins:
+                del self._entries[email]
+
+    def _get_or_create(self, email, factory, pin):
+        while True:
+            with self._lock:
+                entry = self._entries.get(email)
+                if entry is not None:
+                    self._hits += 1
+                    if pin:
+                        entry.pins += 1
+                    self._touch(email, entry)
+                    return entry.client
+                self._misses += 1
+
+                flight = self._inflight.get(email)
+                leader = flight is None
+                if leader:
+                    flight = _Flight()
+                    self._inflight[email] = flight
+                    state = self._tombstones.get(email)
+                else:
+                    self._coalesced += 1
+
+            if leader:
+                break
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            if not pin:
+                return flight.client
+            # 需要固定时重新查找，在加锁状态下固定（期间被淘汰则按墓碑重建）
+
+        try:
+            if state is None and self.store is not None:
+                state = self.store.load(email)
+            flight.client = (factory or self.factory)(email, state)
+            if state is not None:
+                with self._lock:
+                    self._rehydrations += 1
+                logger.info(f"重建已淘汰的邮箱客户端: {email}")
+            self.put(email, flight.client, pin)
+            return flight.client
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(email, None)
+            flight.event.set()
+
+    def pin(self, email):
+        """标记客户端正在使用，不可淘汰"""
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None:
+                entry.pins += 1
+                self._touch(email, entry)
+
+    def unpin(self, email):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and entry.pins > 0:
+                entry.pins -= 1
+                self._touch(email, entry)
+            self._evict()
+
+    def stats(self):
+        """返回登记表统计信息"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "pinned": sum(1 for entry in self._entries.values() if entry.pins),
+                "tombstones": len(self._tombstones),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "rehydrations": self._rehydrations,
+                "initializing": len(self._inflight),
+                "coalesced": self._coalesced,
+            }
+
+    def _touch(self, email, entry):
+        entry.last_used = time.monotonic()
+        self._entries.move_to_end(email)
+
+    def _evict(self, keep=None):
+        """淘汰超出容量或空闲过期的未固定客户端，keep除外（调用方需持有锁）"""
+        deadline = time.monotonic() - self.idle_ttl
+        excess = len(self._entries) - self.max_entries
+        victims = []
+        for email, entry in self._entries.items():
+            if excess <= 0 and entry.last_used >= deadline:
+                break  # 其余条目更新，既不超额也未过期
+            if entry.pins or email == keep:
+                continue
+            victims.append(email)
+            excess -= 1
+
+        for email in victims:
+            entry = self._entries.pop(email)
+            self._evictions += 1
+            self._store_tombstone(email, entry.client)
+
+    def _persist(self, email, client):
+        """把客户端当前状态写入投递状态存储（后台批量提交）；尚未初始化的句柄没有状态"""
+        if self.store is None or not hasattr(client, "export_state"):
+            return
+        state = client.export_state()
+        if state is not None:
+            self.store.save(email, state)
+
+    def _store_tombstone(self, email, client):
+        export = getattr(client, "export_state", None)
+        state = export() if export is not None else None
+        if state is None:
+            return
+        if self.store is not None:
+            self.store.save(email, state)
+        self._tombstones[email] = state
+        self._tombstones.move_to_end(email)
+        while len(self._tombstones) > self.max_tombstones:
+            self._tombstones.popitem(last=False)
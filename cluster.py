@@ -0,0 +1,440 @@
+"""
+多worker集群协调
+
+单进程时所有状态都在 app.py 的模块级变量里；多个worker（进程/节点）同时提供服务时，
+需要跨worker共享的只有以下几类状态，由共享状态存储（Redis）承载：
+
+- 轮询租约：每个邮箱同一时间只由持有租约的一个worker访问上游，租约过期后由其他关注该邮箱的worker接管
+- 游标状态：租约持有者每次轮询后保存客户端的水位线和待取邮件，接管者从这里继续，不重复也不遗漏
+- 新邮件分发：本地没有等待者时放入共享暂存并通知其他worker，由有等待者的worker原子取走（只交付一次）；
+  通知本身不携带邮件，多个worker同时有等待者时也只有一个能取到
+- WebSocket订阅：记录哪些邮箱在某个worker上有WebSocket监控；推送本身经Socket.IO消息队列广播到所有worker
+
+WebSocket连接映射（sid）和客户端登记表仍是每个worker各自的本地状态。
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from loguru import logger
+from config import Config
+
+
+class MemoryStateStore:
+    """进程内的共享状态存储替身（单进程运行或测试时使用，语义与RedisStateStore一致）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._leases = {}  # {key: (owner, 过期时间)}
+        self._values = {}  # {key: json}
+        self._lists = {}  # {key: [json]}
+        self._members = {}  # {key: {member: 过期时间}}
+        self._subscribers = []
+
+    def acquire_lease(self, key, owner, ttl):
+        """获取或续期租约，被其他owner持有时返回False"""
+        now = time.monotonic()
+        with self._lock:
+            current = self._leases.get(key)
+            if current and current[0] != owner and current[1] > now:
+                return False
+            self._leases[key] = (owner, now + ttl)
+            return True
+
+    def release_lease(self, key, owner):
+        with self._lock:
+            current = self._leases.get(key)
+            if current and current[0] == owner:
+                del self._leases[key]
+
+    def get(self, key):
+        with self._lock:
+            value = self._values.get(key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = json.dumps(value)
+
+    def push(self, key, value, maxlen):
+        with self._lock:
+            items = self._lists.setdefault(key, [])
+            items.append(json.dumps(value))
+            del items[:-maxlen]
+
+    def push_front(self, key, value):
+        with self._lock:
+            self._lists.setdefault(key, []).insert(0, json.dumps(value))
+
+    def pop(self, key):
+        with self._lock:
+            items = self._lists.get(key)
+            if not items:
+                return None
+            value = items.pop(0)
+            if not items:
+                del self._lists[key]
+        return json.loads(value)
+
+    def touch_member(self, key, member, ttl):
+        with self._lock:
+            self._members.setdefault(key, {})[member] = time.monotonic() + ttl
+
+    def remove_member(self, key, member):
+        with self._lock:
+            members = self._members.get(key)
+            if members:
+                members.pop(member, None)
+                if not members:
+                    del self._members[key]
+
+    def count_members(self, key):
+        now = time.monotonic()
+        with self._lock:
+            members = self._members.get(key, {})
+            return sum(1 for expires in members.values() if expires > now)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(event)
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+
+
+class RedisStateStore:
+    """基于Redis的共享状态存储（需要安装redis包）"""
+
+    # 获取或续期租约：不存在或已属于自己时设置过期时间
+    _ACQUIRE = """
+local owner = redis.call('get', KEYS[1])
+if owner == false or owner == ARGV[1] then
+    redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+    # 只释放自己持有的租约
+    _RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+    def __init__(self, url, channel=None, ttl=None):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.channel = channel or Config.CLUSTER_KEY_PREFIX + "events"
+        self.ttl = int(ttl or Config.CLUSTER_STATE_TTL)  # 游标状态和共享暂存的保留秒数
+        self._acquire = self._redis.register_script(self._ACQUIRE)
+        self._release = self._redis.register_script(self._RELEASE)
+        self._pubsub = None
+
+    def acquire_lease(self, key, owner, ttl):
+        return bool(self._acquire(keys=[key], args=[owner, int(ttl * 1000)]))
+
+    def release_lease(self, key, owner):
+        self._release(keys=[key], args=[owner])
+
+    def get(self, key):
+        value = self._redis.get(key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value):
+        self._redis.set(key, json.dumps(value), ex=self.ttl)
+
+    def push(self, key, value, maxlen):
+        pipe = self._redis.pipeline()
+        pipe.rpush(key, json.dumps(value))
+        pipe.ltrim(key, -maxlen, -1)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def push_front(self, key, value):
+        self._redis.lpush(key, json.dumps(value))
+
+    def pop(self, key):
+        value = self._redis.lpop(key)
+        return None if value is None else json.loads(value)
+
+    def touch_member(self, key, member, ttl):
+        # 有序集合的分数为成员过期时间，worker崩溃后其成员自然过期
+        pipe = self._redis.pipeline()
+        pipe.zadd(key, {member: time.time() + ttl})
+        pipe.expire(key, int(ttl) + 1)
+        pipe.execute()
+
+    def remove_member(self, key, member):
+        self._redis.zrem(key, member)
+
+    def count_members(self, key):
+        return self._redis.zcount(key, time.time(), "+inf")
+
+    def publish(self, event):
+        self._redis.publish(self.channel, json.dumps(event))
+
+    def subscribe(self, callback):
+        def handler(message):
+            try:
+                callback(json.loads(message["data"]))
+            except Exception as e:
+                logger.error(f"处理集群事件失败: {e}")
+
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: handler})
+        self._pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+
+def create_state_store(url):
+    """按URL创建共享状态存储：redis://、rediss:// 或 memory://（进程内替身），为空时返回None"""
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemoryStateStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateStore(url)
+    raise Exception(f"不支持的共享状态存储: {url}")
+
+
+class ClusterCoordinator:
+    """本worker在集群中的协调者：轮询租约、游标交接和跨worker的新邮件分发
+
+    store 为None时（未配置共享状态存储）enabled为False，服务按单进程方式运行。
+    """
+
+    OFFER_TTL = 2  # 有WebSocket订阅者的邮件只提供给通知到达时正在等待的请求，超过该秒数未被取走即丢弃
+
+    def __init__(self, waiters, store=None, lease_ttl=None, worker_id=None):
+        self.waiters = waiters
+        self.store = store
+        self.lease_ttl = lease_ttl or Config.CLUSTER_LEASE_TTL
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._lock = threading.Lock()
+        self._leases = {}  # {email: 最近保存到共享存储的客户端状态}
+        self._monitors = {}  # {email: 引用计数} 本worker上有WebSocket监控的邮箱
+        self._renewer = None
+        self._acquired = 0
+        self._lost = 0
+        self._handoffs = 0
+        self._published = 0
+        self._remote_delivered = 0
+
+        if self.enabled:
+            store.subscribe(self._on_event)
+
+    @property
+    def enabled(self):
+        return self.store is not None
+
+    def start(self):
+        """启动租约续期线程（只启动一次）"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._renewer is not None:
+                return
+            self._renewer = threading.Thread(target=self._renew_loop, name="cluster-renew", daemon=True)
+        self._renewer.start()
+
+    def acquire(self, email, client):
+        """
+        确保本worker持有邮箱的轮询租约
+
+        新取得租约时从共享存储恢复上一个持有者保存的游标，接着它的进度继续轮询。
+
+        Returns:
+            bool: 是否持有租约（False时本worker不应访问上游）
+        """
+        with self._lock:
+            if email in self._leases:
+                return True
+        if not self.store.acquire_lease(self._key("lease", email), self.worker_id, self.lease_ttl):
+            return False
+
+        key = self._key("state", email)
+        state = self.store.get(key)
+        if state:
+            client.restore_state(state)
+            with self._lock:
+                self._handoffs += 1
+            logger.info(f"接管邮箱轮询: {email}")
+        else:
+            # 首个持有者的水位线作为整个集群的基线
+            client.hydrate()
+            self.store.set(key, client.export_state())
+        self.start()
+        with self._lock:
+            self._leases[email] = client.export_state()
+            self._acquired += 1
+        return True
+
+    def confirm(self, email):
+        """
+        分发前确认仍持有租约（同时续期）
+
+        轮询进行中租约可能过期并被其他worker接管，接管者从上次保存的游标继续，会再取到同一封邮件；
+        这时本worker放弃这次轮询的结果，不分发也不保存游标，避免重复交付。
+
+        Returns:
+            bool: 是否仍持有租约
+        """
+        with self._lock:
+            if email not in self._leases:
+                return False
+        if self.store.acquire_lease(self._key("lease", email), self.worker_id, self.lease_ttl):
+            return True
+        with self._lock:
+            if self._leases.pop(email, None) is not None:
+                self._lost += 1
+        logger.warning(f"轮询期间租约已被其他worker接管，放弃本次结果: {email}")
+        return False
+
+    def save(self, email, client):
+        """轮询后保存游标状态（与上次保存的相同时跳过）"""
+        state = client.export_state()
+        with self._lock:
+            if email not in self._leases or self._leases[email] == state:
+                return
+            self._leases[email] = state
+        self.store.set(self._key("state", email), state)
+
+    def release(self, email):
+        """本worker不再关注该邮箱时释放租约，由其他worker接管"""
+        with self._lock:
+            if self._leases.pop(email, None) is None:
+                return
+        self.store.release_lease(self._key("lease", email), self.worker_id)
+
+    def dispatch(self, email, message, monitored):
+        """
+        把租约持有者取到的新邮件交给集群内的长轮询等待者
+
+        优先交给本地等待者；否则放入共享暂存并通知其他worker，由有等待者的worker原子取走（只交付一次）。
+        邮箱已有WebSocket订阅者时（monitored）与单进程一致：只交给此刻在等待的请求——
+        邮件放入单独的短期队列，只在收到通知时领取，之后才开始等待的请求不会取到。
+        """
+        if self.waiters.deliver(email, message, stash=False):
+            return
+        if monitored:
+            offer = {"message": message, "expires": time.time() + self.OFFER_TTL}
+            self.store.push(self._key("offer", email), offer, self.waiters.stash_size)
+        else:
+            self.store.push(self._key("stash", email), message, self.waiters.stash_size)
+        self.store.publish({"worker": self.worker_id, "email": email, "offer": monitored})
+        self._published += 1
+
+    def drain(self, email):
+        """本地有等待者时从共享暂存取走邮件交付（登记等待者后和收到通知时调用）"""
+        if not self.enabled:
+            return
+        key = self._key("stash", email)
+        while self.waiters.has_waiters(email):
+            message = self.store.pop(key)
+            if message is None:
+                return
+            if not self.waiters.deliver(email, message, stash=False):
+                # 等待者恰好超时离开，放回队首留给下一个请求
+                self.store.push_front(key, message)
+                return
+            self._remote_delivered += 1
+
+    def _claim_offers(self, email):
+        """收到通知时把有WebSocket订阅者的邮件交给本地此刻的等待者，过期的直接丢弃"""
+        key = self._key("offer", email)
+        while self.waiters.has_waiters(email):
+            offer = self.store.pop(key)
+            if offer is None:
+                return
+            if offer["expires"] < time.time():
+                continue
+            if not self.waiters.deliver(email, offer["message"], stash=False):
+                self.store.push_front(key, offer)
+                return
+            self._remote_delivered += 1
+
+    def add_monitor(self, email):
+        """登记本worker上的WebSocket监控
+
+        监控的启停在调用方释放全局锁之后进行，同一邮箱的启动和停止可能交错，因此按引用计数登记；
+        交错导致共享存储中多出的登记在租约时长内过期，缺少的登记由续期线程补上
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._monitors[email] = self._monitors.get(email, 0) + 1
+        self.store.touch_member(self._key("monitors", email), self.worker_id, self.lease_ttl)
+        self.start()
+
+    def remove_monitor(self, email):
+        if not self.enabled:
+            return
+        with self._lock:
+            count = self._monitors.get(email, 0) - 1
+            if count > 0:
+                self._monitors[email] = count
+                return
+            self._monitors.pop(email, None)
+        self.store.remove_member(self._key("monitors", email), self.worker_id)
+
+    def is_monitored(self, email):
+        """集群内是否有worker在WebSocket监控该邮箱"""
+        return self.store.count_members(self._key("monitors", email)) > 0
+
+    def stats(self):
+        """返回集群协调统计信息"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "worker_id": self.worker_id,
+                "leases": len(self._leases),
+                "monitors": len(self._monitors),
+                "acquired": self._acquired,
+                "lost": self._lost,
+                "handoffs": self._handoffs,
+                "published": self._published,
+                "remote_delivered": self._remote_delivered,
+            }
+
+    def _on_event(self, event):
+        """处理其他worker发布的新邮件通知：通知不携带邮件，从共享存储原子取走，保证只交付一次"""
+        if event.get("worker") == self.worker_id:
+            return
+        if event.get("offer"):
+            self._claim_offers(event["email"])
+        else:
+            self.drain(event["email"])
+
+    def _renew_loop(self):
+        """每1/3租约时长续期一次；续期失败说明租约已被接管，停止本地轮询"""
+        while True:
+            time.sleep(self.lease_ttl / 3)
+            with self._lock:
+                emails = list(self._leases)
+                monitors = list(self._monitors)
+            for email in emails:
+                try:
+                    if self.store.acquire_lease(self._key("lease", email), self.worker_id, self.lease_ttl):
+                        continue
+                    with self._lock:
+                        self._leases.pop(email, None)
+                        self._lost += 1
+                    logger.warning(f"邮箱轮询租约已被其他worker接管: {email}")
+                except Exception as e:
+                    logger.error(f"续期轮询租约失败: {e}")
+            for email in monitors:
+                try:
+                    self.store.touch_member(self._key("monitors", email), self.worker_id, self.lease_ttl)
+                except Exception as e:
+                    logger.error(f"续期WebSocket监控登记失败: {e}")
+
+    @staticmethod
+    def _key(kind, email):
+        return f"{Config.CLUSTER_KEY_PREFIX}{kind}:{email}"
@@ -0,0 +1,72 @@
+"""
+并发模式选择
+
+Config.ASYNC_MODE 为 eventlet 或 gevent 时，服务以协作式（绿色线程）模式运行：
+WebSocket连接、HTTP长轮询、共享轮询工作线程和上游HTTP请求都是绿色线程，
+一个进程可以挂起上万个连接而不需要上万个系统线程。
+
+必须在导入其他模块（config/dotenv、requests、loguru、flask等）之前调用 setup_async_mode()，
+这样猴子补丁才能覆盖它们创建的socket、锁和线程；本模块自身只依赖标准库的os。打补丁后：
+- threading.Lock/RLock/Condition/Event 以及 queue 都变为协作式实现，现有代码中的锁无需修改；
+  持有锁期间不做网络I/O的约定依然成立，因此不会出现持锁切换导致的饥饿
+- time.sleep、Event.wait 只让出当前绿色线程，不阻塞整个进程
+- ThreadPoolExecutor（轮询调度器、批量创建）的工作线程变为绿色线程
+"""
+
+import os
+
+_mode = None
+
+
+def _configured_mode():
+    """
+    读取 ASYNC_MODE：环境变量优先，其次是项目目录下的 .env（与 config.py 的 load_dotenv 一致，不覆盖已有环境变量）
+
+    这里还不能导入 config：python-dotenv 会导入 logging 等模块并创建锁，必须等打完补丁再导入。
+    """
+    mode = os.environ.get("ASYNC_MODE")
+    if mode is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    key, sep, value = line.strip().partition("=")
+                    if sep and key.replace("export ", "", 1).strip() == "ASYNC_MODE":
+                        mode = value.split("#", 1)[0].strip().strip("'\"")
+        except OSError:
+            pass
+    return (mode or "threading").lower()
+
+
+def setup_async_mode():
+    """按配置打猴子补丁，返回Flask-SocketIO使用的async_mode（只生效一次）"""
+    global _mode
+    if _mode is not None:
+        return _mode
+
+    mode = _configured_mode()
+    if mode == "eventlet":
+        # eventlet 0.33 的绿色DNS与新版dnspython不兼容，改用系统解析器；
+        # 上游只有一个主机且连接池保持长连接，解析次数极少
+        os.environ.setdefault("EVENTLET_NO_GREENDNS", "yes")
+        try:
+            import eventlet
+        except ImportError:
+            raise Exception("ASYNC_MODE=eventlet 需要先安装 eventlet（pip install eventlet）")
+        eventlet.monkey_patch()
+    elif mode == "gevent":
+        try:
+            from gevent import monkey
+        except ImportError:
+            raise Exception("ASYNC_MODE=gevent 需要先安装 gevent（pip install gevent，requirements.txt 中为可选依赖）")
+        monkey.patch_all()
+    elif mode != "threading":
+        raise Exception(f"不支持的并发模式: {mode}（可选 threading、eventlet、gevent）")
+
+    _mode = mode
+    return _mode
+
+
+def is_cooperative():
+    """当前是否运行在协作式（绿色线程）模式"""
+    return _mode in ("eventlet", "gevent")
@@ -11,4 +11,112 @@ class Config:
     MAIL_TM_DOMAIN = os.getenv('MAIL_TM_DOMAIN')
     
     # 默认密码
-    DEFAULT_PASSWORD = os.getenv('DEFAULT_PASSWORD')
\ No newline at end of file
+    DEFAULT_PASSWORD = os.getenv('DEFAULT_PASSWORD')
+    
+    # 并发模式：threading（系统线程）、eventlet 或 gevent（协作式绿色线程，适合上万个长连接）
+    ASYNC_MODE = os.getenv('ASYNC_MODE', 'threading').lower()
+    
+    # 轮询调度配置
+    POLL_INTERVAL = float(os.getenv('POLL_INTERVAL', '2'))  # 有请求在等待时的最长轮询间隔（秒）
+    POLL_MIN_INTERVAL = float(os.getenv('POLL_MIN_INTERVAL', '1'))  # 刚订阅或刚收到邮件时的轮询间隔（秒）
+    POLL_MAX_INTERVAL = float(os.getenv('POLL_MAX_INTERVAL', '30'))  # 空闲邮箱退避到的最长间隔（秒）
+    POLL_BACKOFF_FACTOR = float(os.getenv('POLL_BACKOFF_FACTOR', '1.5'))  # 每次空轮询后间隔的增长倍数
+    POLL_ERROR_INTERVAL = float(os.getenv('POLL_ERROR_INTERVAL', '5'))  # 出错后的重试间隔（秒），连续出错时加倍
+    POLL_WORKERS = int(os.getenv('POLL_WORKERS', '8'))  # 轮询工作线程数
+    
+    # Mercure实时推送配置
+    MERCURE_ENABLED = os.getenv('MERCURE_ENABLED', 'true').lower() == 'true'
+    MERCURE_URL = os.getenv('MERCURE_URL', 'https://mercure.smtp.dev/.well-known/mercure')
+    MERCURE_TOPICS_PER_STREAM = int(os.getenv('MERCURE_TOPICS_PER_STREAM', '50'))  # 每条SSE连接订阅的账户数
+    MERCURE_CONNECT_TIMEOUT = float(os.getenv('MERCURE_CONNECT_TIMEOUT', '10'))
+    MERCURE_READ_TIMEOUT = float(os.getenv('MERCURE_READ_TIMEOUT', '90'))  # 超过该时间无数据（含心跳）则重连
+    MERCURE_RECONNECT_DELAY = float(os.getenv('MERCURE_RECONNECT_DELAY', '3'))
+    MERCURE_FALLBACK_INTERVAL = float(os.getenv('MERCURE_FALLBACK_INTERVAL', '30'))  # 推送可用时的兜底轮询间隔
+    
+    # 上游HTTP连接池配置（进程内所有SMTPDevAPI实例共享）
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '4'))  # 缓存的主机连接池数量
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '32'))  # 每个主机的最大连接数
+    HTTP_POOL_BLOCK = os.getenv('HTTP_POOL_BLOCK', 'true').lower() == 'true'  # 连接池满时排队等待而不是新建临时连接
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+    HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '10'))
+    HTTP2_ENABLED = os.getenv('HTTP2_ENABLED', 'false').lower() == 'true'  # 异步客户端启用HTTP/2（需要安装h2）
+    
+    # 邮箱地址解析缓存配置
+    RESOLUTION_CACHE_TTL = float(os.getenv('RESOLUTION_CACHE_TTL', '86400'))  # 正向结果有效期（秒）
+    RESOLUTION_NEGATIVE_TTL = float(os.getenv('RESOLUTION_NEGATIVE_TTL', '30'))  # 不存在地址的缓存有效期（秒）
+    RESOLUTION_CACHE_SIZE = int(os.getenv('RESOLUTION_CACHE_SIZE', '100000'))
+    RESOLUTION_SNAPSHOT_PATH = os.getenv('RESOLUTION_SNAPSHOT_PATH', '')  # 为空时不持久化
+    RESOLUTION_SNAPSHOT_INTERVAL = float(os.getenv('RESOLUTION_SNAPSHOT_INTERVAL', '30'))
+    
+    # 邮箱客户端登记表配置
+    CLIENT_REGISTRY_MAX = int(os.getenv('CLIENT_REGISTRY_MAX', '10000'))  # 内存中保留的客户端上限
+    CLIENT_IDLE_TTL = float(os.getenv('CLIENT_IDLE_TTL', '1800'))  # 空闲超过该秒数的客户端会被淘汰
+    CLIENT_TOMBSTONE_MAX = int(os.getenv('CLIENT_TOMBSTONE_MAX', '100000'))  # 保留的淘汰状态条数
+    CLIENT_PREFETCH_WORKERS = int(os.getenv('CLIENT_PREFETCH_WORKERS', '8'))  # 并发初始化客户端的后台线程数
+    
+    # 增量邮件列表配置
+    MESSAGE_SCAN_MAX_PAGES = int(os.getenv('MESSAGE_SCAN_MAX_PAGES', '10'))  # 单次轮询最多向前翻的页数
+    MESSAGE_RECENT_IDS = int(os.getenv('MESSAGE_RECENT_IDS', '64'))  # 水位线去重用的最近邮件ID窗口
+    
+    # 邮件详情缓存配置
+    MESSAGE_CACHE_MAX_BYTES = int(os.getenv('MESSAGE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))  # 缓存字节预算
+    MESSAGE_CACHE_COMPRESS = os.getenv('MESSAGE_CACHE_COMPRESS', 'false').lower() == 'true'  # 是否压缩缓存的邮件
+    MESSAGE_CACHE_COMPRESS_MIN_BYTES = int(os.getenv('MESSAGE_CACHE_COMPRESS_MIN_BYTES', '2048'))  # 小于该大小不压缩
+    
+    # 批量创建账户配置
+    BATCH_MAX_COUNT = int(os.getenv('BATCH_MAX_COUNT', '500'))  # 单次批量创建的最大数量
+    BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', '16'))  # 向上游并发创建的最大线程数（所有批次共享）
+    BATCH_RETRIES = int(os.getenv('BATCH_RETRIES', '2'))  # 单个账户创建失败后的重试次数
+    BATCH_RETRY_DELAY = float(os.getenv('BATCH_RETRY_DELAY', '0.5'))  # 重试退避基数（秒）
+    
+    # 随机用户名签发配置
+    USERNAME_FILTER_CAPACITY = int(os.getenv('USERNAME_FILTER_CAPACITY', '1000000'))  # 布隆过滤器预期容纳的用户名数
+    USERNAME_FILTER_ERROR_RATE = float(os.getenv('USERNAME_FILTER_ERROR_RATE', '0.001'))  # 过滤器误判率
+    USERNAME_SEED = os.getenv('USERNAME_SEED', '')  # 随机种子，仅用于复现测试；多worker时不要设置
+    
+    # 预创建账户池配置（ACCOUNT_POOL_HIGH为0时关闭）
+    ACCOUNT_POOL_LOW = int(os.getenv('ACCOUNT_POOL_LOW', '5'))  # 库存低于该数量时开始补充
+    ACCOUNT_POOL_HIGH = int(os.getenv('ACCOUNT_POOL_HIGH', '20'))  # 补充到该数量为止
+    ACCOUNT_POOL_REFILL_RATE = float(os.getenv('ACCOUNT_POOL_REFILL_RATE', '2'))  # 每秒最多创建的账户数
+    
+    # 多邮箱等待配置
+    WAIT_MAX_ADDRESSES = int(os.getenv('WAIT_MAX_ADDRESSES', '200'))  # POST /api/emails/wait 单次最多等待的邮箱数
+    WAIT_STASH_TTL = float(os.getenv('WAIT_STASH_TTL', '600'))  # 无人等待时暂存的新邮件保留秒数
+    WAIT_STASH_MAX_ADDRESSES = int(os.getenv('WAIT_STASH_MAX_ADDRESSES', '10000'))  # 最多为多少个邮箱暂存新邮件
+    
+    # 运行指标配置（GET /metrics）
+    METRICS_ADDRESS_LIMIT = int(os.getenv('METRICS_ADDRESS_LIMIT', '100'))  # 按邮箱导出WebSocket连接数的最大邮箱数，限制标签基数
+    
+    # 原文/附件流式下载配置
+    DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', '65536'))  # 每次转发的字节数
+    DOWNLOAD_SPOOL_DIR = os.getenv('DOWNLOAD_SPOOL_DIR', '')  # 磁盘缓存目录，为空时不缓存
+    DOWNLOAD_SPOOL_MAX_BYTES = int(os.getenv('DOWNLOAD_SPOOL_MAX_BYTES', str(1024 * 1024 * 1024)))  # 磁盘缓存容量
+    
+    # 投递状态持久化配置（DELIVERY_STORE_PATH为空时关闭）
+    DELIVERY_STORE_PATH = os.getenv('DELIVERY_STORE_PATH', '')  # SQLite数据库文件，保存各邮箱的水位线和待取邮件
+    DELIVERY_FLUSH_INTERVAL = float(os.getenv('DELIVERY_FLUSH_INTERVAL', '1'))  # 后台批量写入间隔（秒）
+    DELIVERY_COMMIT_TIMEOUT = float(os.getenv('DELIVERY_COMMIT_TIMEOUT', '5'))  # 交付前等待状态提交的最长秒数
+    DELIVERY_STATE_TTL = float(os.getenv('DELIVERY_STATE_TTL', str(7 * 24 * 3600)))  # 超过该秒数未更新的邮箱状态会被清理
+    
+    # 多worker集群配置（CLUSTER_STATE_URL为空时单进程运行）
+    CLUSTER_STATE_URL = os.getenv('CLUSTER_STATE_URL', '')  # 共享状态存储：redis://... 或 memory://（进程内替身）
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')  # Socket.IO跨worker消息队列，为空时使用共享状态存储的Redis
+    CLUSTER_LEASE_TTL = float(os.getenv('CLUSTER_LEASE_TTL', '15'))  # 邮箱轮询租约时长（秒），持有者失联后最多这么久被接管
+    CLUSTER_STATE_TTL = int(os.getenv('CLUSTER_STATE_TTL', '86400'))  # 共享存储中游标状态和暂存邮件的保留秒数
+    CLUSTER_KEY_PREFIX = os.getenv('CLUSTER_KEY_PREFIX', 'emailapi:')  # 共享存储的键前缀
+    SERVER_PORT = int(os.getenv('SERVER_PORT', '5000'))  # 服务监听端口（同一主机运行多个worker时分别设置）
+    
+    # 上游请求预算（令牌桶，UPSTREAM_QPS为0时不限速，但收到429时仍会暂停）
+    UPSTREAM_QPS = float(os.getenv('UPSTREAM_QPS', '0'))  # 所有上游请求的总QPS上限（按API Key配额设置）
+    UPSTREAM_BURST = int(os.getenv('UPSTREAM_BURST', '0'))  # 允许的突发请求数，0时等于QPS
+    UPSTREAM_MIN_QPS = float(os.getenv('UPSTREAM_MIN_QPS', '1'))  # 连续429后速率降低的下限
+    UPSTREAM_THROTTLE_PAUSE = float(os.getenv('UPSTREAM_THROTTLE_PAUSE', '1'))  # 429未带Retry-After时的暂停秒数
+    
+    # 上游重试与熔断配置
+    UPSTREAM_RETRIES = int(os.getenv('UPSTREAM_RETRIES', '2'))  # 失败后的最大重试次数（创建账户等非幂等请求只在连接超时时重试）
+    UPSTREAM_RETRY_BASE = float(os.getenv('UPSTREAM_RETRY_BASE', '0.2'))  # 指数退避的初始间隔（秒），实际间隔带随机抖动
+    UPSTREAM_RETRY_MAX_DELAY = float(os.getenv('UPSTREAM_RETRY_MAX_DELAY', '2'))  # 单次退避间隔上限（秒）
+    UPSTREAM_RETRY_AFTER_MAX = float(os.getenv('UPSTREAM_RETRY_AFTER_MAX', '10'))  # 429的Retry-After超过此秒数时不再重试
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))  # 端点连续失败多少次后熔断
+    BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '10'))  # 熔断多少秒后放行一个探测请求
+    BREAKER_PROBE_TIMEOUT = float(os.getenv('BREAKER_PROBE_TIMEOUT', '30'))  # 探测请求超过多少秒未结束时视为丢失，放行新的探测
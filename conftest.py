@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+测试公共设置：启动本地SMTP.dev替身（fake_smtp_dev.py），并让API客户端和配置指向它
+
+测试脚本既可由pytest收集，也可直接 python test_xxx.py 运行，因此这里提供普通函数而不是fixture：
+
+    fake = start_fake()
+    try:
+        ...
+    finally:
+        fake.stop()  # 停止替身并恢复原来的设置
+"""
+
+from config import Config
+from fake_smtp_dev import FakeSMTPDev
+from smtp_api import SMTPDevAPI
+from async_smtp_api import AsyncSMTPDevAPI
+
+
+# 替身启动时改写的类属性，停止时恢复，避免影响之后运行的测试
+_PATCHED = [
+    (SMTPDevAPI, "BASE_URL"),
+    (SMTPDevAPI, "DEFAULT_HEADERS"),
+    (AsyncSMTPDevAPI, "BASE_URL"),
+    (AsyncSMTPDevAPI, "DEFAULT_HEADERS"),
+    (Config, "MAIL_TM_DOMAIN"),
+    (Config, "DEFAULT_PASSWORD"),
+]
+
+
+class FakeUpstream(FakeSMTPDev):
+    """启动时让同步和异步API客户端及配置指向替身，停止时恢复原来的设置"""
+
+    def start(self):
+        self._saved = [(owner, name, getattr(owner, name)) for owner, name in _PATCHED]
+        super().start()
+        for api_class in (SMTPDevAPI, AsyncSMTPDevAPI):
+            api_class.BASE_URL = self.base_url
+            api_class.DEFAULT_HEADERS = dict(api_class.DEFAULT_HEADERS, **{"X-API-KEY": self.api_key})
+        Config.MAIL_TM_DOMAIN = "fake.test"
+        Config.DEFAULT_PASSWORD = "password"
+        return self
+
+    def stop(self):
+        try:
+            super().stop()
+        finally:
+            for owner, name, value in self._saved:
+                setattr(owner, name, value)
+
+
+def start_fake(**kwargs):
+    """启动SMTP.dev替身（API密钥为test_key，域名为fake.test），参数同 FakeSMTPDev"""
+    return FakeUpstream(api_key="test_key", **kwargs).start()
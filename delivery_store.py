@@ -0,0 +1,215 @@
+import atexit
+import json
+import threading
+import time
+from loguru import logger
+from config import Config
+
+
+class DeliveryStore:
+    """每个邮箱的投递状态（INBOX、水位线、最近ID窗口、待取邮件）的本地持久化
+
+    - SQLite WAL模式，一个邮箱一行；读写不互相阻塞，提交只追加WAL文件
+    - 写入先进入内存中的待写表，后台线程按间隔把积累的状态在一个事务里批量写入
+    - 交付邮件前用 save(..., wait=True) 等待包含该状态的批次提交（组提交：同一时刻交付的多个邮箱共用一个事务），
+      重启后不会把已交付的邮件再交付一次；停机期间到达的新邮件在水位线之后，重启后照常交付
+    - 重启后按地址直接恢复客户端，无需再查找账户和重新列出收件箱
+    - 长期未更新的行在后台定期清理
+    - path 为空时关闭
+    """
+
+    def __init__(self, path=None, flush_interval=None, ttl=None):
+        self.path = Config.DELIVERY_STORE_PATH if path is None else path
+        self.flush_interval = Config.DELIVERY_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.ttl = Config.DELIVERY_STATE_TTL if ttl is None else ttl
+
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # 同一时间只有一个批次在提交，提交序号才单调
+        self._dirty = {}  # {email: 状态}，等待写入
+        self._generation = 0  # 最近一次写入的序号
+        self._committed = 0  # 已提交到磁盘的最大序号
+        self._waiting = 0  # 正在等待提交的交付数
+        self._flusher = None
+        self._db = None
+        self._loads = 0
+        self._hits = 0
+        self._writes = 0
+        self._flushes = 0
+        self._pruned = 0
+        self._last_prune = 0.0
+
+        if self.path:
+            import sqlite3  # 只在启用时加载，未配置时不增加启动开销
+            self._error = sqlite3.Error
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS delivery_state ("
+                "email TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self._db is not None
+
+    def load(self, email):
+        """返回邮箱保存的客户端状态（与 export_state() 格式一致），没有时返回None"""
+        if not self.enabled:
+            return None
+        with self._cond:
+            self._loads += 1
+            state = self._dirty.get(email)
+            if state is not None:
+                self._hits += 1
+                return state
+        with self._db_lock:
+            row = self._db.execute("SELECT state FROM delivery_state WHERE email = ?", (email,)).fetchone()
+        if row is None:
+            return None
+        account_id, mailbox_id, watermark, recent_ids, pending_ids = json.loads(row[0])
+        with self._cond:
+            self._hits += 1
+        return account_id, mailbox_id, watermark, tuple(recent_ids), tuple(pending_ids)
+
+    def save(self, email, state, wait=False):
+        """
+        记录邮箱的最新状态
+
+        Args:
+            wait: 是否等待该状态提交到磁盘后再返回（交付邮件前使用）
+        """
+        if not self.enabled:
+            return
+        with self._cond:
+            self._dirty[email] = state
+            self._generation += 1
+            generation = self._generation
+            self._ensure_flusher()
+            if not wait:
+                return
+            # 唤醒后台线程立即提交；磁盘持续故障时最多等待 DELIVERY_COMMIT_TIMEOUT 秒，不让轮询停滞
+            self._waiting += 1
+            self._cond.notify_all()
+            try:
+                if not self._cond.wait_for(lambda: self._committed >= generation, Config.DELIVERY_COMMIT_TIMEOUT):
+                    logger.warning(f"投递状态提交超时，继续交付: {email}")
+            finally:
+                self._waiting -= 1
+
+    def flush(self):
+        """立即提交所有待写状态，写入失败时返回False"""
+        if not self.enabled:
+            return True
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._cond:
+            batch, self._dirty = self._dirty, {}
+            generation = self._generation
+        if batch:
+            now = time.time()
+            rows = [(email, json.dumps(state), now) for email, state in batch.items()]
+            try:
+                with self._db_lock:
+                    self._db.execute("BEGIN")
+                    self._db.executemany(
+                        "INSERT INTO delivery_state (email, state, updated_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(email) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                        rows
+                    )
+                    self._db.execute("COMMIT")
+            except self._error as e:
+                logger.error(f"写入投递状态失败: {e}")
+                with self._db_lock:
+                    if self._db.in_transaction:
+                        self._db.execute("ROLLBACK")
+                with self._cond:
+                    # 放回待写表下次重试，期间更新过的状态以新的为准
+                    for email, state in batch.items():
+                        self._dirty.setdefault(email, state)
+                return False
+        with self._cond:
+            if batch:
+                self._writes += len(batch)
+                self._flushes += 1
+            self._committed = max(self._committed, generation)
+            self._cond.notify_all()
+        return True
+
+    def prune(self):
+        """删除超过ttl未更新的邮箱状态"""
+        if not self.enabled:
+            return 0
+        with self._db_lock:
+            deleted = self._db.execute("DELETE FROM delivery_state WHERE updated_at < ?",
+                                       (time.time() - self.ttl,)).rowcount
+        with self._cond:
+            self._pruned += deleted
+        if deleted:
+            logger.info(f"清理过期投递状态 {deleted} 条")
+        return deleted
+
+    def stats(self):
+        """返回投递状态存储统计信息"""
+        if not self.enabled:
+            return {"enabled": False}
+        with self._db_lock:
+            rows = self._db.execute("SELECT COUNT(*) FROM delivery_state").fetchone()[0]
+        with self._cond:
+            return {
+                "enabled": True,
+                "rows": rows,
+                "pending": len(self._dirty),
+                "loads": self._loads,
+                "hits": self._hits,
+                "writes": self._writes,
+                "flushes": self._flushes,
+                "pruned": self._pruned,
+            }
+
+    def _ensure_flusher(self):
+        """首次写入时启动后台批量写入线程（调用方需持有锁）"""
+        if self._flusher is not None:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name="delivery-store", daemon=True)
+        self._flusher.start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self):
+        """按间隔批量提交；有交付在等待时立即提交，提交期间到达的交付合并进下一个事务
+
+        没有待提交的写入时总是阻塞在条件变量上：eventlet下不让出会使等待提交的交付协程永远无法运行
+        """
+        flushed = True
+        while True:
+            with self._cond:
+                if self._waiting and flushed:
+                    self._cond.wait_for(lambda: self._generation > self._committed, self.flush_interval)
+                else:
+                    # 写入失败时按间隔重试，不空转
+                    self._cond.wait(self.flush_interval)
+            try:
+                flushed = self.flush()
+                if time.monotonic() - self._last_prune > 3600:
+                    self._last_prune = time.monotonic()
+                    self.prune()
+            except Exception as e:
+                flushed = False
+                logger.error(f"投递状态后台写入出错: {e}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_delivery_store():
+    """获取进程共享的投递状态存储"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = DeliveryStore()
+    return _store
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from loguru import logger
+from config import Config
+
+
+class _SpoolWriter:
+    """边下载边写入临时文件，完整下载后才放入缓存目录"""
+
+    def __init__(self, spool, key, meta):
+        self.spool = spool
+        self.key = key
+        self.meta = meta
+        self.size = 0
+        fd, self.tmp_path = tempfile.mkstemp(dir=spool.directory, suffix=".part")
+        self.file = os.fdopen(fd, "wb")
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        self.file.close()
+        self.spool._commit(self.key, self.meta, self.tmp_path, self.size)
+
+    def abort(self):
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+class DownloadSpool:
+    """邮件原文/附件的本地磁盘缓存
+
+    - 首次完整下载时边转发边写入磁盘，重复下载直接从磁盘发送（支持Range）
+    - 按总字节数限制容量，超出时淘汰最久未使用的文件
+    - directory 为空时关闭
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = Config.DOWNLOAD_SPOOL_DIR if directory is None else directory
+        self.max_bytes = max_bytes or Config.DOWNLOAD_SPOOL_MAX_BYTES
+
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # {文件名: 字节数}，最近使用的在末尾
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_index()
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def lookup(self, key, mailbox_id):
+        """
+        查找缓存文件
+
+        Returns:
+            tuple: (文件路径, 元数据) 或None（未命中或不属于该邮箱）
+        """
+        name = self._name(key)
+        with self._lock:
+            if name not in self._index:
+                self._misses += 1
+                return None
+            try:
+                with open(self._path(name + ".json"), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                self._misses += 1
+                return None
+            if meta.get("mailbox_id") != mailbox_id:
+                self._misses += 1
+                return None
+            self._index.move_to_end(name)
+            self._hits += 1
+            return self._path(name), meta
+
+    def open_writer(self, key, meta):
+        """开始写入一个新的缓存文件"""
+        return _SpoolWriter(self, key, meta)
+
+    def stats(self):
+        """返回磁盘缓存统计信息"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+    def _commit(self, key, meta, tmp_path, size):
+        name = self._name(key)
+        if size > self.max_bytes:
+            os.remove(tmp_path)
+            return
+        with self._lock:
+            with open(self._path(name + ".json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self._path(name))
+            self._bytes += size - self._index.pop(name, 0)
+            self._index[name] = size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._index)))
+                self._evictions += 1
+
+    def _remove(self, name):
+        """删除缓存文件（调用方需持有锁）"""
+        self._bytes -= self._index.pop(name)
+        for path in (self._path(name), self._path(name + ".json")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _load_index(self):
+        """启动时按修改时间重建索引，清理残留的临时文件"""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = self._path(name)
+            if name.endswith(".part"):
+                os.remove(path)
+            elif not name.endswith(".json") and os.path.exists(path + ".json"):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._bytes += size
+        if entries:
+            logger.info(f"下载缓存加载 {len(entries)} 个文件，共 {self._bytes} 字节")
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _name(key):
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def get_download_spool():
+    """获取进程共享的下载缓存实例"""
+    global _spool
+    if _spool is None:
+        with _spool_lock:
+            if _spool is None:
+                _spool = DownloadSpool()
+    return _spool
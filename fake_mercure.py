@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+本地Mercure Hub替身，用于在不连接 mercure.smtp.dev 的情况下测试SSE推送
+
+支持：
+- GET  /.well-known/mercure?topic=...  订阅一个或多个主题（SSE，分块传输）
+- POST /.well-known/mercure            发布事件（表单字段 topic、data、id）
+- Last-Event-ID 断线续传、心跳注释、主动断开所有订阅者（模拟故障）
+"""
+
+import itertools
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+MERCURE_PATH = "/.well-known/mercure"
+
+
+class _Subscriber:
+    def __init__(self, topics):
+        self.topics = set(topics)
+        self.queue = queue.Queue()
+
+
+class FakeMercureHub:
+    """线程化的最小Mercure Hub实现"""
+
+    def __init__(self, host="127.0.0.1", port=0, heartbeat=15, api_key=None):
+        self.heartbeat = heartbeat
+        self.api_key = api_key  # 设置后校验 Authorization: Bearer <api_key>
+        self.history = []  # [(id, topic, data)]
+        self.subscribers = set()
+        self.connections = 0  # 累计订阅连接数
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{MERCURE_PATH}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.disconnect_all()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def publish(self, topic, data, event_id=None):
+        """向订阅了该主题的连接发布事件，data可以是dict或字符串"""
+        if not isinstance(data, str):
+            data = json.dumps(data)
+        with self._lock:
+            event_id = event_id or f"urn:uuid:fake-{next(self._ids)}"
+            self.history.append((event_id, topic, data))
+            targets = [sub for sub in self.subscribers if topic in sub.topics]
+        for sub in targets:
+            sub.queue.put((event_id, data))
+        return event_id
+
+    def disconnect_all(self):
+        """断开所有订阅连接（模拟Hub故障）"""
+        with self._lock:
+            targets = list(self.subscribers)
+        for sub in targets:
+            sub.queue.put(None)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self.subscribers)
+
+    def _replay_after(self, last_event_id, topics):
+        """返回last_event_id之后的历史事件"""
+        with self._lock:
+            ids = [event_id for event_id, _, _ in self.history]
+            if last_event_id not in ids:
+                return []
+            start = ids.index(last_event_id) + 1
+            return [(event_id, data) for event_id, topic, data in self.history[start:] if topic in topics]
+
+    def _make_handler(self):
+        hub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _authorized(self):
+                if not hub.api_key:
+                    return True
+                return self.headers.get("Authorization") == f"Bearer {hub.api_key}"
+
+            def _reply(self, status, body=b""):
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _write_chunk(self, text):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path != MERCURE_PATH:
+                    return self._reply(404)
+                if not self._authorized():
+                    return self._reply(401)
+                topics = parse_qs(parsed.query).get("topic", [])
+                if not topics:
+                    return self._reply(400, b"Missing topic parameter")
+
+                sub = _Subscriber(topics)
+                for event in hub._replay_after(self.headers.get("Last-Event-ID"), sub.topics):
+                    sub.queue.put(event)
+                with hub._lock:
+                    hub.subscribers.add(sub)
+                    hub.connections += 1
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    self._write_chunk(":\n\n")
+                    while True:
+                        try:
+                            event = sub.queue.get(timeout=hub.heartbeat)
+                        except queue.Empty:
+                            self._write_chunk(":\n\n")
+                            continue
+                        if event is None:
+                            self.wfile.write(b"0\r\n\r\n")
+                            break
+                        event_id, data = event
+                        self._write_chunk(f"id: {event_id}\ndata: {data}\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with hub._lock:
+                        hub.subscribers.discard(sub)
+                    self.close_connection = True
+
+            def do_POST(self):
+                if urlparse(self.path).path != MERCURE_PATH:
+                    return self._reply(404)
+                length = int(self.headers.get("Content-Length") or 0)
+                form = parse_qs(self.rfile.read(length).decode("utf-8"))
+                topic = (form.get("topic") or [None])[0]
+                data = (form.get("data") or [""])[0]
+                if not topic:
+                    return self._reply(400, b"Missing topic")
+                event_id = hub.publish(topic, data, (form.get("id") or [None])[0])
+                self._reply(200, event_id.encode("utf-8"))
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import sys
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    hub = FakeMercureHub(host="0.0.0.0", port=port).start()
+    print(f"本地Mercure Hub已启动: {hub.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        hub.stop()
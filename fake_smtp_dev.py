@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+本地SMTP.dev API替身，用于在不访问 api.smtp.dev 的情况下测试和压测
+
+支持与真实API相同的路由：
+- POST /accounts                                       创建账户
+- GET  /accounts?address=...                           查找账户
+- GET  /accounts/{id}                                  账户详情
+- GET  /accounts/{id}/mailboxes                        邮箱列表
+- GET  /accounts/{id}/mailboxes/{mid}/messages?page=N  邮件列表（新邮件在前，每页30封）
+- GET  /accounts/{id}/mailboxes/{mid}/messages/{msgid} 邮件详情
+- GET  .../messages/{msgid}/source、/download、/attachment/{aid}  原文、EML下载、附件（支持Range）
+
+可配置每个请求的延迟（latency/latency_jitter）、随机故障率（error_rate）和新邮件到达速率（start_arrivals），
+独立运行时通过命令行参数设置，供 bench_suite.py 压测使用。
+"""
+
+import itertools
+import json
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+# 与真实API一样，ID在所有替身实例之间唯一（避免进程级缓存在多个测试之间串用）
+_ids = itertools.count(1)
+
+
+_last_time = [datetime.min.replace(tzinfo=timezone.utc)]
+_time_lock = threading.Lock()
+
+
+def _now_iso():
+    # 时间戳严格递增：同一毫秒内的大量投递不会出现相同的createdAt
+    with _time_lock:
+        now = max(datetime.now(timezone.utc), _last_time[0] + timedelta(milliseconds=1))
+        _last_time[0] = now
+    return now.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+class _Server(ThreadingHTTPServer):
+    # 默认监听队列只有5，大量并发建连时会被丢弃SYN，导致客户端连接超时
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # 客户端提前断开（如请求被取消）属于正常情况，不打印堆栈
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeSMTPDev:
+    """线程化的最小SMTP.dev实现，数据保存在内存中"""
+
+    PAGE_SIZE = 30
+
+    def __init__(self, host="127.0.0.1", port=0, api_key=None, latency=0.0, latency_jitter=0.0,
+                 error_rate=0.0, seed=None):
+        self.api_key = api_key  # 设置后校验 X-API-KEY
+        self.latency = latency  # 每个请求的基础延迟（秒），模拟上游网络往返
+        self.latency_jitter = latency_jitter  # 在基础延迟上叠加 [0, jitter) 的随机延迟
+        self.error_rate = error_rate  # 请求随机返回 fail_status 的概率
+        self.accounts = {}  # {account_id: account}
+        self.addresses = {}  # {address: account_id}
+        self.mailboxes = {}  # {account_id: [mailbox]}
+        self.messages = {}  # {mailbox_id: [message]} 按到达顺序保存
+        self.blobs = {}  # {(message_id, "source"/"download"/"attachment/{aid}"): (Content-Type, 字节, Content-Disposition)}
+        self.request_count = 0
+        self.throttle_next = 0  # 接下来这么多个请求返回429
+        self.throttle_retry_after = "1"  # 429响应的Retry-After
+        self.fail_next = 0  # 接下来这么多个请求返回 fail_status（模拟上游故障）
+        self.fail_status = 503
+        self.arrivals = 0  # start_arrivals 投递的邮件数
+        self._ids = _ids
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._arrivals_stop = None
+        self._server = _Server((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.stop_arrivals()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def start_arrivals(self, rate, addresses=None):
+        """以平均 rate 封/秒（泊松到达）向随机账户投递新邮件，addresses为空时投递给所有账户
+
+        正文带有投递时间 data-sent（time.time()），压测客户端据此计算端到端交付延迟。
+        """
+        self.stop_arrivals()
+        stop = self._arrivals_stop = threading.Event()
+
+        def run():
+            while not stop.wait(self._random.expovariate(rate)):
+                with self._lock:
+                    targets = list(addresses or self.addresses)
+                    self.arrivals += 1
+                    number = self.arrivals
+                if targets:
+                    subject = f"arrival {number}"
+                    self.deliver(self._random.choice(targets), subject=subject,
+                                 html=f'<p data-sent="{time.time():.6f}">{subject}</p>')
+
+        threading.Thread(target=run, name="fake-arrivals", daemon=True).start()
+        return self
+
+    def stop_arrivals(self):
+        if self._arrivals_stop is not None:
+            self._arrivals_stop.set()
+            self._arrivals_stop = None
+
+    def _simulate_upstream(self):
+        """按配置延迟当前请求，返回是否模拟一次故障"""
+        delay = self.latency + (self._random.uniform(0, self.latency_jitter) if self.latency_jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+        return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    def _next_id(self, prefix):
+        return f"{prefix}{next(self._ids):08x}"
+
+    def create_account(self, address, password=""):
+        """创建账户和默认邮箱，地址已存在时返回None"""
+        with self._lock:
+            if address in self.addresses:
+                return None
+            account_id = self._next_id("acc")
+            now = _now_iso()
+            account = {
+                "id": account_id,
+                "address": address,
+                "quota": 0,
+                "used": 0,
+                "isActive": True,
+                "isDeleted": False,
+                "createdAt": now,
+                "updatedAt": now,
+            }
+            self.accounts[account_id] = account
+            self.addresses[address] = account_id
+            self.mailboxes[account_id] = []
+            for path in ("INBOX", "Sent", "Trash"):
+                mailbox = {"id": self._next_id("mbx"), "path": path, "totalMessages": 0}
+                self.mailboxes[account_id].append(mailbox)
+                self.messages[mailbox["id"]] = []
+            return dict(account)
+
+    def delete_account(self, address):
+        """删除账户及其邮箱和邮件（模拟地址在上游被删除，之后可用同一地址重新创建）"""
+        with self._lock:
+            account_id = self.addresses.pop(address)
+            self.accounts.pop(account_id)
+            for mailbox in self.mailboxes.pop(account_id):
+                self.messages.pop(mailbox["id"], None)
+
+    def deliver(self, address, subject="测试邮件", html=None, text=None, sender="sender@example.com",
+                attachments=None):
+        """向账户的INBOX投递一封邮件，返回邮件详情
+
+        attachments: [(文件名, Content-Type, 字节)]
+        """
+        with self._lock:
+            account_id = self.addresses[address]
+            inbox = next(m for m in self.mailboxes[account_id] if m["path"] == "INBOX")
+            now = _now_iso()
+            message_id = self._next_id("msg")
+            attachment_list = []
+            for filename, content_type, data in attachments or []:
+                attachment_id = self._next_id("att")
+                attachment_list.append({"id": attachment_id, "filename": filename,
+                                        "contentType": content_type, "size": len(data)})
+                self.blobs[(message_id, f"attachment/{attachment_id}")] = (
+                    content_type, data, f'attachment; filename="{filename}"')
+            body = html if html is not None else f"<p>{subject}</p>"
+            raw = (f"From: {sender}\r\nTo: {address}\r\nSubject: {subject}\r\n"
+                   f"Content-Type: text/html; charset=utf-8\r\n\r\n{body}\r\n").encode("utf-8")
+            self.blobs[(message_id, "source")] = ("text/plain; charset=utf-8", raw, None)
+            self.blobs[(message_id, "download")] = ("message/rfc822", raw, f'attachment; filename="{message_id}.eml"')
+            message = {
+                "id": message_id,
+                "msgid": f"<{next(self._ids)}@fake.smtp.dev>",
+                "from": {"name": "", "address": sender},
+                "to": [{"name": "", "address": address}],
+                "cc": [],
+                "bcc": [],
+                "subject": subject,
+                "intro": (text or "")[:100],
+                "isRead": False,
+                "isFlagged": False,
+                "text": text or "",
+                "html": [html if html is not None else f"<p>{subject}</p>"],
+                "hasAttachments": bool(attachment_list),
+                "attachments": attachment_list,
+                "size": len(html or "") + len(text or ""),
+                "createdAt": now,
+                "updatedAt": now,
+            }
+            self.messages[inbox["id"]].append(message)
+            inbox["totalMessages"] += 1
+            return dict(message)
+
+    def blob(self, path):
+        """返回原文/下载/附件路由对应的 (Content-Type, 字节, Content-Disposition)
+
+        不是这类路由时返回None；邮件或附件不存在时字节为None
+        """
+        match = re.fullmatch(r"/accounts/[^/]+/mailboxes/[^/]+/messages/([^/]+)/(source|download|attachment/[^/]+)", path)
+        if not match:
+            return None
+        with self._lock:
+            self.request_count += 1
+            return self.blobs.get(match.groups(), (None, None, None))
+
+    def _summary(self, message):
+        keys = ("id", "msgid", "from", "to", "subject", "intro", "isRead", "isFlagged",
+                "hasAttachments", "size", "createdAt", "updatedAt")
+        return {key: message[key] for key in keys}
+
+    def _collection(self, path, items, page=1, page_size=None):
+        """与上游一致的JSON-LD集合：member、totalItems，以及带 first/last/previous/next 的 view"""
+        page_size = page_size or max(1, len(items))
+        last = max(1, -(-len(items) // page_size))
+        start = (page - 1) * page_size
+        view = {"id": f"{path}?page={page}", "type": "PartialCollectionView",
+                "first": f"{path}?page=1", "last": f"{path}?page={last}"}
+        if page > 1:
+            view["previous"] = f"{path}?page={page - 1}"
+        if page < last:
+            view["next"] = f"{path}?page={page + 1}"
+        return {"member": items[start:start + page_size], "totalItems": len(items), "view": view}
+
+    def handle(self, method, path, query, body):
+        """路由请求，返回 (状态码, JSON对象)"""
+        with self._lock:
+            self.request_count += 1
+
+        if method == "POST" and path == "/accounts":
+            address = (body or {}).get("address")
+            if not address or "@" not in address:
+                return 422, {"detail": "address: This value is not a valid email address."}
+            account = self.create_account(address, (body or {}).get("password", ""))
+            if account is None:
+                return 422, {"detail": "address: This value is already used."}
+            return 201, account
+
+        if method != "GET":
+            return 405, {"detail": "Method not allowed"}
+
+        with self._lock:
+            if path == "/accounts":
+                address = query.get("address", [None])[0]
+                accounts = [a for a in self.accounts.values() if address is None or a["address"] == address]
+                return 200, self._collection(path, [dict(a) for a in accounts])
+
+            match = re.fullmatch(r"/accounts/([^/]+)(/mailboxes(?:/([^/]+)/messages(?:/([^/]+))?)?)?", path)
+            if not match:
+                return 404, {"detail": "Not Found"}
+            account_id, mailboxes_part, mailbox_id, message_id = match.groups()
+            if account_id not in self.accounts:
+                return 404, {"detail": "Not Found"}
+            if not mailboxes_part:
+                return 200, dict(self.accounts[account_id])
+            if not mailbox_id:
+                return 200, self._collection(path, [dict(m) for m in self.mailboxes[account_id]])
+            if mailbox_id not in self.messages:
+                return 404, {"detail": "Not Found"}
+
+            messages = self.messages[mailbox_id]
+            if message_id is None:
+                try:
+                    page = max(1, int(query.get("page", ["1"])[0]))
+                except ValueError:
+                    return 400, {"detail": "page: This value should be an integer."}
+                # 新邮件在前，每页 PAGE_SIZE 封，还有下一页时 view.next 指向它
+                summaries = [self._summary(m) for m in reversed(messages)]
+                return 200, self._collection(path, summaries, page, self.PAGE_SIZE)
+            for message in messages:
+                if message["id"] == message_id:
+                    return 200, dict(message)
+            return 404, {"detail": "Not Found"}
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和正文分两次写出，开启Nagle时会与客户端的延迟确认叠加出约40ms的额外延迟
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _dispatch(self, method):
+                if fake.api_key and self.headers.get("X-API-KEY") != fake.api_key:
+                    return self._send_json(401, {"detail": "Invalid API key"})
+                random_failure = fake._simulate_upstream()
+                with fake._lock:
+                    throttled = fake.throttle_next > 0
+                    if throttled:
+                        fake.throttle_next -= 1
+                        fake.request_count += 1
+                if throttled:
+                    return self._send_json(429, {"detail": "Too Many Requests"},
+                                           {"Retry-After": fake.throttle_retry_after})
+                parsed = urlparse(self.path)
+                body = None
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    try:
+                        body = json.loads(self.rfile.read(length))
+                    except ValueError:
+                        return self._send_json(400, {"detail": "Invalid JSON"})
+                with fake._lock:
+                    failed = fake.fail_next > 0 or random_failure
+                    if fake.fail_next > 0:
+                        fake.fail_next -= 1
+                    if failed:
+                        fake.request_count += 1
+                if failed:
+                    return self._send_json(fake.fail_status, {"detail": "Service Unavailable"})
+                blob = fake.blob(parsed.path) if method == "GET" else None
+                if blob is not None:
+                    return self._send_blob(*blob)
+                status, payload = fake.handle(method, parsed.path, parse_qs(parsed.query), body)
+                self._send_json(status, payload)
+
+            def _send_blob(self, content_type, data, disposition):
+                """发送原始字节，支持单个 bytes=start-end 范围"""
+                if data is None:
+                    return self._send_json(404, {"detail": "Not Found"})
+                status, start, end = 200, 0, len(data) - 1
+                match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range") or "")
+                if match and any(match.groups()):
+                    first, last = match.groups()
+                    if first:
+                        start, end = int(first), min(int(last), end) if last else end
+                    else:
+                        start = max(0, len(data) - int(last))
+                    if start > end:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(data)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    status = 206
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(end - start + 1))
+                self.send_header("Accept-Ranges", "bytes")
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                if disposition:
+                    self.send_header("Content-Disposition", disposition)
+                self.end_headers()
+                self.wfile.write(memoryview(data)[start:end + 1])
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="本地SMTP.dev API替身")
+    parser.add_argument("port", type=int, nargs="?", default=8025)
+    parser.add_argument("--api-key", help="设置后校验 X-API-KEY")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的基础延迟（秒）")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="叠加的随机延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="请求随机返回503的概率")
+    parser.add_argument("--arrival-rate", type=float, default=0.0, help="每秒向随机账户投递的新邮件数")
+    parser.add_argument("--seed", type=int, help="随机数种子，用于复现压测")
+    args = parser.parse_args()
+    fake = FakeSMTPDev(host="0.0.0.0", port=args.port, api_key=args.api_key, latency=args.latency,
+                       latency_jitter=args.latency_jitter, error_rate=args.error_rate, seed=args.seed).start()
+    if args.arrival_rate > 0:
+        fake.start_arrivals(args.arrival_rate)
+    print(f"本地SMTP.dev替身已启动: {fake.base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
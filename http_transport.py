@@ -0,0 +1,116 @@
+import threading
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from loguru import logger
+from config import Config
+from rate_budget import get_rate_budget, parse_retry_after
+
+
+class HTTPTransport:
+    """进程共享的HTTP传输层
+
+    所有上游请求复用同一个连接池（keep-alive），TLS握手和socket数量随并发量而不是邮箱数量增长。
+    每次请求都带上真实生效的 (连接超时, 读取超时)，发出前从全局请求预算取令牌，429响应反馈给预算。
+    """
+
+    def __init__(self, pool_connections=None, pool_maxsize=None, pool_block=None,
+                 connect_timeout=None, read_timeout=None):
+        self.pool_maxsize = pool_maxsize or Config.HTTP_POOL_MAXSIZE
+        self.timeout = (
+            connect_timeout or Config.HTTP_CONNECT_TIMEOUT,
+            read_timeout or Config.HTTP_READ_TIMEOUT
+        )
+        self.session = requests.Session()
+        # 上游使用API Key认证，禁用cookie避免多线程共享cookie jar
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections or Config.HTTP_POOL_CONNECTIONS,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=Config.HTTP_POOL_BLOCK if pool_block is None else pool_block,
+            max_retries=0
+        )
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._saturated = 0  # 发起时连接池已满、需要排队等待连接的请求数
+        self._requests = 0
+        self._errors = 0
+        self._throttled = 0  # 上游返回429的次数
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """发送请求，未指定timeout时使用默认的 (连接超时, 读取超时)"""
+        budget = get_rate_budget()
+        budget.acquire()
+        with self._lock:
+            self._in_flight += 1
+            self._requests += 1
+            if self._in_flight > self.pool_maxsize:
+                self._saturated += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        try:
+            response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            if response.status_code == 429:
+                with self._lock:
+                    self._throttled += 1
+                budget.throttled(parse_retry_after(response.headers.get("Retry-After")))
+            return response
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self._errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """返回连接池统计信息"""
+        connections = 0
+        pooled_requests = 0
+        idle = 0
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            pooled_requests += pool.num_requests
+            idle += pool.pool.qsize() if pool.pool is not None else 0
+
+        with self._lock:
+            return {
+                "pool_maxsize": self.pool_maxsize,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "saturated": self._saturated,
+                "requests": self._requests,
+                "errors": self._errors,
+                "throttled": self._throttled,
+                "connections_created": connections,
+                "pooled_requests": pooled_requests,
+                "idle_slots": idle,
+            }
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """获取进程共享的传输层实例"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = HTTPTransport()
+                logger.info(f"HTTP连接池初始化，最大连接数: {_transport.pool_maxsize}")
+    return _transport
@@ -1,71 +1,197 @@
+import threading
+from collections import deque
 import time
 from loguru import logger
-from username_generator import WordGenerator
-from smtp_api import SMTPDevAPI
+from username_generator import get_username_issuer
+from smtp_api import SMTPDevAPI, SMTPDevAPIError, MailboxNotFoundError
+from resolution_cache import get_resolution_cache, NOT_FOUND
+from message_cursor import MessageCursor
+from message_cache import get_message_cache
+from poll_scheduler import adaptive_interval
 from config import Config
 
 
+# 客户端初始化阶段：仅有地址 -> 已解析账户和INBOX -> 已建立水位线
+_PENDING, _RESOLVED, _READY = range(3)
+
+
+def find_inbox_id(api, account_id):
+    """获取账户的INBOX邮箱ID"""
+    mailboxes = api.get_mailboxes(account_id)
+    if mailboxes:
+        for mailbox in mailboxes:
+            if mailbox["path"] == "INBOX":
+                return mailbox["id"]
+    return None
+
+
+def resolve_mailbox(api, email):
+    """
+    解析邮箱地址对应的账户和INBOX，优先使用解析缓存
+    
+    Returns:
+        tuple: (account_id, mailbox_id)，账户不存在时返回None
+    """
+    cache = get_resolution_cache()
+    cached = cache.get(email)
+    if cached is NOT_FOUND:
+        return None
+    if cached:
+        return cached
+    
+    # 请求失败时抛出异常，避免把上游故障负缓存为"账户不存在"
+    account_data = api.get_account_by_email(email, raise_on_error=True)
+    if not account_data:
+        cache.put_missing(email)
+        return None
+    
+    account_id = account_data["id"]
+    mailbox_id = find_inbox_id(api, account_id)
+    if not mailbox_id:
+        raise Exception(f"无法获取邮箱 {email} 的INBOX")
+    cache.put(email, account_id, mailbox_id)
+    return account_id, mailbox_id
+
+
+def fetch_message_detail(api, account_id, mailbox_id, message_id, raise_on_error=False):
+    """获取邮件详情，优先使用邮件详情缓存；失败时返回None（raise_on_error时只有邮件不存在才返回None）"""
+    cache = get_message_cache()
+    message = cache.get(message_id, mailbox_id)
+    if message is not None:
+        return message
+    
+    message = api.get_message_detail(account_id, mailbox_id, message_id, raise_on_error=raise_on_error)
+    if message is not None:
+        cache.put(message_id, mailbox_id, message)
+    return message
+
+
 class MailTmClient:
-    """简化版邮件客户端，只保留核心功能"""
+    """简化版邮件客户端，只保留核心功能
     
-    def __init__(self, email=None, username=None):
-        """初始化客户端，支持现有账户和创建新账户"""
+    按地址创建的客户端只是一个轻量句柄，构造时不访问上游：
+    - 首次用到账户/INBOX ID时才解析（命中解析缓存时无需访问上游）
+    - 首次检查新邮件时才以现有邮件建立水位线，这次列表请求同时就是第一次轮询
+    - hydrate() 一次完成两步，可由登记表在后台线程池中预取
+    """
+    
+    # 大量邮箱同时驻留内存时，使用__slots__压缩每个实例的占用
+    __slots__ = ("api", "email", "_account_id", "_mailbox_id", "_stage", "_init_lock", "_state_lock", "cursor",
+                 "pending_ids", "push_active", "_new_mail")
+    
+    def __init__(self, email=None, username=None, state=None):
+        """初始化客户端，支持现有账户、创建新账户，以及从 export_state() 的状态恢复"""
         self.api = SMTPDevAPI()
         self.email = email
-        self.account_id = None
-        self.mailbox_id = None
-        self.processed_message_ids = set()  # 跟踪已处理的邮件ID
+        self._account_id = None
+        self._mailbox_id = None
+        self._stage = _PENDING
+        # 只串行化同一客户端的初始化；初始化期间要访问上游，不能与其他地址共用锁（可重入：建立水位线时可能重新解析）
+        self._init_lock = threading.RLock()
+        # 保护游标和待取队列：轮询线程修改它们时，淘汰、持久化和集群保存可能同时导出状态（不在持锁时访问上游）
+        self._state_lock = threading.Lock()
+        self.cursor = MessageCursor()  # 已见邮件的水位线，代替无限增长的已处理ID集合
+        self.pending_ids = deque()  # 已发现但尚未取回详情的新邮件ID，旧邮件在前
+        self.push_active = False  # 实时推送可用时降低轮询频率
+        self._new_mail = None  # 首次等待时才创建
         
-        if email:
-            # 使用现有邮箱账户
-            self._initialize_existing_account(email)
-        else:
+        if email and state:
+            # 从淘汰前导出的状态恢复，无需访问上游
+            self.restore_state(state)
+        elif not email:
             # 创建新账户
             if username is None:
-                generator = WordGenerator()
-                username = generator.generate_combined_username(1)
+                username = get_username_issuer().next_username()
             self._create_new_account(username)
     
-    def _initialize_existing_account(self, email):
-        """初始化现有账户"""
-        # 通过邮箱地址查找账户
-        account_data = self.api.get_account_by_email(email)
-        
-        if account_data:
-            self.email = email
-            self.account_id = account_data["id"]
-            
-            # 获取INBOX邮箱ID
-            mailboxes = self.api.get_mailboxes(self.account_id)
-            if mailboxes:
-                for mailbox in mailboxes:
-                    if mailbox["path"] == "INBOX":
-                        self.mailbox_id = mailbox["id"]
-                        break
-            
-            if self.mailbox_id:
-                logger.info(f"现有账户初始化成功: {self.email}")
-                # 初始化时获取已有邮件ID，避免将旧邮件当作新邮件
-                self._initialize_processed_messages()
-            else:
-                raise Exception(f"无法获取邮箱 {email} 的INBOX")
-        else:
-            raise Exception(f"未找到邮箱账户: {email}")
+    @property
+    def account_id(self):
+        if self._stage == _PENDING:
+            self.resolve()
+        return self._account_id
     
-    def _initialize_processed_messages(self):
-        """初始化已处理邮件ID集合"""
-        if not all([self.account_id, self.mailbox_id]):
+    @account_id.setter
+    def account_id(self, value):
+        self._account_id = value
+    
+    @property
+    def mailbox_id(self):
+        if self._stage == _PENDING:
+            self.resolve()
+        return self._mailbox_id
+    
+    @mailbox_id.setter
+    def mailbox_id(self, value):
+        self._mailbox_id = value
+    
+    @property
+    def hydrated(self):
+        """是否已解析账户并建立水位线"""
+        return self._stage == _READY
+    
+    def resolve(self):
+        """解析现有账户和INBOX（首次用到时执行，同一客户端只解析一次）"""
+        if self._stage != _PENDING:
             return
+        with self._init_lock:
+            if self._stage != _PENDING:
+                return
+            # 通过邮箱地址查找账户和INBOX（命中解析缓存时无需访问上游）
+            resolved = resolve_mailbox(self.api, self.email)
+            if not resolved:
+                raise Exception(f"未找到邮箱账户: {self.email}")
+            self._account_id, self._mailbox_id = resolved
+            self._stage = _RESOLVED
+        get_username_issuer().mark_existing(self.email.split('@')[0])
+        logger.info(f"现有账户初始化成功: {self.email}")
+    
+    def hydrate(self):
+        """完成初始化：解析账户，并以第一页邮件建立水位线（只需一次请求，与邮箱大小无关）
+        
+        上游故障时抛出异常且不建立水位线，下次再试，避免把旧邮件当作新邮件。
+        """
+        if self._stage == _READY:
+            return
+        self.resolve()
+        with self._init_lock:
+            if self._stage == _READY:
+                return
+            messages, _ = self._list_page(1)
+            if messages:
+                with self._state_lock:
+                    self.cursor.advance(reversed(messages))
+            self._stage = _READY
+        logger.info(f"初始化已完成邮件跟踪，水位线: {self.cursor.watermark or '无'}")
+    
+    def reresolve(self):
+        """
+        上游对账户或INBOX返回404时调用：丢弃缓存的解析结果并重新解析（地址可能已被删除后重建）
+        
+        Returns:
+            bool: 解析结果是否变化（未变化说明404另有原因，重试也无济于事）
             
+        Raises:
+            MailboxNotFoundError: 地址在上游已不存在
+        """
+        get_resolution_cache().invalidate(self.email)
+        with self._init_lock:
+            resolved = resolve_mailbox(self.api, self.email)
+            if not resolved:
+                raise MailboxNotFoundError(f"未找到邮箱账户: {self.email}")
+            changed = tuple(resolved) != (self._account_id, self._mailbox_id)
+            self._account_id, self._mailbox_id = resolved
+        if changed:
+            logger.warning(f"邮箱 {self.email} 的账户或INBOX已变化，使用新的解析结果")
+        return changed
+    
+    def _list_page(self, page):
+        """读取一页邮件；缓存的账户或INBOX已失效时重新解析一次再读"""
         try:
-            # 获取当前所有邮件ID，避免将它们当作新邮件
-            messages = self.api.get_messages(self.account_id, self.mailbox_id)
-            if messages:
-                for message in messages:
-                    self.processed_message_ids.add(message["id"])
-            logger.info(f"初始化已完成邮件跟踪，共有 {len(self.processed_message_ids)} 封已存在邮件")
-        except Exception as e:
-            logger.warning(f"初始化已处理邮件列表失败: {e}")
+            return self.api.get_messages_page(self._account_id, self._mailbox_id, page, raise_on_error=True)
+        except MailboxNotFoundError:
+            if not self.reresolve():
+                raise
+        return self.api.get_messages_page(self._account_id, self._mailbox_id, page, raise_on_error=True)
     
     def _create_new_account(self, username):
         """创建新账户"""
@@ -77,17 +203,14 @@ class MailTmClient:
         
         if account_data:
             self.email = account_data["address"]
-            self.account_id = account_data["id"]
+            self._account_id = account_data["id"]
             
             # 获取INBOX邮箱ID
-            mailboxes = self.api.get_mailboxes(self.account_id)
-            if mailboxes:
-                for mailbox in mailboxes:
-                    if mailbox["path"] == "INBOX":
-                        self.mailbox_id = mailbox["id"]
-                        break
+            self._mailbox_id = find_inbox_id(self.api, self._account_id)
             
-            if self.mailbox_id:
+            if self._mailbox_id:
+                get_resolution_cache().put(self.email, self._account_id, self._mailbox_id)
+                self._stage = _READY  # 新账户没有旧邮件，水位线为空即可
                 logger.info(f"新账户创建成功: {self.email}")
             else:
                 raise Exception(f"无法获取新账户 {self.email} 的INBOX")
@@ -98,38 +221,113 @@ class MailTmClient:
         """获取邮箱地址"""
         return self.email
     
+    def export_state(self):
+        """导出恢复客户端所需的紧凑状态；尚未建立水位线时没有需要保留的状态，返回None"""
+        if self._stage != _READY:
+            return None
+        with self._state_lock:
+            return (self._account_id, self._mailbox_id) + self.cursor.export() + (tuple(self.pending_ids),)
+
+    def restore_state(self, state):
+        """从 export_state() 导出的状态恢复游标和待取邮件（也用于接管其他worker的轮询）"""
+        account_id, mailbox_id, watermark, recent_ids, pending_ids = state
+        with self._state_lock:
+            self._account_id, self._mailbox_id = account_id, mailbox_id
+            self.cursor = MessageCursor(watermark, recent_ids)
+            self.pending_ids = deque(pending_ids)
+        self._stage = _READY
+
+    def fetch_new_messages(self, enqueue=False):
+        """
+        增量获取水位线之后的新邮件摘要，翻页直到遇到已见过的邮件
+        
+        Args:
+            enqueue (bool): 同时把新邮件ID加入待取队列；与推进水位线在同一次加锁中完成，
+                导出的状态里不会出现已越过水位线却不在待取队列中的邮件
+        
+        Returns:
+            list: 新邮件摘要（旧邮件在前）
+            
+        Raises:
+            SMTPDevAPIError: 上游请求失败（已重试），此时不推进水位线，与"没有新邮件"区分开
+        """
+        if self._stage != _READY:
+            # 首次检查只建立水位线：此前已有的邮件都不是新邮件
+            self.hydrate()
+            return []
+        
+        new_messages = []
+        for page in range(1, Config.MESSAGE_SCAN_MAX_PAGES + 1):
+            # 部分页失败时不推进水位线，下次轮询重新扫描，避免跳过较旧的新邮件
+            messages, has_next = self._list_page(page)
+            page_new, reached = self.cursor.scan_page(messages)
+            new_messages.extend(page_new)
+            if reached or not has_next:
+                break
+        else:
+            logger.warning(f"{self.email} 新邮件超过 {Config.MESSAGE_SCAN_MAX_PAGES} 页，更早的新邮件将被跳过")
+        
+        new_messages.reverse()
+        with self._state_lock:
+            self.cursor.advance(new_messages)
+            if enqueue:
+                self.pending_ids.extend(message["id"] for message in new_messages)
+        return new_messages
+    
     def get_latest_message(self):
-        """获取最新未处理的消息"""
+        """获取下一封未处理的消息（按到达顺序）；上游故障时抛出SMTPDevAPIError"""
         if not all([self.account_id, self.mailbox_id]):
             raise Exception("账户未正确初始化")
         
-        # 获取消息列表
-        messages = self.api.get_messages(self.account_id, self.mailbox_id)
-        if messages:
-            # 查找第一个未处理的邮件
-            for message in messages:
-                message_id = message["id"]
-                if message_id not in self.processed_message_ids:
-                    # 获取邮件详情
-                    message_data = self.api.get_message_detail(
-                        self.account_id, 
-                        self.mailbox_id, 
-                        message_id
-                    )
-                    # 标记为已处理
-                    self.processed_message_ids.add(message_id)
-                    return message_data
+        if not self.pending_ids:
+            self.fetch_new_messages(enqueue=True)
+        if not self.pending_ids:
+            return None
         
-        return None
+        # 邮件已被删除（404）时视为已处理；上游故障时保留在待取队列，下次轮询重试
+        message = fetch_message_detail(self.api, self.account_id, self.mailbox_id, self.pending_ids[0],
+                                       raise_on_error=True)
+        with self._state_lock:
+            self.pending_ids.popleft()
+        return message
+    
+    def get_message(self, message_id):
+        """按ID获取本邮箱的邮件详情（经过邮件详情缓存）
+        
+        邮件不存在时返回None，上游故障时抛出SMTPDevAPIError。单个邮件ID的404不触发重新解析，
+        否则任意无效ID都会清掉解析缓存并多出几次上游请求；失效的解析结果由轮询列表时的404发现。
+        """
+        if not all([self.account_id, self.mailbox_id]):
+            raise Exception("账户未正确初始化")
+        return fetch_message_detail(self.api, self.account_id, self.mailbox_id, message_id, raise_on_error=True)
+    
+    def notify_new_mail(self):
+        """唤醒正在等待的wait_for_message立即重新检查"""
+        if self._new_mail is not None:
+            self._new_mail.set()
     
     def wait_for_message(self, timeout=60):
         """等待新消息到达"""
+        if self._new_mail is None:
+            self._new_mail = threading.Event()
         start_time = time.time()
+        idle_polls = 0
         while time.time() - start_time < timeout:
-            message = self.get_latest_message()
-            if message:
-                return message
-            time.sleep(2)
+            self._new_mail.clear()
+            try:
+                message = self.get_latest_message()
+            except SMTPDevAPIError as e:
+                # 上游故障（已重试或已熔断）时按出错间隔等待，不再连续请求
+                logger.warning(f"检查新邮件失败: {e}")
+                interval = Config.POLL_ERROR_INTERVAL
+            else:
+                if message:
+                    return message
+                # 推送可用时只做低频兜底轮询，新邮件事件会提前唤醒；否则从最短间隔开始逐步退避
+                interval = Config.MERCURE_FALLBACK_INTERVAL if self.push_active else adaptive_interval(idle_polls, True)
+                idle_polls += 1
+            remaining = timeout - (time.time() - start_time)
+            self._new_mail.wait(max(0, min(interval, remaining)))
         
         logger.warning(f"等待消息超时: {timeout}秒")
         return None
\ No newline at end of file
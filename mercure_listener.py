@@ -0,0 +1,292 @@
+import json
+import socket
+import threading
+import requests
+from loguru import logger
+from config import Config
+
+
+def _close_response(response):
+    """关闭流式响应；先shutdown底层socket，唤醒阻塞在读取上的线程"""
+    connection = getattr(response.raw, "_connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    try:
+        response.close()
+    except Exception:
+        pass
+
+
+class _MercureStream:
+    """单条SSE长连接，多路复用一组账户主题"""
+
+    def __init__(self, listener, index):
+        self.listener = listener
+        self.index = index
+        self.accounts = {}  # {account_id: email}
+        self.connected = set()  # 当前连接实际订阅成功的账户
+        self.last_event_id = None
+        self._response = None
+        self._changed = threading.Event()  # 主题集合变化或停止时唤醒/断开连接
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"mercure-stream-{index}",
+            daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """停止该连接"""
+        self._stopped = True
+        self._reconnect()
+
+    def add(self, account_id, email):
+        self.accounts[account_id] = email
+        self._reconnect()
+
+    def remove(self, account_id):
+        # 不立即重连：残留主题的事件会因找不到账户而被忽略，下次重连时自然移除
+        self.accounts.pop(account_id, None)
+        self.connected.discard(account_id)
+
+    def _reconnect(self):
+        """断开当前连接，使用最新的主题集合重新订阅"""
+        self._changed.set()
+        response = self._response
+        if response is not None:
+            _close_response(response)
+
+    def _run(self):
+        """连接循环：断线后等待一段时间重连"""
+        while not self._stopped:
+            self._changed.clear()
+            topics = dict(self.accounts)
+            if not topics:
+                self._changed.wait()
+                continue
+
+            try:
+                self._consume(topics)
+            except Exception as e:
+                if not self._changed.is_set():
+                    logger.warning(f"Mercure连接中断 #{self.index}: {e}")
+            finally:
+                self._response = None
+                # 因主题变化主动重连时保持原状态，避免所有账户的状态来回切换
+                if self._stopped or not self._changed.is_set():
+                    self._set_connected(set())
+
+            if not self._stopped and not self._changed.is_set():
+                self._changed.wait(Config.MERCURE_RECONNECT_DELAY)
+
+    def _consume(self, topics):
+        """建立SSE连接并逐条解析事件"""
+        headers = {
+            "Authorization": f"Bearer {self.listener.api_key}",
+            "Accept": "text/event-stream",
+        }
+        if self.last_event_id:
+            headers["Last-Event-ID"] = self.last_event_id
+        params = [("topic", f"/accounts/{account_id}") for account_id in topics]
+
+        response = requests.get(
+            self.listener.url,
+            params=params,
+            headers=headers,
+            stream=True,
+            timeout=(Config.MERCURE_CONNECT_TIMEOUT, Config.MERCURE_READ_TIMEOUT)
+        )
+        self._response = response
+        if self._changed.is_set():
+            return
+        if response.status_code != 200:
+            logger.warning(f"Mercure订阅失败 #{self.index}: {response.status_code}")
+            return
+
+        logger.info(f"Mercure连接建立 #{self.index}，订阅 {len(topics)} 个账户")
+        self._set_connected(set(topics))
+
+        response.encoding = "utf-8"
+        data_lines = []
+        event_id = None
+        for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+            if self._changed.is_set():
+                return
+            if line is None:
+                continue
+            if not line:
+                # 空行表示一个事件结束
+                if data_lines:
+                    self._dispatch("\n".join(data_lines), topics)
+                if event_id:
+                    self.last_event_id = event_id
+                data_lines = []
+                event_id = None
+                continue
+            if line.startswith(":"):
+                continue  # 心跳注释
+
+            field, _, value = line.partition(":")
+            if value.startswith(" "):
+                value = value[1:]
+            if field == "data":
+                data_lines.append(value)
+            elif field == "id":
+                event_id = value
+
+    def _dispatch(self, raw, topics):
+        """解析事件数据，只处理Message类型"""
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            logger.warning(f"Mercure事件数据无法解析: {raw[:200]}")
+            return
+        if not isinstance(data, dict):
+            return
+
+        event_type = data.get("type") or data.get("@type")
+        if event_type != "Message":
+            return
+
+        for account_id in self._resolve_accounts(data, topics):
+            self.listener._notify_message(account_id)
+
+    def _resolve_accounts(self, data, topics):
+        """确定事件所属账户；无法确定时唤醒该连接上的全部账户"""
+        if len(topics) == 1:
+            return list(topics)
+
+        account_id = data.get("accountId")
+        if account_id in topics:
+            return [account_id]
+
+        resource_id = data.get("@id") or ""
+        for account_id in topics:
+            if f"/accounts/{account_id}/" in resource_id:
+                return [account_id]
+
+        recipients = {
+            recipient.get("address")
+            for recipient in data.get("to") or []
+            if isinstance(recipient, dict)
+        }
+        matched = [account_id for account_id, email in topics.items() if email in recipients]
+        return matched or list(topics)
+
+    def _set_connected(self, account_ids):
+        """更新实际订阅成功的账户集合，并通知发生变化的账户"""
+        previous = self.connected
+        self.connected = account_ids
+        for account_id in account_ids - previous:
+            self.listener._notify_state(account_id, True)
+        for account_id in previous - account_ids:
+            self.listener._notify_state(account_id, False)
+
+
+class MercureListener:
+    """Mercure SSE订阅器：把新邮件事件转换为唤醒回调
+
+    每条SSE连接多路复用最多 MERCURE_TOPICS_PER_STREAM 个账户主题，
+    连接断开期间 is_live() 返回False，调用方应回退到普通轮询。
+    """
+
+    def __init__(self, on_message, on_state=None, url=None, api_key=None, enabled=None):
+        self.on_message = on_message  # on_message(email)
+        self.on_state = on_state  # on_state(email, live)
+        self.url = url or Config.MERCURE_URL
+        self.api_key = api_key or Config.MAIL_TM_API_KEY
+        self.enabled = Config.MERCURE_ENABLED if enabled is None else enabled
+        self.topics_per_stream = Config.MERCURE_TOPICS_PER_STREAM
+
+        self._lock = threading.Lock()
+        self._refs = {}  # {account_id: 引用计数}
+        self._emails = {}  # {account_id: email}
+        self._streams = {}  # {account_id: _MercureStream}
+        self._stream_list = []
+        self._stream_index = 0
+        self._events = 0
+
+    def watch(self, account_id, email):
+        """订阅账户的新邮件事件（引用计数）"""
+        if not self.enabled or not account_id:
+            return
+        with self._lock:
+            self._refs[account_id] = self._refs.get(account_id, 0) + 1
+            if self._refs[account_id] > 1:
+                return
+            self._emails[account_id] = email
+            stream = self._stream_with_room()
+            self._streams[account_id] = stream
+            stream.add(account_id, email)
+
+    def unwatch(self, account_id):
+        """取消订阅账户（引用计数归零时真正移除）"""
+        if not self.enabled or not account_id:
+            return
+        with self._lock:
+            count = self._refs.get(account_id, 0) - 1
+            if count > 0:
+                self._refs[account_id] = count
+                return
+            self._refs.pop(account_id, None)
+            self._emails.pop(account_id, None)
+            stream = self._streams.pop(account_id, None)
+            if stream is None:
+                return
+            stream.remove(account_id)
+            if not stream.accounts:
+                stream.stop()
+                self._stream_list.remove(stream)
+
+    def is_live(self, account_id):
+        """账户的推送连接当前是否可用"""
+        stream = self._streams.get(account_id)
+        return stream is not None and account_id in stream.connected
+
+    def stats(self):
+        """返回订阅统计信息"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "accounts": len(self._refs),
+                "streams": len(self._stream_list),
+                "live_streams": sum(1 for stream in self._stream_list if stream.connected),
+                "events": self._events,
+            }
+
+    def _stream_with_room(self):
+        """选择仍有容量的连接，没有时新建（调用方需持有锁）"""
+        for stream in self._stream_list:
+            if len(stream.accounts) < self.topics_per_stream:
+                return stream
+        self._stream_index += 1
+        stream = _MercureStream(self, self._stream_index)
+        self._stream_list.append(stream)
+        stream.start()
+        return stream
+
+    def _notify_message(self, account_id):
+        email = self._emails.get(account_id)
+        if email is None:
+            return
+        self._events += 1
+        try:
+            self.on_message(email)
+        except Exception as e:
+            logger.error(f"处理Mercure新邮件事件出错 {email}: {e}")
+
+    def _notify_state(self, account_id, live):
+        email = self._emails.get(account_id)
+        if email is None or self.on_state is None:
+            return
+        try:
+            self.on_state(email, live)
+        except Exception as e:
+            logger.error(f"处理Mercure连接状态变化出错 {email}: {e}")
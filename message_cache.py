@@ -0,0 +1,105 @@
+import json
+import threading
+import zlib
+from collections import OrderedDict
+from config import Config
+
+
+class MessageCache:
+    """按字节预算限制的邮件详情LRU缓存，键为邮件ID
+
+    - 详情序列化为JSON字节保存，按实际字节数计入预算，超出时淘汰最久未使用的邮件
+    - 开启压缩后，超过阈值的条目用zlib压缩保存（正文通常是HTML，压缩率较高）
+    - 同一封邮件被HTTP长轮询、WebSocket推送和按ID查询多次使用时只向上游获取一次
+    """
+
+    def __init__(self, max_bytes=None, compress=None, compress_min_bytes=None):
+        self.max_bytes = Config.MESSAGE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.compress = Config.MESSAGE_CACHE_COMPRESS if compress is None else compress
+        self.compress_min_bytes = (Config.MESSAGE_CACHE_COMPRESS_MIN_BYTES
+                                   if compress_min_bytes is None else compress_min_bytes)
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {message_id: (mailbox_id, 数据, 压缩前字节数)}，最近使用的在末尾
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._raw_bytes = 0  # 缓存内容压缩前的总字节数
+
+    def get(self, message_id, mailbox_id=None):
+        """返回缓存的邮件详情，未命中（或不属于指定邮箱）时返回None"""
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is None or (mailbox_id is not None and entry[0] != mailbox_id):
+                self._misses += 1
+                return None
+            self._entries.move_to_end(message_id)
+            self._hits += 1
+            _, data, raw_size = entry
+        # 解压和反序列化不持锁，每个调用方得到独立的副本
+        if len(data) < raw_size:  # 只有压缩后更小时才保存压缩数据
+            data = zlib.decompress(data)
+        return json.loads(data)
+
+    def put(self, message_id, mailbox_id, message):
+        """缓存邮件详情，单条超过总预算时不缓存"""
+        data = json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        raw_size = len(data)
+        if self.compress and raw_size >= self.compress_min_bytes:
+            packed = zlib.compress(data, 1)
+            if len(packed) < raw_size:
+                data = packed
+        if len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            self._discard(message_id)
+            self._entries[message_id] = (mailbox_id, data, raw_size)
+            self._bytes += len(data)
+            self._raw_bytes += raw_size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._discard(oldest)
+                self._evictions += 1
+
+    def invalidate(self, message_id):
+        with self._lock:
+            self._discard(message_id)
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "raw_bytes": self._raw_bytes,
+                "max_bytes": self.max_bytes,
+                "compress": self.compress,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+    def _discard(self, message_id):
+        """移除条目并扣减字节数（调用方需持有锁）"""
+        entry = self._entries.pop(message_id, None)
+        if entry is None:
+            return
+        _, data, raw_size = entry
+        self._bytes -= len(data)
+        self._raw_bytes -= raw_size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_message_cache():
+    """获取进程共享的邮件详情缓存实例"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = MessageCache()
+    return _cache
@@ -0,0 +1,44 @@
+from collections import deque
+from config import Config
+
+
+class MessageCursor:
+    """邮件列表的增量读取游标
+
+    用最新已见邮件的 createdAt（水位线）加一个小的最近ID窗口代替"全部已见ID"集合：
+    - 列表按新邮件在前返回，翻页时遇到早于水位线的邮件即可停止，轮询开销与邮箱大小无关
+    - 与水位线同一时间戳的邮件通过最近ID窗口去重
+    """
+
+    __slots__ = ("watermark", "recent_ids")
+
+    def __init__(self, watermark="", recent_ids=()):
+        self.watermark = watermark  # 已见最新邮件的createdAt，空字符串表示尚无邮件
+        self.recent_ids = deque(recent_ids, maxlen=Config.MESSAGE_RECENT_IDS)
+
+    def scan_page(self, messages):
+        """
+        检查一页邮件（新邮件在前）
+
+        Returns:
+            tuple: (本页中的新邮件列表, 是否已到达水位线——无需再翻页)
+        """
+        new_messages = []
+        for message in messages:
+            created_at = message.get("createdAt") or ""
+            if created_at < self.watermark:
+                return new_messages, True
+            if message["id"] not in self.recent_ids:
+                new_messages.append(message)
+        return new_messages, False
+
+    def advance(self, messages):
+        """把邮件标记为已见，并推进水位线"""
+        for message in messages:
+            self.recent_ids.append(message["id"])
+            created_at = message.get("createdAt") or ""
+            if created_at > self.watermark:
+                self.watermark = created_at
+
+    def export(self):
+        return self.watermark, tuple(self.recent_ids)
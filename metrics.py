@@ -0,0 +1,227 @@
+import bisect
+import math
+import threading
+import time
+from datetime import datetime
+
+
+def _escape(value):
+    """转义Prometheus文本格式的标签值"""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最后一个桶对应 +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class _Metric:
+    """带标签的指标：每组标签值对应一个子对象，热路径上只需一次字典查找和一次加锁"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}  # {标签值元组: 子对象}
+
+    def labels(self, *values):
+        """获取标签值对应的子对象（调用方可缓存返回值以省去查找）"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _items(self):
+        with self._lock:
+            return sorted(self._children.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, *values, amount=1):
+        self.labels(*values).inc(amount)
+
+    def _samples(self):
+        for values, child in self._items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Histogram(_Metric):
+    """直方图：按固定桶统计分布，输出累积桶计数、总和与样本数"""
+
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value, *values):
+        self.labels(*values).observe(value)
+
+    def _samples(self):
+        for values, child in self._items():
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Gauge(_Metric):
+    """抓取时才计算的瞬时值：func() 返回数值，带标签时返回 [(标签值元组, 数值)]"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, func, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def _samples(self):
+        result = self.func()
+        if not self.labelnames:
+            result = [((), result)]
+        for values, value in result:
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    """指标登记表，render() 输出Prometheus文本格式（0.0.4）"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}  # {指标名: 指标}
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=None):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, func, labelnames=()):
+        return self.register(Gauge(name, documentation, func, labelnames))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def created_at_age(message):
+    """邮件 createdAt 距今的秒数，无法解析时返回None"""
+    created_at = message.get("createdAt") if isinstance(message, dict) else None
+    if not created_at:
+        return None
+    try:
+        created = datetime.fromisoformat(created_at)
+    except ValueError:
+        return None
+    if created.tzinfo is None:
+        return None
+    return max(0.0, time.time() - created.timestamp())
+
+
+# 进程内全部指标（多worker时每个worker各自导出，由Prometheus按实例聚合）
+registry = MetricsRegistry()
+
+upstream_latency = registry.histogram(
+    "emailapi_upstream_request_duration_seconds",
+    "上游API单次请求耗时（每次重试单独计入），status为HTTP状态码或error",
+    ("endpoint", "status")
+)
+polls_total = registry.counter(
+    "emailapi_polls_total",
+    "邮箱轮询次数，result为message/empty/error/standby（多worker时未持有租约）",
+    ("result",)
+)
+wait_duration = registry.histogram(
+    "emailapi_wait_duration_seconds",
+    "长轮询请求的等待时长，outcome为message或timeout",
+    ("endpoint", "outcome"),
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 30, 45, 60)
+)
+delivery_latency = registry.histogram(
+    "emailapi_delivery_latency_seconds",
+    "邮件从上游createdAt到推送给客户端的时长",
+    ("channel",),
+    buckets=(0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60, 120)
+)
@@ -0,0 +1,239 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from config import Config
+from rate_budget import get_rate_budget
+
+
+def adaptive_interval(idle_polls, waiting=False):
+    """
+    连续 idle_polls 次空轮询后的下一次轮询间隔
+
+    刚订阅或刚收到邮件时按最短间隔轮询，之后指数退避；
+    有请求在等待时退避上限为 POLL_INTERVAL，空闲邮箱最多退避到 POLL_MAX_INTERVAL。
+    """
+    limit = Config.POLL_INTERVAL if waiting else Config.POLL_MAX_INTERVAL
+    interval = Config.POLL_MIN_INTERVAL * Config.POLL_BACKOFF_FACTOR ** min(idle_polls, 64)
+    return min(interval, limit)
+
+
+class _PollJob:
+    """调度器内部的轮询任务记录"""
+
+    __slots__ = ("key", "callback", "due", "running", "rerun", "idle", "errors")
+
+    def __init__(self, key, callback, due):
+        self.key = key
+        self.callback = callback
+        self.due = due  # 当前有效的到期时间，堆中其他条目视为过期
+        self.running = False
+        self.rerun = False  # 执行期间被触发，完成后立即再执行一次
+        self.idle = 0  # 连续空轮询次数，决定退避间隔
+        self.errors = 0  # 连续出错次数
+
+
+class PollScheduler:
+    """共享轮询调度器：一个调度线程 + 有界工作线程池驱动所有邮箱的轮询
+
+    - 轮询间隔按邮箱自适应：刚订阅/刚收到邮件时最快，空闲时指数退避，连续出错时加倍
+    - 到期任务按优先级出队：有等待者的邮箱按截止时间最近优先，其余按到期时间
+    - 全局上游请求预算不足时任务留在调度器中排队，不占用工作线程
+    """
+
+    def __init__(self, interval=None, error_interval=None, max_workers=None, deadline_of=None, budget=None):
+        self.interval = interval or Config.POLL_INTERVAL
+        self.error_interval = error_interval or Config.POLL_ERROR_INTERVAL
+        self.max_workers = max_workers or Config.POLL_WORKERS
+        self.deadline_of = deadline_of  # deadline_of(key) -> 最近的等待截止时间（monotonic）或None
+        self.budget = budget or get_rate_budget()
+
+        self._heap = []  # (到期时间, 序号, _PollJob)
+        self._ready = []  # (截止时间, 到期时间, 序号, _PollJob) 已到期、等待预算的任务
+        self._jobs = {}  # {key: _PollJob}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._executor = None
+        self._thread = None
+
+        # 统计信息
+        self._running = 0
+        self._polls = 0
+        self._errors = 0
+        self._deferred = 0  # 因上游预算不足推迟出队的次数
+        self._last_lag = 0.0
+        self._max_lag = 0.0
+        self._avg_lag = 0.0
+
+    def schedule(self, key, callback):
+        """注册轮询任务，首次执行时间在一个周期内随机分散"""
+        with self._cond:
+            due = time.monotonic() + random.uniform(0, self.interval)
+            job = _PollJob(key, callback, due)
+            self._jobs[key] = job
+            self._push(job)
+        self._ensure_started()
+
+    def trigger(self, key):
+        """立即执行一次已注册的轮询任务（例如收到推送事件或有新的等待者时），并重置退避"""
+        with self._cond:
+            job = self._jobs.get(key)
+            if job is None:
+                return False
+            job.idle = 0
+            if job.running:
+                job.rerun = True
+            else:
+                # 已到期的任务也重新入堆，使出队优先级反映最新的等待截止时间
+                job.due = time.monotonic()
+                self._push(job)
+            return True
+
+    def cancel(self, key):
+        """取消轮询任务（堆中残留的旧条目会在出堆时被丢弃）"""
+        with self._cond:
+            self._jobs.pop(key, None)
+
+    def is_scheduled(self, key):
+        """检查任务是否已注册"""
+        with self._cond:
+            return key in self._jobs
+
+    def stats(self):
+        """返回调度器统计信息"""
+        with self._cond:
+            now = time.monotonic()
+            overdue = 0.0
+            if self._ready:
+                overdue = max(0.0, now - min(entry[1] for entry in self._ready))
+            elif self._heap:
+                overdue = max(0.0, now - self._heap[0][0])
+            return {
+                "scheduled": len(self._jobs),
+                "running": self._running,
+                "workers": self.max_workers,
+                "polls": self._polls,
+                "errors": self._errors,
+                "ready": len(self._ready),
+                "deferred": self._deferred,
+                "lag_last": round(self._last_lag, 4),
+                "lag_avg": round(self._avg_lag, 4),
+                "lag_max": round(self._max_lag, 4),
+                "overdue": round(overdue, 4),
+            }
+
+    def _push(self, job):
+        """将任务按当前到期时间入堆（调用方需持有锁）"""
+        heapq.heappush(self._heap, (job.due, next(self._seq), job))
+        self._cond.notify()
+
+    def _ensure_started(self):
+        """首次注册任务时启动调度线程"""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="poll-worker"
+            )
+            self._thread = threading.Thread(
+                target=self._dispatch_loop,
+                name="poll-scheduler",
+                daemon=True
+            )
+            self._thread.start()
+            logger.info(f"轮询调度器启动，工作线程数: {self.max_workers}")
+
+    def _dispatch_loop(self):
+        """调度循环：取出到期任务并交给工作线程池"""
+        while True:
+            # 工作线程全部繁忙时在此阻塞，延迟会体现在lag统计中
+            self._slots.acquire()
+            job, due = self._next_due_job()
+            with self._cond:
+                self._running += 1
+            self._executor.submit(self._run_job, job, due)
+
+    def _next_due_job(self):
+        """阻塞直到有到期、仍然有效且上游预算允许的任务，优先返回截止时间最近的"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._heap and self._heap[0][0] <= now:
+                    due, seq, job = heapq.heappop(self._heap)
+                    if self._is_current(job, due):
+                        deadline = self.deadline_of(job.key) if self.deadline_of else None
+                        heapq.heappush(self._ready, (deadline or float("inf"), due, seq, job))
+                while self._ready and not self._is_current(self._ready[0][3], self._ready[0][1]):
+                    heapq.heappop(self._ready)
+
+                if not self._ready:
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                    continue
+
+                wait = self.budget.delay()
+                if wait > 0:
+                    self._deferred += 1
+                    self._cond.wait(wait)
+                    continue
+
+                _, due, _, job = heapq.heappop(self._ready)
+                job.running = True
+                return job, due
+
+    def _is_current(self, job, due):
+        """堆条目是否仍对应任务当前的到期时间（调用方需持有锁）"""
+        return self._jobs.get(job.key) is job and job.due == due
+
+    def _run_job(self, job, due):
+        """在工作线程中执行一次轮询并重新排期
+
+        回调返回None表示没有新邮件，按自适应间隔退避；返回0表示刚取到邮件，立即再查并重置退避；
+        返回其他数字时作为下一次轮询的延迟
+        """
+        lag = max(0.0, time.monotonic() - due)
+        result = None
+        failed = False
+        try:
+            result = job.callback()
+        except Exception as e:
+            logger.error(f"轮询任务出错 {job.key}: {e}")
+            failed = True
+        finally:
+            self._slots.release()
+
+        waiting = self.deadline_of is not None and self.deadline_of(job.key) is not None
+        with self._cond:
+            self._running -= 1
+            self._polls += 1
+            self._last_lag = lag
+            self._max_lag = max(self._max_lag, lag)
+            self._avg_lag = self._avg_lag * 0.9 + lag * 0.1
+
+            if failed:
+                self._errors += 1
+                job.errors += 1
+                delay = min(self.error_interval * 2 ** min(job.errors - 1, 16),
+                            max(self.error_interval, Config.POLL_MAX_INTERVAL))
+            else:
+                job.errors = 0
+                if result is None:
+                    delay = adaptive_interval(job.idle, waiting)
+                    job.idle += 1
+                else:
+                    delay = result
+                    if result == 0:
+                        job.idle = 0
+
+            # 任务未被取消或替换时才重新排期
+            job.running = False
+            if self._jobs.get(job.key) is job:
+                if job.rerun:
+                    job.rerun = False
+                    delay = 0
+                job.due = time.monotonic() + delay
+                self._push(job)
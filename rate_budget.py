@@ -0,0 +1,136 @@
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from loguru import logger
+from config import Config
+
+
+def parse_retry_after(value):
+    """解析Retry-After响应头（秒数或HTTP日期），无法解析时返回None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateBudget:
+    """进程共享的上游请求预算（令牌桶）
+
+    - 所有上游请求发出前取一个令牌，总QPS不超过API Key的配额；rate为0时不限速
+    - 收到429时所有请求暂停Retry-After秒，速率减半；之后每秒恢复最大速率的10%（AIMD）
+    - 轮询调度器用 delay() 做准入判断：预算不足时任务在调度器里按优先级排队，而不是堵在工作线程里
+    """
+
+    def __init__(self, rate=None, burst=None, min_rate=None, throttle_pause=None):
+        self.max_rate = Config.UPSTREAM_QPS if rate is None else rate
+        self.burst = burst or Config.UPSTREAM_BURST or max(1, int(self.max_rate))
+        self.min_rate = min(self.max_rate, min_rate or Config.UPSTREAM_MIN_QPS)
+        self.throttle_pause = throttle_pause or Config.UPSTREAM_THROTTLE_PAUSE
+
+        self._lock = threading.Lock()
+        self._rate = self.max_rate
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._granted = 0
+        self._delayed = 0
+        self._throttles = 0
+
+    @property
+    def enabled(self):
+        return self.max_rate > 0
+
+    def reserve(self):
+        """取一个令牌，返回发出请求前需要等待的秒数（预算不足时预支，由调用方等待）"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._granted += 1
+            wait = max(0.0, self._paused_until - now)
+            if self.enabled:
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens / self._rate)
+            if wait > 0:
+                self._delayed += 1
+            return wait
+
+    def acquire(self):
+        """取一个令牌，预算不足时阻塞等待"""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def delay(self):
+        """下一个令牌可用前的秒数（不消耗令牌）"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, self._paused_until - now)
+            if self.enabled and self._tokens < 1:
+                wait = max(wait, (1 - self._tokens) / self._rate)
+            return wait
+
+    def throttled(self, retry_after=None):
+        """上游返回429：暂停所有请求并降低速率"""
+        pause = self.throttle_pause if retry_after is None else retry_after
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._throttles += 1
+            self._paused_until = max(self._paused_until, now + pause)
+            if self.enabled:
+                self._rate = max(self.min_rate, self._rate / 2)
+                self._tokens = min(self._tokens, 0.0)
+            rate = self._rate
+        logger.warning(f"上游返回429，暂停 {pause:.1f} 秒，请求速率降为 {rate:.1f}/s")
+
+    def stats(self):
+        """返回预算统计信息"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "enabled": self.enabled,
+                "max_rate": self.max_rate,
+                "rate": round(self._rate, 2),
+                "burst": self.burst,
+                "tokens": round(self._tokens, 2),
+                "paused": round(max(0.0, self._paused_until - time.monotonic()), 2),
+                "granted": self._granted,
+                "delayed": self._delayed,
+                "throttles": self._throttles,
+            }
+
+    def _refill(self, now):
+        """按经过的时间补充令牌，暂停结束后逐步恢复速率（调用方需持有锁）"""
+        elapsed = now - self._updated
+        self._updated = now
+        if not self.enabled:
+            return
+        if self._rate < self.max_rate and now > self._paused_until:
+            self._rate = min(self.max_rate, self._rate + self.max_rate * 0.1 * elapsed)
+        self._tokens = min(float(self.burst), self._tokens + elapsed * self._rate)
+
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def get_rate_budget():
+    """获取进程共享的上游请求预算"""
+    global _budget
+    if _budget is None:
+        with _budget_lock:
+            if _budget is None:
+                _budget = RateBudget()
+    return _budget
@@ -0,0 +1,252 @@
+import random
+import threading
+import time
+import requests
+from loguru import logger
+from config import Config
+from rate_budget import parse_retry_after
+from metrics import upstream_latency
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """端点熔断中，请求未发出即失败（调用方按普通请求失败处理）"""
+
+
+class CircuitBreaker:
+    """单个上游端点的熔断器
+
+    - closed：正常放行，连续失败达到阈值后打开
+    - open：直接拒绝请求，reset_timeout 秒后进入half_open
+    - half_open：同一时间只放行一个探测请求，成功则关闭，失败则重新打开；
+      探测被取消时调用 release() 归还名额，超过 probe_timeout 秒未结束的探测视为丢失
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=None, reset_timeout=None, probe_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or Config.BREAKER_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or Config.BREAKER_RESET_TIMEOUT
+        self.probe_timeout = probe_timeout or Config.BREAKER_PROBE_TIMEOUT
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0  # 连续失败次数
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._opens = 0
+        self._rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def allow(self):
+        """是否放行本次请求"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and (not self._probing or now - self._probe_started >= self.probe_timeout):
+                if self._probing:
+                    logger.warning(f"探测请求超过 {self.probe_timeout} 秒未结束，放行新的探测: {self.name}")
+                self._probing = True
+                self._probe_started = now
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"上游端点恢复，熔断器关闭: {self.name}")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def release(self):
+        """请求未得出结果就结束（如被取消）：不计入成功或失败，只归还半开状态的探测名额"""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state != self.CLOSED or self._failures >= self.failure_threshold:
+                if self._state == self.CLOSED:
+                    self._opens += 1
+                    logger.warning(f"上游端点连续失败 {self._failures} 次，熔断 {self.reset_timeout} 秒: {self.name}")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._current_state(time.monotonic()),
+                "failures": self._failures,
+                "opens": self._opens,
+                "rejected": self._rejected,
+            }
+
+    def _current_state(self, now):
+        """open状态超过reset_timeout后视为half_open（调用方需持有锁）"""
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+
+class Resilience:
+    """上游请求的重试和熔断策略（进程共享，按端点维护熔断器和重试统计）
+
+    - 网络错误、5xx：幂等请求带抖动指数退避重试；非幂等请求（创建账户）只在连接阶段超时时重试
+    - 429：请求未被处理，都可以重试，等待Retry-After（超过上限时放弃）
+    - 5xx和网络错误计入熔断器，429和4xx不计入（429由全局请求预算处理）
+    """
+
+    RETRY_STATUSES = (500, 502, 503, 504)
+
+    def __init__(self, retries=None, base_delay=None, max_delay=None, retry_after_max=None):
+        self.retries = Config.UPSTREAM_RETRIES if retries is None else retries
+        self.base_delay = Config.UPSTREAM_RETRY_BASE if base_delay is None else base_delay
+        self.max_delay = Config.UPSTREAM_RETRY_MAX_DELAY if max_delay is None else max_delay
+        self.retry_after_max = Config.UPSTREAM_RETRY_AFTER_MAX if retry_after_max is None else retry_after_max
+
+        self._lock = threading.Lock()
+        self._breakers = {}  # {端点: CircuitBreaker}
+        self._retries = {}  # {端点: 重试次数}
+
+    def breaker(self, endpoint):
+        """获取端点的熔断器"""
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(endpoint)
+            return breaker
+
+    def call(self, endpoint, send, idempotent=True):
+        """
+        经过熔断和重试发送请求
+
+        Args:
+            endpoint (str): 端点名称（熔断和统计的维度）
+            send (callable): 发送一次请求并返回Response
+            idempotent (bool): 请求是否可以安全地重复发送
+
+        Returns:
+            requests.Response: 最后一次尝试的响应
+
+        Raises:
+            CircuitOpenError: 端点熔断中
+            requests.exceptions.RequestException: 重试耗尽后的网络错误
+        """
+        breaker = self.breaker(endpoint)
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"上游端点 {endpoint} 熔断中")
+            started = time.perf_counter()
+            try:
+                response = send()
+            except requests.exceptions.RequestException as e:
+                upstream_latency.observe(time.perf_counter() - started, endpoint, "error")
+                breaker.record_failure()
+                unsent = isinstance(e, requests.exceptions.ConnectTimeout)
+                delay = self.retry_delay(attempt, idempotent, unsent=unsent)
+                if delay is None:
+                    raise
+                logger.warning(f"{endpoint} 请求出错，{delay:.2f} 秒后重试: {e}")
+            except Exception:
+                # 非网络异常同样算作失败，否则半开状态的探测名额不会归还
+                breaker.record_failure()
+                raise
+            except BaseException:
+                # 被中断（如协程超时）：结果未知，只归还探测名额
+                breaker.release()
+                raise
+            else:
+                upstream_latency.observe(time.perf_counter() - started, endpoint, str(response.status_code))
+                delay = self.record_response(endpoint, response, attempt, idempotent)
+                if delay is None:
+                    return response
+                response.close()
+            attempt += 1
+            self.count_retry(endpoint)
+            time.sleep(delay)
+
+    def record_response(self, endpoint, response, attempt, idempotent):
+        """记录响应结果到熔断器，返回重试前等待的秒数（不重试时为None）"""
+        breaker = self.breaker(endpoint)
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        delay = self.retry_delay(attempt, idempotent, response=response)
+        if delay is not None:
+            logger.warning(f"{endpoint} 返回 {response.status_code}，{delay:.2f} 秒后重试")
+        return delay
+
+    def retry_delay(self, attempt, idempotent, response=None, unsent=False):
+        """
+        判断第 attempt 次尝试（从0开始）失败后是否重试
+
+        Args:
+            response: 上游响应；为None表示网络错误
+            unsent (bool): 网络错误发生在连接阶段，请求确定未到达上游
+
+        Returns:
+            float: 重试前等待的秒数，不应重试时返回None
+        """
+        if attempt >= self.retries:
+            return None
+        if response is None:
+            if not idempotent and not unsent:
+                return None
+            return self.backoff(attempt)
+        if response.status_code == 429:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is None:
+                return self.backoff(attempt)
+            return retry_after if retry_after <= self.retry_after_max else None
+        if idempotent and response.status_code in self.RETRY_STATUSES:
+            return self.backoff(attempt)
+        return None
+
+    def backoff(self, attempt):
+        """带抖动的指数退避：在 [d/2, d] 之间随机，d = base * 2^attempt（不超过上限）"""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def stats(self):
+        """返回各端点的熔断器状态和重试次数"""
+        with self._lock:
+            breakers = dict(self._breakers)
+            retries = dict(self._retries)
+        return {
+            endpoint: dict(breaker.stats(), retries=retries.get(endpoint, 0))
+            for endpoint, breaker in sorted(breakers.items())
+        }
+
+    def count_retry(self, endpoint):
+        with self._lock:
+            self._retries[endpoint] = self._retries.get(endpoint, 0) + 1
+
+
+_resilience = None
+_resilience_lock = threading.Lock()
+
+
+def get_resilience():
+    """获取进程共享的重试和熔断策略"""
+    global _resilience
+    if _resilience is None:
+        with _resilience_lock:
+            if _resilience is None:
+                _resilience = Resilience()
+    return _resilience
@@ -0,0 +1,159 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from loguru import logger
+from config import Config
+
+# 负缓存命中：确认上游不存在该地址
+NOT_FOUND = object()
+
+
+class ResolutionCache:
+    """邮箱地址 -> (account_id, INBOX邮箱ID) 解析缓存
+
+    - 正向结果按TTL过期，不存在的地址按较短的TTL负缓存
+    - 超过容量时按LRU淘汰
+    - 配置快照路径后定期把正向结果写入磁盘，重启后自动加载
+    """
+
+    def __init__(self, ttl=None, negative_ttl=None, max_entries=None, snapshot_path=None):
+        self.ttl = Config.RESOLUTION_CACHE_TTL if ttl is None else ttl
+        self.negative_ttl = Config.RESOLUTION_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self.max_entries = max_entries or Config.RESOLUTION_CACHE_SIZE
+        self.snapshot_path = Config.RESOLUTION_SNAPSHOT_PATH if snapshot_path is None else snapshot_path
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {address: (account_id, mailbox_id, 过期时间)}，account_id为None表示负缓存
+        self._dirty = False
+        self._saver = None
+        self._hits = 0
+        self._negative_hits = 0
+        self._misses = 0
+
+        if self.snapshot_path:
+            self.load_snapshot()
+
+    def get(self, address):
+        """返回 (account_id, mailbox_id)、NOT_FOUND（负缓存）或None（未命中）"""
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is None:
+                self._misses += 1
+                return None
+            account_id, mailbox_id, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[address]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(address)
+            if account_id is None:
+                self._negative_hits += 1
+                return NOT_FOUND
+            self._hits += 1
+            return account_id, mailbox_id
+
+    def put(self, address, account_id, mailbox_id):
+        """缓存解析结果"""
+        self._store(address, (account_id, mailbox_id, time.time() + self.ttl))
+        self._dirty = True
+        self._ensure_saver()
+
+    def put_missing(self, address):
+        """负缓存不存在的地址"""
+        self._store(address, (None, None, time.time() + self.negative_ttl))
+
+    def invalidate(self, address):
+        with self._lock:
+            if self._entries.pop(address, None) is not None:
+                self._dirty = True
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self._hits,
+                "negative_hits": self._negative_hits,
+                "misses": self._misses,
+            }
+
+    def _store(self, address, entry):
+        with self._lock:
+            self._entries[address] = entry
+            self._entries.move_to_end(address)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save_snapshot(self):
+        """把未过期的正向结果写入快照文件（先写临时文件再替换）"""
+        if not self.snapshot_path or not self._dirty:
+            return
+        now = time.time()
+        with self._lock:
+            self._dirty = False
+            data = {
+                address: [account_id, mailbox_id, expires_at]
+                for address, (account_id, mailbox_id, expires_at) in self._entries.items()
+                if account_id is not None and expires_at > now
+            }
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            self._dirty = True
+            logger.warning(f"保存解析缓存快照失败: {e}")
+
+    def load_snapshot(self):
+        """从快照文件加载未过期的解析结果"""
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"加载解析缓存快照失败: {e}")
+            return
+
+        now = time.time()
+        loaded = 0
+        for address, (account_id, mailbox_id, expires_at) in data.items():
+            if expires_at > now:
+                self._store(address, (account_id, mailbox_id, expires_at))
+                loaded += 1
+        logger.info(f"已从快照加载 {loaded} 条邮箱解析缓存")
+
+    def _ensure_saver(self):
+        """配置了快照路径时启动后台定期保存线程"""
+        if not self.snapshot_path or self._saver is not None:
+            return
+        with self._lock:
+            if self._saver is not None:
+                return
+            self._saver = threading.Thread(target=self._save_loop, name="resolution-snapshot", daemon=True)
+            self._saver.start()
+
+    def _save_loop(self):
+        while True:
+            time.sleep(Config.RESOLUTION_SNAPSHOT_INTERVAL)
+            self.save_snapshot()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_resolution_cache():
+    """获取进程共享的解析缓存实例"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResolutionCache()
+                if _cache.snapshot_path:
+                    atexit.register(_cache.save_snapshot)
+    return _cache
@@ -1,6 +1,16 @@
 import requests
 from loguru import logger
 from config import Config
+from http_transport import get_transport
+from resilience import get_resilience
+
+
+class SMTPDevAPIError(Exception):
+    """上游请求失败（网络错误或非预期状态码），区别于资源不存在的情况"""
+
+
+class MailboxNotFoundError(SMTPDevAPIError):
+    """上游对账户或INBOX返回404：缓存的解析结果已失效（地址可能已被删除或重建）"""
 
 
 class SMTPDevAPI:
@@ -12,11 +22,19 @@ class SMTPDevAPI:
         "Content-Type": "application/json",
         "Accept": "application/json"
     }
+    MESSAGES_PER_PAGE = 30  # 上游每页最多返回的消息数
+    
+    def __init__(self, transport=None):
+        # 所有实例共享进程级连接池，创建实例不再产生新的会话和连接
+        self.transport = transport or get_transport()
     
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update(self.DEFAULT_HEADERS)
-        self.session.timeout = 10
+    def _request(self, endpoint, method, url, idempotent=True, **kwargs):
+        """经过按端点熔断和带抖动退避重试发送请求，失败时抛出 requests.exceptions.RequestException"""
+        return get_resilience().call(
+            endpoint,
+            lambda: self.transport.request(method, url, **kwargs),
+            idempotent
+        )
     
     def create_account(self, email, password):
         """
@@ -35,8 +53,12 @@ class SMTPDevAPI:
         }
         
         try:
-            response = self.session.post(
+            # 创建账户不是幂等的，只在请求确定未到达上游时重试
+            response = self._request(
+                "accounts.create", "POST",
                 f"{self.BASE_URL}/accounts",
+                idempotent=False,
+                headers=self.DEFAULT_HEADERS,
                 json=json_data
             )
             
@@ -52,12 +74,13 @@ class SMTPDevAPI:
             logger.error(f"创建账户请求出错: {str(e)}")
             return None
     
-    def get_account_by_email(self, email):
+    def get_account_by_email(self, email, raise_on_error=False):
         """
         通过邮箱地址查找账户
         
         Args:
             email (str): 邮箱地址
+            raise_on_error (bool): 请求失败时抛出SMTPDevAPIError，而不是与"未找到"一样返回None
             
         Returns:
             dict: 账户信息或None（未找到时）
@@ -66,8 +89,10 @@ class SMTPDevAPI:
             logger.info(f"开始查找邮箱账户: {email}")
             
             # 使用带参数的GET请求直接查找账户（根据API文档）
-            response = self.session.get(
-                f"{self.BASE_URL}/accounts", 
+            response = self._request(
+                "accounts.list", "GET",
+                f"{self.BASE_URL}/accounts",
+                headers=self.DEFAULT_HEADERS,
                 params={"address": email}
             )
             logger.info(f"获取账户列表响应状态码: {response.status_code}")
@@ -84,7 +109,11 @@ class SMTPDevAPI:
                         account_id = account["id"]
                         
                         # 获取完整账户信息
-                        detail_response = self.session.get(f"{self.BASE_URL}/accounts/{account_id}")
+                        detail_response = self._request(
+                            "accounts.get", "GET",
+                            f"{self.BASE_URL}/accounts/{account_id}",
+                            headers=self.DEFAULT_HEADERS
+                        )
                         if detail_response.status_code == 200:
                             logger.info(f"成功获取账户详情: {account_id}")
                             return detail_response.json()
@@ -96,13 +125,21 @@ class SMTPDevAPI:
                 return None
             else:
                 logger.error(f"获取账户列表失败: {response.status_code}, 响应: {response.text[:500]}")
+                if raise_on_error:
+                    raise SMTPDevAPIError(f"获取账户列表失败: {response.status_code}")
                 return None
                 
+        except SMTPDevAPIError:
+            raise
         except requests.exceptions.RequestException as e:
             logger.error(f"查找账户请求出错: {str(e)}")
+            if raise_on_error:
+                raise SMTPDevAPIError(f"查找账户请求出错: {str(e)}")
             return None
         except Exception as e:
             logger.error(f"查找账户时发生未知错误: {str(e)}")
+            if raise_on_error:
+                raise SMTPDevAPIError(f"查找账户时发生未知错误: {str(e)}")
             return None
     
     def get_mailboxes(self, account_id):
@@ -116,12 +153,16 @@ class SMTPDevAPI:
             list: 邮箱列表或None（失败时）
         """
         try:
-            response = self.session.get(
-                f"{self.BASE_URL}/accounts/{account_id}/mailboxes"
+            response = self._request(
+                "mailboxes.list", "GET",
+                f"{self.BASE_URL}/accounts/{account_id}/mailboxes",
+                headers=self.DEFAULT_HEADERS
             )
             
             if response.status_code == 200:
-                return response.json()
+                data = response.json()
+                # JSON-LD格式的集合在member中，普通JSON格式直接是列表
+                return data.get("member", []) if isinstance(data, dict) else data
             else:
                 logger.error(f"获取邮箱列表失败: {response.status_code}")
                 return None
@@ -130,33 +171,68 @@ class SMTPDevAPI:
             logger.error(f"获取邮箱列表请求出错: {str(e)}")
             return None
     
-    def get_messages(self, account_id, mailbox_id):
+    def get_messages(self, account_id, mailbox_id, page=1):
         """
-        获取邮箱中的消息列表
+        获取邮箱中的消息列表（单页，新邮件在前）
         
         Args:
             account_id (str): 账户ID
             mailbox_id (str): 邮箱ID
+            page (int): 页码，从1开始
             
         Returns:
             list: 消息列表或None（失败时）
         """
+        result = self.get_messages_page(account_id, mailbox_id, page)
+        return result[0] if result is not None else None
+    
+    def get_messages_page(self, account_id, mailbox_id, page=1, raise_on_error=False):
+        """
+        获取一页消息，并判断是否还有下一页
+        
+        Args:
+            account_id (str): 账户ID
+            mailbox_id (str): 邮箱ID
+            page (int): 页码，从1开始
+            raise_on_error (bool): 失败时抛出SMTPDevAPIError（账户或邮箱不存在时为MailboxNotFoundError），而不是返回None
+            
+        Returns:
+            tuple: (消息列表, 是否有下一页) 或None（失败时）
+        """
         try:
-            response = self.session.get(
-                f"{self.BASE_URL}/accounts/{account_id}/mailboxes/{mailbox_id}/messages"
+            response = self._request(
+                "messages.list", "GET",
+                f"{self.BASE_URL}/accounts/{account_id}/mailboxes/{mailbox_id}/messages",
+                headers=self.DEFAULT_HEADERS,
+                params={"page": page}
             )
             
             if response.status_code == 200:
-                return response.json()
+                return self.parse_messages_page(response.json())
             else:
                 logger.error(f"获取消息列表失败: {response.status_code}")
+                if raise_on_error and response.status_code == 404:
+                    raise MailboxNotFoundError(f"账户或邮箱不存在: {account_id}/{mailbox_id}")
+                if raise_on_error:
+                    raise SMTPDevAPIError(f"获取消息列表失败: {response.status_code}")
                 return None
                 
         except requests.exceptions.RequestException as e:
             logger.error(f"获取消息列表请求出错: {str(e)}")
+            if raise_on_error:
+                raise SMTPDevAPIError(f"获取消息列表请求出错: {str(e)}")
             return None
     
-    def get_message_detail(self, account_id, mailbox_id, message_id):
+    @classmethod
+    def parse_messages_page(cls, data):
+        """把一页消息列表响应解析为 (消息列表, 是否有下一页)"""
+        if isinstance(data, dict):
+            # JSON-LD格式：根据 view.next 判断是否有下一页
+            return data.get("member", []), bool((data.get("view") or {}).get("next"))
+        # 普通JSON格式只返回列表：满页说明可能还有下一页
+        return data, len(data) >= cls.MESSAGES_PER_PAGE
+    
+    def get_message_detail(self, account_id, mailbox_id, message_id, raise_on_error=False):
         """
         获取消息详情
         
@@ -164,21 +240,58 @@ class SMTPDevAPI:
             account_id (str): 账户ID
             mailbox_id (str): 邮箱ID
             message_id (str): 消息ID
+            raise_on_error (bool): 请求失败时抛出SMTPDevAPIError；邮件不存在（404）时仍返回None
             
         Returns:
             dict: 消息详情或None（失败时）
         """
         try:
-            response = self.session.get(
-                f"{self.BASE_URL}/accounts/{account_id}/mailboxes/{mailbox_id}/messages/{message_id}"
+            response = self._request(
+                "messages.get", "GET",
+                f"{self.BASE_URL}/accounts/{account_id}/mailboxes/{mailbox_id}/messages/{message_id}",
+                headers=self.DEFAULT_HEADERS
             )
             
             if response.status_code == 200:
                 return response.json()
             else:
                 logger.error(f"获取消息详情失败: {response.status_code}")
+                if raise_on_error and response.status_code != 404:
+                    raise SMTPDevAPIError(f"获取消息详情失败: {response.status_code}")
                 return None
                 
         except requests.exceptions.RequestException as e:
             logger.error(f"获取消息详情请求出错: {str(e)}")
-            return None
\ No newline at end of file
+            if raise_on_error:
+                raise SMTPDevAPIError(f"获取消息详情请求出错: {str(e)}")
+            return None
+    
+
+    def open_message_stream(self, account_id, mailbox_id, message_id, part="download",
+                            attachment_id=None, range_header=None):
+        """
+        以流式方式打开邮件原文、EML下载或附件，不把内容读入内存
+        
+        Args:
+            account_id (str): 账户ID
+            mailbox_id (str): 邮箱ID
+            message_id (str): 消息ID
+            part (str): "source"、"download" 或 "attachment"
+            attachment_id (str): 附件ID（part为attachment时必需）
+            range_header (str): 转发给上游的Range请求头
+            
+        Returns:
+            requests.Response: 未读取正文的响应（调用方负责关闭）或None（请求失败时）
+        """
+        path = f"{self.BASE_URL}/accounts/{account_id}/mailboxes/{mailbox_id}/messages/{message_id}"
+        path += f"/attachment/{attachment_id}" if part == "attachment" else f"/{part}"
+        # 要求上游不压缩，字节原样转发，Range偏移才与内容一致
+        headers = dict(self.DEFAULT_HEADERS, **{"Accept": "*/*", "Accept-Encoding": "identity"})
+        if range_header:
+            headers["Range"] = range_header
+        
+        try:
+            return self._request("messages.stream", "GET", path, headers=headers, stream=True)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"打开邮件内容流出错: {str(e)}")
+            return None
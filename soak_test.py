@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+长时间浸泡测试：检查地址和WebSocket会话大量轮换时是否泄漏线程、连接和内存
+在本地SMTP.dev替身上启动服务，持续以新地址建立WebSocket会话、认证、收邮件、发起长轮询，
+然后正常断开或直接丢弃连接（不发送关闭包，由服务端心跳超时清理）。
+
+定期采样服务进程的线程数、打开的socket数、RSS和tracemalloc跟踪的内存，
+预热结束后对各项做线性回归，任意一项的增长斜率超过阈值时以非0状态退出。
+
+各缓存和客户端登记表的上限在浸泡时调小，使其在预热期间就达到稳态，之后的持续增长才是泄漏。
+启用tracemalloc（默认）时定期快照的开销会掩盖RSS的变化，此时不检查RSS斜率；
+需要检查RSS时使用 --no-tracemalloc 再运行一次。
+
+用法:
+    python soak_test.py --duration 1800 --rate 10
+    python soak_test.py --mode eventlet --max-rss-slope 0.5
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import requests
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from bench_async_mode import free_port, process_stats
+from fake_smtp_dev import FakeSMTPDev
+
+API_KEY = "soak_key"
+
+SOAK_SERVER_CODE = """
+import json, threading, time, tracemalloc
+if {trace}:
+    tracemalloc.start()
+import app
+
+def report():
+    time.sleep({warmup})
+    baseline = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+    while True:
+        time.sleep({interval})
+        if baseline is None:
+            continue
+        snapshot = tracemalloc.take_snapshot()
+        top = [str(stat) for stat in snapshot.compare_to(baseline, "lineno")[:8]]
+        print(json.dumps({{"traced": tracemalloc.get_traced_memory()[0], "top": top}}), flush=True)
+
+threading.Thread(target=report, daemon=True).start()
+app.socketio.run(app.app, host="127.0.0.1", port={port}, allow_unsafe_werkzeug=True,
+                 use_reloader=False, log_output=False)
+"""
+
+
+def open_sockets(pid):
+    """进程打开的socket数"""
+    count = 0
+    for fd in os.listdir(f"/proc/{pid}/fd"):
+        try:
+            if os.readlink(f"/proc/{pid}/fd/{fd}").startswith("socket:"):
+                count += 1
+        except OSError:
+            pass
+    return count
+
+
+def slope(samples, key):
+    """最小二乘线性回归的斜率（每分钟）"""
+    points = [(sample["t"], sample[key]) for sample in samples if sample.get(key) is not None]
+    if len(points) < 3:
+        return 0.0
+    mean_t = sum(t for t, _ in points) / len(points)
+    mean_v = sum(v for _, v in points) / len(points)
+    variance = sum((t - mean_t) ** 2 for t, _ in points)
+    if not variance:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in points) / variance * 60
+
+
+def drop(client):
+    """不发送关闭包直接停止客户端，模拟网络中断，服务端只能靠心跳超时发现"""
+    client.eio.state = "disconnected"
+    client.eio.queue.put(None)
+
+
+class Soak:
+    def __init__(self, args):
+        self.args = args
+        self.fake = FakeSMTPDev(api_key=API_KEY, latency=args.upstream_latency, seed=args.seed)
+        self.random = random.Random(args.seed)
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self.samples = []
+        self.traced = None
+        self.top = []
+        self.sessions = 0
+        self.errors = 0
+        self.error_kinds = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._address_ids = iter(range(10 ** 9))
+
+    def start_server(self):
+        args = self.args
+        env = dict(os.environ,
+                   ASYNC_MODE=args.mode,
+                   MAIL_TM_BASE_URL=self.fake.base_url,
+                   MAIL_TM_API_KEY=API_KEY,
+                   MAIL_TM_DOMAIN="fake.test",
+                   DEFAULT_PASSWORD="password",
+                   MERCURE_ENABLED="false",
+                   ACCOUNT_POOL_HIGH="0",
+                   CLIENT_REGISTRY_MAX=str(args.client_max),
+                   CLIENT_IDLE_TTL="60",
+                   CLIENT_TOMBSTONE_MAX=str(args.client_max * 4),
+                   RESOLUTION_CACHE_SIZE=str(args.client_max * 4),
+                   MESSAGE_CACHE_MAX_BYTES=str(1024 * 1024))
+        code = SOAK_SERVER_CODE.format(port=self.port, trace=not args.no_tracemalloc,
+                                       warmup=args.warmup, interval=args.sample_interval)
+        self.server = subprocess.Popen([sys.executable, "-c", code], env=env, stdout=subprocess.PIPE,
+                                       stderr=subprocess.DEVNULL, text=True)
+        threading.Thread(target=self._read_reports, daemon=True).start()
+        for _ in range(150):
+            try:
+                requests.get(f"{self.base_url}/api/monitor/stats", timeout=1)
+                return
+            except requests.exceptions.RequestException:
+                time.sleep(0.2)
+        raise Exception("浸泡测试服务启动失败")
+
+    def _read_reports(self):
+        """读取服务进程定期输出的tracemalloc统计"""
+        for line in self.server.stdout:
+            try:
+                report = json.loads(line)
+            except ValueError:
+                continue
+            self.traced = report["traced"]
+            self.top = report["top"]
+
+    def session(self, address):
+        """一个完整的会话：建立WebSocket、认证、可能收一封邮件、发起一次长轮询，然后断开或丢弃"""
+        import socketio
+
+        client = socketio.Client(reconnection=False)
+        authenticated = threading.Event()
+        received = threading.Event()
+        client.on("auth_response", lambda data: data.get("type") == "auth_success" and authenticated.set())
+        client.on("email_notification", lambda data: received.set())
+
+        client.connect(self.base_url, transports=["polling"], wait_timeout=30)
+        try:
+            client.emit("authenticate", {"email": address})
+            if not authenticated.wait(30):
+                raise Exception(f"WebSocket认证超时: {address}")
+            if self.random.random() < 0.5:
+                self.fake.deliver(address, subject="soak")
+                received.wait(10)
+            if self.random.random() < 0.3:
+                requests.post(f"{self.base_url}/api/emails/wait",
+                              json={"emails": [address], "timeout": 1}, timeout=30)
+        finally:
+            if self.random.random() < self.args.drop_ratio:
+                drop(client)
+            else:
+                client.disconnect()
+
+    def churn(self):
+        """按速率不断以新地址开启会话，直到测试结束；同时进行的会话达到上限时等待"""
+        interval = 1 / self.args.rate
+        slots = threading.BoundedSemaphore(self.args.concurrency)
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as executor:
+            next_at = time.monotonic()
+            while not self._stop.is_set():
+                if not slots.acquire(timeout=1):
+                    next_at = time.monotonic()
+                    continue
+                address = f"soak{next(self._address_ids)}@fake.test"
+                self.fake.create_account(address, "password")
+                executor.submit(self._run_session, address, slots)
+                next_at += interval
+                self._stop.wait(max(0, next_at - time.monotonic()))
+
+    def _run_session(self, address, slots):
+        try:
+            self.session(address)
+            with self._lock:
+                self.sessions += 1
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+                self.error_kinds[f"{type(e).__name__}: {str(e)[:80]}"] += 1
+        finally:
+            slots.release()
+
+    def sample(self, started):
+        threads, rss = process_stats(self.server.pid)
+        sample = {
+            "t": time.monotonic() - started,
+            "threads": threads,
+            "sockets": open_sockets(self.server.pid),
+            "rss_mb": rss / 1024,
+            "traced_mb": self.traced / 1024 / 1024 if self.traced is not None else None,
+        }
+        self.samples.append(sample)
+        return sample
+
+    def run(self):
+        args = self.args
+        self.fake.start()
+        self.start_server()
+        churner = threading.Thread(target=self.churn, daemon=True)
+        started = time.monotonic()
+        churner.start()
+        try:
+            while time.monotonic() - started < args.duration:
+                time.sleep(args.sample_interval)
+                sample = self.sample(started)
+                print(f"t={sample['t']:.0f}s threads={sample['threads']} sockets={sample['sockets']} "
+                      f"rss={sample['rss_mb']:.1f}MB traced={sample['traced_mb'] or 0:.1f}MB "
+                      f"sessions={self.sessions} errors={self.errors}", flush=True)
+        finally:
+            self._stop.set()
+            churner.join()
+            self.server.kill()
+            self.server.wait()
+            self.fake.stop()
+        return self.report()
+
+    def report(self):
+        args = self.args
+        steady = [sample for sample in self.samples if sample["t"] >= args.warmup]
+        limits = {
+            "threads": args.max_thread_slope,
+            "sockets": args.max_socket_slope,
+            "rss_mb": args.max_rss_slope,
+            "traced_mb": args.max_traced_slope,
+        }
+        failures = []
+        print(f"\n会话数: {self.sessions}，失败: {self.errors}，预热后样本数: {len(steady)}")
+        for key, limit in limits.items():
+            value = slope(steady, key)
+            if key == "rss_mb" and not args.no_tracemalloc:
+                # 定期快照本身会占用并碎片化大量内存，此时以tracemalloc跟踪的内存判断泄漏
+                print(f"{key}: 增长斜率 {value:+.3f}/分钟（启用tracemalloc时不检查）")
+                continue
+            status = "超出" if value > limit else "正常"
+            print(f"{key}: 增长斜率 {value:+.3f}/分钟（阈值 {limit}）{status}")
+            if value > limit:
+                failures.append(key)
+        for kind, count in self.error_kinds.most_common(5):
+            print(f"失败 {count} 次: {kind}")
+        if self.top:
+            print("\n预热后tracemalloc增长最多的位置:")
+            for line in self.top:
+                print(f"  {line}")
+        if self.errors > self.sessions * args.max_error_ratio:
+            failures.append("errors")
+        return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="地址和WebSocket会话轮换下的线程/连接/内存泄漏浸泡测试")
+    parser.add_argument("--mode", default="threading", help="服务的并发模式（ASYNC_MODE）")
+    parser.add_argument("--duration", type=float, default=600, help="总时长（秒）")
+    parser.add_argument("--warmup", type=float, default=120, help="预热时长（秒），之后的样本参与斜率计算")
+    parser.add_argument("--rate", type=float, default=5, help="每秒开启的新会话数（每个会话使用新地址）")
+    parser.add_argument("--concurrency", type=int, default=50, help="同时进行的会话数上限")
+    parser.add_argument("--drop-ratio", type=float, default=0.3, help="直接丢弃连接（不发送关闭包）的会话比例")
+    parser.add_argument("--sample-interval", type=float, default=10, help="采样间隔（秒）")
+    parser.add_argument("--client-max", type=int, default=200, help="服务端客户端登记表上限，使其在预热期间达到稳态")
+    parser.add_argument("--upstream-latency", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-tracemalloc", action="store_true", help="不在服务进程中启用tracemalloc")
+    parser.add_argument("--max-thread-slope", type=float, default=0.5, help="线程数增长斜率上限（个/分钟）")
+    parser.add_argument("--max-socket-slope", type=float, default=1, help="socket数增长斜率上限（个/分钟）")
+    parser.add_argument("--max-rss-slope", type=float, default=1, help="RSS增长斜率上限（MB/分钟）")
+    parser.add_argument("--max-traced-slope", type=float, default=0.5, help="tracemalloc内存增长斜率上限（MB/分钟）")
+    parser.add_argument("--max-error-ratio", type=float, default=0.01, help="允许失败的会话比例")
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return Soak(args).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+预创建账户池测试脚本
+"""
+
+import time
+from account_pool import AccountPool
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_refill_between_watermarks():
+    """低于低水位时补充到高水位，取用命中时无需等待"""
+    pool = AccountPool(lambda username: f"client_{username}", low=3, high=8, refill_rate=200)
+    pool.start()
+    assert wait_until(lambda: pool.stats()["depth"] == 8)
+
+    clients = set()
+    for _ in range(6):
+        started = time.monotonic()
+        clients.add(pool.pop())
+        assert time.monotonic() - started < 0.01
+    assert None not in clients and len(clients) == 6  # 每个账户使用不同的用户名
+    assert wait_until(lambda: pool.stats()["depth"] == 8)
+
+    stats = pool.stats()
+    assert stats["hits"] == 6 and stats["hit_rate"] == 1.0
+    print("✓ 账户池在高低水位之间补充")
+
+
+def test_refill_rate_limit():
+    """补充速度不超过refill_rate，池空时返回None"""
+    pool = AccountPool(lambda username: object(), low=1, high=10, refill_rate=20)
+    assert pool.pop() is None  # 首次取用启动补充线程，此时池为空
+    time.sleep(0.26)
+    depth = pool.stats()["depth"]
+    assert 3 <= depth <= 7, depth
+    assert pool.stats()["misses"] == 1
+    print(f"✓ 补充速度受限（0.26秒内补充 {depth} 个）")
+
+
+def test_disabled_pool():
+    pool = AccountPool(lambda username: object(), low=0, high=0)
+    assert pool.pop() is None and pool.stats()["misses"] == 0
+    print("✓ 高水位为0时关闭账户池")
+
+
+if __name__ == "__main__":
+    test_refill_between_watermarks()
+    test_refill_rate_limit()
+    test_disabled_pool()
+    print("全部测试通过")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+自适应轮询与上游请求预算测试脚本
+验证令牌桶限速、429暂停、空闲退避以及截止时间优先的出队顺序
+"""
+
+import time
+from email.utils import formatdate
+from config import Config
+from conftest import start_fake
+from smtp_api import SMTPDevAPI
+from poll_scheduler import PollScheduler, adaptive_interval
+import rate_budget
+from rate_budget import RateBudget, parse_retry_after
+
+
+def test_token_bucket_and_throttle():
+    """令牌桶限制总QPS；429后暂停Retry-After秒并降低速率"""
+    budget = RateBudget(rate=20, burst=5)
+    started = time.monotonic()
+    for _ in range(25):
+        budget.acquire()
+    elapsed = time.monotonic() - started
+    assert 0.9 <= elapsed < 1.6, elapsed
+
+    budget.throttled(0.3)
+    assert budget.delay() >= 0.25
+    assert budget.stats()["rate"] == 10
+
+    assert parse_retry_after("2") == 2
+    assert 3 < parse_retry_after(formatdate(time.time() + 5, usegmt=True)) <= 5
+    assert parse_retry_after("soon") is None
+
+    # 上游返回429时，传输层让后续所有请求等待Retry-After
+    fake = start_fake()
+    rate_budget._budget = RateBudget(rate=0)
+    try:
+        account = fake.create_account("throttle@fake.test", "password")
+        api = SMTPDevAPI()
+        fake.throttle_next = 1
+        fake.throttle_retry_after = "0.4"
+        started = time.monotonic()
+        assert api.get_mailboxes(account["id"])  # 等待Retry-After后自动重试
+        assert time.monotonic() - started >= 0.35
+        started = time.monotonic()
+        assert api.get_mailboxes(account["id"])
+        assert time.monotonic() - started < 0.2
+        assert rate_budget.get_rate_budget().stats()["throttles"] == 1
+        print("✓ 令牌桶限速与429暂停")
+    finally:
+        rate_budget._budget = None
+        fake.stop()
+
+
+def test_idle_backoff():
+    """空闲邮箱指数退避；有等待者时退避上限为POLL_INTERVAL"""
+    saved = (Config.POLL_MIN_INTERVAL, Config.POLL_BACKOFF_FACTOR, Config.POLL_MAX_INTERVAL, Config.POLL_INTERVAL)
+    Config.POLL_MIN_INTERVAL, Config.POLL_BACKOFF_FACTOR, Config.POLL_MAX_INTERVAL, Config.POLL_INTERVAL = 0.05, 2, 0.4, 0.1
+    try:
+        assert [adaptive_interval(i) for i in range(5)] == [0.05, 0.1, 0.2, 0.4, 0.4]
+        assert adaptive_interval(10, waiting=True) == 0.1
+        assert adaptive_interval(10 ** 6) == 0.4
+
+        polls = {"idle": 0, "waiting": 0}
+        scheduler = PollScheduler(interval=0.01, max_workers=2, budget=RateBudget(rate=0),
+                                  deadline_of=lambda key: time.monotonic() + 10 if key == "waiting" else None)
+
+        def make_job(key):
+            def job():
+                polls[key] += 1
+            return job
+
+        for key in polls:
+            scheduler.schedule(key, make_job(key))
+        time.sleep(1.5)
+        for key in polls:
+            scheduler.cancel(key)
+        assert polls["idle"] <= 8, polls
+        assert polls["waiting"] >= 2 * polls["idle"], polls
+        print(f"✓ 空闲退避：1.5秒内空闲邮箱轮询 {polls['idle']} 次，有等待者的邮箱 {polls['waiting']} 次")
+    finally:
+        Config.POLL_MIN_INTERVAL, Config.POLL_BACKOFF_FACTOR, Config.POLL_MAX_INTERVAL, Config.POLL_INTERVAL = saved
+
+
+def test_deadline_priority():
+    """预算不足时，截止时间最近的等待者最先轮询"""
+    budget = RateBudget(rate=5, burst=1)
+    budget.reserve()  # 耗尽令牌，使所有任务在调度器中排队
+    now = time.monotonic()
+    deadlines = {"urgent": now + 5, "later": now + 30}
+    order = []
+    scheduler = PollScheduler(interval=0.01, max_workers=1, budget=budget, deadline_of=deadlines.get)
+
+    def make_job(key):
+        def job():
+            budget.reserve()  # 模拟一次上游请求
+            order.append(key)
+            return 100
+        return job
+
+    keys = ["a", "b", "later", "urgent", "c"]
+    for key in keys:
+        scheduler.schedule(key, make_job(key))
+        scheduler.trigger(key)
+    deadline = time.monotonic() + 5
+    while len(order) < len(keys) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    for key in keys:
+        scheduler.cancel(key)
+    assert order == ["urgent", "later", "a", "b", "c"], order
+    assert scheduler.stats()["deferred"] > 0
+    print("✓ 截止时间优先")
+
+
+if __name__ == "__main__":
+    test_token_bucket_and_throttle()
+    test_idle_backoff()
+    test_deadline_priority()
+    print("全部测试通过")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+异步客户端测试脚本
+使用本地SMTP.dev替身（fake_smtp_dev.py），验证 AsyncSMTPDevAPI / AsyncMailTmClient
+"""
+
+import asyncio
+import time
+from config import Config
+from conftest import start_fake
+from async_smtp_api import AsyncSMTPDevAPI
+from async_mail_client import AsyncMailTmClient
+
+
+def test_api_endpoints():
+    """异步API覆盖全部核心接口"""
+    fake = start_fake()
+
+    async def run():
+        async with AsyncSMTPDevAPI() as api:
+            account = await api.create_account("alice@fake.test", "password")
+            assert account["address"] == "alice@fake.test"
+            assert await api.create_account("alice@fake.test", "password") is None
+
+            found = await api.get_account_by_email("alice@fake.test")
+            assert found["id"] == account["id"]
+            assert await api.get_account_by_email("nobody@fake.test") is None
+
+            mailboxes = await api.get_mailboxes(account["id"])
+            inbox = next(m for m in mailboxes if m["path"] == "INBOX")
+            sent = fake.deliver("alice@fake.test", subject="hello")
+            messages = await api.get_messages(account["id"], inbox["id"])
+            assert [m["id"] for m in messages] == [sent["id"]]
+            detail = await api.get_message_detail(account["id"], inbox["id"], sent["id"])
+            assert detail["html"] == ["<p>hello</p>"]
+
+    try:
+        asyncio.run(run())
+        print("✓ 异步API接口")
+    finally:
+        fake.stop()
+
+
+def test_concurrent_wait_for_message():
+    """单个事件循环并发等待多个邮箱"""
+    fake = start_fake()
+    count = 50
+
+    async def run():
+        async with AsyncSMTPDevAPI() as api:
+            clients = await asyncio.gather(*[
+                AsyncMailTmClient.create(username=f"user{i}", api=api) for i in range(count)
+            ])
+            # 已存在的邮件不应被当作新邮件
+            fake.deliver(clients[0].email, subject="old")
+            existing = await AsyncMailTmClient.create(email=clients[0].email, api=api)
+            assert existing.cursor.watermark and await existing.get_latest_message() is None
+
+            original_interval = Config.POLL_INTERVAL
+            Config.POLL_INTERVAL = 0.1
+            try:
+                waits = [asyncio.ensure_future(c.wait_for_message(5)) for c in clients[1:]]
+                await asyncio.sleep(0.2)
+                for client in clients[1:]:
+                    fake.deliver(client.email, subject=f"to {client.email}")
+                started = time.monotonic()
+                results = await asyncio.gather(*waits)
+                elapsed = time.monotonic() - started
+            finally:
+                Config.POLL_INTERVAL = original_interval
+
+            assert all(r and r["subject"] == f"to {c.email}" for r, c in zip(results, clients[1:]))
+            print(f"✓ {count - 1} 个邮箱并发等待完成，用时 {elapsed:.2f} 秒")
+
+    try:
+        asyncio.run(run())
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    test_api_endpoints()
+    test_concurrent_wait_for_message()
+    print("全部测试通过")
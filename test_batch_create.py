@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+批量创建账户测试脚本
+使用本地SMTP.dev替身（fake_smtp_dev.py），验证 POST /api/emails/batch
+"""
+
+import threading
+import time
+from conftest import start_fake
+from batch_provisioner import BatchProvisioner
+
+
+def test_retry_and_bounded_concurrency():
+    """失败项重试，且同时进行的创建数不超过并发上限"""
+    lock = threading.Lock()
+    state = {"calls": 0, "active": 0, "peak": 0}
+
+    def factory(username):
+        with lock:
+            state["calls"] += 1
+            call = state["calls"]
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        try:
+            time.sleep(0.05)
+            if call <= 3:  # 最先开始的3个账户各失败一次
+                raise Exception("用户名已被使用")
+            return f"client_{username}"
+        finally:
+            with lock:
+                state["active"] -= 1
+
+    provisioner = BatchProvisioner(factory, concurrency=4, retries=2, retry_delay=0.01)
+    started = time.monotonic()
+    results = provisioner.provision(40)
+    elapsed = time.monotonic() - started
+
+    assert all(client is not None for client, _, _ in results)
+    assert len({client for client, _, _ in results}) == 40
+    assert any(attempts > 1 for _, _, attempts in results)
+    assert state["peak"] <= 4
+    assert provisioner.stats()["created"] == 40
+    print(f"✓ 40个账户创建完成（并发4），用时 {elapsed:.2f} 秒")
+
+
+def test_batch_endpoint():
+    """批量接口逐项返回结果，创建的邮箱可直接使用"""
+    fake = start_fake()
+    try:
+        from app import app, email_clients
+        http = app.test_client()
+
+        assert http.post('/api/emails/batch', json={"count": 0}).status_code == 400
+        response = http.post('/api/emails/batch', json={"count": 25})
+        data = response.get_json()
+        assert response.status_code == 200 and data["created"] == 25, data
+        emails = [item["email"] for item in data["results"]]
+        assert len(set(emails)) == 25
+        assert all(email in email_clients for email in emails)
+        print("✓ 批量接口创建25个邮箱")
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    test_retry_and_bounded_concurrency()
+    test_batch_endpoint()
+    print("全部测试通过")
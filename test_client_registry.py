@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+客户端登记表测试脚本
+验证同一地址的初始化只执行一次、不同地址并行初始化，容量淘汰时不淘汰刚登记和已固定的客户端，以及取得客户端时原子固定
+"""
+
+import threading
+import time
+from client_registry import ClientRegistry
+
+
+class StubClient:
+    """只保存地址和状态的客户端，不访问上游"""
+
+    def __init__(self, email, state=None):
+        self.email = email
+        self.state = state
+
+    def export_state(self):
+        return ("acc", "mbx", "", (), ())
+
+
+def test_single_flight():
+    """同一地址的并发请求只初始化一次，不同地址并行初始化，初始化期间不阻塞其他地址"""
+    calls = []
+    lock = threading.Lock()
+
+    def slow_factory(email, state):
+        with lock:
+            calls.append(email)
+        time.sleep(0.2)
+        return StubClient(email, state)
+
+    registry = ClientRegistry(slow_factory, max_entries=100)
+    registry.put("ready@fake.test", StubClient("ready@fake.test"))
+    results = []
+    emails = ["same@fake.test"] * 10 + [f"other{i}@fake.test" for i in range(5)]
+    threads = [threading.Thread(target=lambda e=email: results.append(registry.get_or_create(e))) for email in emails]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    # 初始化进行中时，已登记的地址照常立即返回
+    assert registry.get("ready@fake.test") is not None
+    assert time.monotonic() - started < 0.1
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    assert calls.count("same@fake.test") == 1 and len(calls) == 6
+    assert len({id(client) for client in results if client.email == "same@fake.test"}) == 1
+    assert elapsed < 0.6, elapsed  # 6个地址并行初始化，而不是串行的1.2秒
+
+    attempts = []
+
+    def failing_factory(email, state):
+        attempts.append(email)
+        time.sleep(0.1)
+        raise Exception("上游故障")
+
+    errors = []
+
+    def request():
+        try:
+            registry.get_or_create("bad@fake.test", factory=failing_factory)
+        except Exception as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=request) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 失败也只尝试一次，异常交给所有合并进来的请求；失败结果不缓存，下次请求重新初始化
+    assert attempts == ["bad@fake.test"] and errors == ["上游故障"] * 5
+    request()
+    assert len(attempts) == 2 and "bad@fake.test" not in registry
+    print(f"✓ 单飞初始化：15 个请求 6 次初始化，用时 {elapsed:.2f} 秒")
+
+
+def test_new_entry_survives_when_all_pinned():
+    """其余条目都被固定时，刚登记的客户端不会被立即淘汰"""
+    registry = ClientRegistry(StubClient, max_entries=2)
+    for email in ("a@fake.test", "b@fake.test"):
+        registry.get_or_create(email, pin=True)
+
+    client = registry.get_or_create("c@fake.test")
+    assert registry.get("c@fake.test") is client
+    assert registry.stats()["size"] == 3
+
+    # 解除固定时按LRU淘汰超额部分（解除固定也算一次使用）
+    registry.unpin("a@fake.test")
+    assert registry.stats()["size"] == 2 and "c@fake.test" not in registry
+    print("✓ 全部条目被固定时保留刚登记的客户端")
+
+
+def test_pin_on_get_or_create():
+    """pin=True 取得的客户端在解除固定前不会被淘汰，包括合并到进行中初始化的请求"""
+    started = threading.Event()
+
+    def slow_factory(email, state):
+        started.set()
+        time.sleep(0.1)
+        return StubClient(email, state)
+
+    registry = ClientRegistry(slow_factory, max_entries=1)
+    results = []
+    follower = threading.Thread(target=lambda: (started.wait(), results.append(
+        registry.get_or_create("slow@fake.test", pin=True))))
+    follower.start()
+    leader = registry.get_or_create("slow@fake.test", pin=True)
+    follower.join()
+    assert results == [leader]
+
+    # 两个请求各持有一次固定，新地址挤不掉它
+    registry.get_or_create("other@fake.test")
+    registry.unpin("slow@fake.test")
+    registry.get_or_create("third@fake.test")
+    assert registry.get("slow@fake.test") is leader
+    registry.unpin("slow@fake.test")
+    registry.get_or_create("fourth@fake.test")
+    assert "slow@fake.test" not in registry
+
+    def failing(client):
+        raise Exception("初始化失败")
+
+    try:
+        registry.get_or_create("bad@fake.test", prepare=failing, pin=True)
+        raise AssertionError("应抛出初始化异常")
+    except Exception as e:
+        assert str(e) == "初始化失败"
+    assert "bad@fake.test" not in registry and registry.stats()["pinned"] == 0
+    print("✓ 取得客户端时原子固定")
+
+
+if __name__ == "__main__":
+    test_single_flight()
+    test_new_entry_survives_when_all_pinned()
+    test_pin_on_get_or_create()
+    print("全部测试通过")
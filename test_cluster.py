@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+多worker集群协调测试脚本
+使用本地SMTP.dev替身（fake_smtp_dev.py）和进程内共享存储替身，模拟两个worker
+"""
+
+import time
+from config import Config
+from conftest import start_fake
+from mail_client import MailTmClient
+from waiters import WaiterRegistry
+from cluster import ClusterCoordinator, MemoryStateStore
+
+
+def make_workers(store, count=2):
+    return [ClusterCoordinator(WaiterRegistry(), store=store, lease_ttl=0.3, worker_id=f"worker-{i}")
+            for i in range(count)]
+
+
+def test_single_poller_and_handoff():
+    """同一邮箱只有一个worker持有租约；接管者从共享游标继续，不重复也不遗漏"""
+    fake = start_fake()
+    try:
+        fake.create_account("lease@fake.test", "password")
+        fake.deliver("lease@fake.test", subject="old")
+        store = MemoryStateStore()
+        first, second = make_workers(store)
+        client_a = MailTmClient(email="lease@fake.test")
+        client_b = MailTmClient(email="lease@fake.test")
+
+        assert first.acquire("lease@fake.test", client_a)
+        assert not second.acquire("lease@fake.test", client_b)
+
+        fake.deliver("lease@fake.test", subject="first")
+        # B的客户端也会把这封当作新邮件，但它没有租约，不会访问上游
+        assert client_a.get_latest_message()["subject"] == "first"
+        first.save("lease@fake.test", client_a)
+
+        # 持有者续期正常时租约不会过期
+        time.sleep(0.5)
+        assert not second.acquire("lease@fake.test", client_b)
+
+        first.release("lease@fake.test")
+        fake.deliver("lease@fake.test", subject="second")
+        assert second.acquire("lease@fake.test", client_b)
+        assert client_b.get_latest_message()["subject"] == "second"
+        assert client_b.get_latest_message() is None
+        assert second.stats()["handoffs"] == 1
+
+        # 持有者失联（不再续期）时租约过期后被接管
+        second.release("lease@fake.test")
+        store.acquire_lease(f"{Config.CLUSTER_KEY_PREFIX}lease:lease@fake.test", "crashed-worker", 0.2)
+        assert not first.acquire("lease@fake.test", client_a)
+        time.sleep(0.3)
+        assert first.acquire("lease@fake.test", client_a)
+        print("✓ 单一轮询者与游标交接")
+
+        # 轮询进行中租约过期并被接管：旧持有者放弃结果，邮件只由接管者交付一次
+        while client_a.get_latest_message():
+            pass
+        first.save("lease@fake.test", client_a)
+        fake.deliver("lease@fake.test", subject="in-flight")
+        assert client_a.get_latest_message()["subject"] == "in-flight"
+        store.release_lease(f"{Config.CLUSTER_KEY_PREFIX}lease:lease@fake.test", "worker-0")
+        assert second.acquire("lease@fake.test", client_b)
+        assert not first.confirm("lease@fake.test")
+        assert client_b.get_latest_message()["subject"] == "in-flight"
+        assert second.confirm("lease@fake.test")
+        assert first.stats()["lost"] == 1 and second.stats()["handoffs"] == 2
+        print("✓ 租约在轮询期间被接管时不重复分发")
+    finally:
+        fake.stop()
+
+
+def test_cross_worker_delivery():
+    """新邮件交给其他worker上的等待者；共享暂存中的邮件只交付一次"""
+    store = MemoryStateStore()
+    holder, other = make_workers(store)
+
+    waiter = other.waiters.register("x@fake.test")
+    holder.dispatch("x@fake.test", {"id": "m1"}, monitored=False)
+    assert other.waiters.wait(waiter, 1) == {"id": "m1"}
+
+    # 暂无等待者时放入共享暂存，之后任意worker的第一个请求取走
+    holder.dispatch("x@fake.test", {"id": "m2"}, monitored=False)
+    waiters = [(worker, worker.waiters.register("x@fake.test")) for worker in (other, holder)]
+    for worker, _ in waiters:
+        worker.drain("x@fake.test")
+    received = [worker.waiters.wait(w, 0.1) for worker, w in waiters]
+    assert received == [{"id": "m2"}, None]
+
+    # 已有WebSocket订阅者时只交给此刻的等待者，不暂存
+    holder.dispatch("x@fake.test", {"id": "m3"}, monitored=True)
+    waiter = other.waiters.register("x@fake.test")
+    other.drain("x@fake.test")
+    assert other.waiters.wait(waiter, 0.1) is None
+
+    # 多个worker同时有等待者时，有WebSocket订阅者的邮件也只交给其中一个
+    third = make_workers(store, 3)[2]
+    waiters = [(worker, worker.waiters.register("y@fake.test")) for worker in (other, third)]
+    holder.dispatch("y@fake.test", {"id": "m4"}, monitored=True)
+    received = [worker.waiters.wait(w, 0.1) for worker, w in waiters]
+    assert sorted(received, key=bool) == [None, {"id": "m4"}], received
+
+    other.add_monitor("x@fake.test")
+    assert holder.is_monitored("x@fake.test")
+    other.remove_monitor("x@fake.test")
+    assert not holder.is_monitored("x@fake.test")
+
+    # 同一邮箱的新监控先于旧监控停止时（在全局锁外交错），登记仍然保留
+    other.add_monitor("x@fake.test")
+    other.add_monitor("x@fake.test")
+    other.remove_monitor("x@fake.test")
+    assert holder.is_monitored("x@fake.test")
+    other.remove_monitor("x@fake.test")
+    assert not holder.is_monitored("x@fake.test")
+    print("✓ 跨worker分发")
+
+
+if __name__ == "__main__":
+    test_single_poller_and_handoff()
+    test_cross_worker_delivery()
+    print("全部测试通过")
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+并发模式选择测试脚本
+在子进程中验证猴子补丁先于项目模块导入，以及缺少依赖或模式无效时给出明确错误（无需真实服务）
+"""
+
+import importlib.util
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PATCH_FIRST_CODE = """
+import sys
+import concurrency
+assert not {"config", "dotenv", "logging", "requests", "loguru"} & set(sys.modules), sorted(sys.modules)
+assert concurrency.setup_async_mode() == "eventlet" and concurrency.is_cooperative()
+import eventlet.patcher
+assert eventlet.patcher.is_monkey_patched("socket") and eventlet.patcher.is_monkey_patched("thread")
+from config import Config
+assert Config.ASYNC_MODE == "eventlet"
+"""
+
+
+def run(code, mode):
+    env = dict(os.environ, ASYNC_MODE=mode)
+    return subprocess.run([sys.executable, "-c", code], cwd=HERE, env=env, capture_output=True, text=True, timeout=60)
+
+
+def test_patch_before_project_imports():
+    """导入concurrency不会带入config/dotenv等模块，打补丁之后才导入"""
+    result = run(PATCH_FIRST_CODE, "eventlet")
+    assert result.returncode == 0, result.stderr
+    print("✓ 猴子补丁先于项目模块导入")
+
+
+def test_gevent_and_invalid_mode():
+    """gevent未安装时给出安装提示；无效模式直接报错"""
+    code = "import concurrency; print(concurrency.setup_async_mode())"
+    result = run(code, "gevent")
+    if importlib.util.find_spec("gevent") is None:
+        assert result.returncode != 0 and "需要先安装 gevent" in result.stderr, result.stderr
+        print("✓ 未安装gevent时给出明确错误")
+    else:
+        assert result.returncode == 0 and result.stdout.strip() == "gevent", result.stderr
+        print("✓ gevent模式打补丁")
+
+    result = run(code, "bogus")
+    assert result.returncode != 0 and "不支持的并发模式" in result.stderr
+    assert run(code, "threading").stdout.strip() == "threading"
+    print("✓ 无效模式报错")
+
+
+if __name__ == "__main__":
+    test_patch_before_project_imports()
+    test_gevent_and_invalid_mode()
+    print("全部测试通过")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+投递状态持久化测试脚本
+使用本地SMTP.dev替身（fake_smtp_dev.py），验证批量写入、组提交，以及重启后不重新列出收件箱、不重复也不遗漏邮件
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from conftest import start_fake
+from mail_client import MailTmClient
+from client_registry import ClientRegistry
+from delivery_store import DeliveryStore
+
+
+def temp_path():
+    return os.path.join(tempfile.mkdtemp(), "delivery.db")
+
+
+def test_batched_and_group_commit():
+    """普通写入合并到一个事务；并发交付共用事务，且返回时已经提交"""
+    path = temp_path()
+    store = DeliveryStore(path, flush_interval=0.2)
+    for i in range(100):
+        store.save(f"user{i}@fake.test", ("acc", "mbx", f"2024-01-01T00:00:{i % 60:02d}", ("m1",), ()))
+    time.sleep(0.5)
+    stats = store.stats()
+    assert stats["rows"] == 100 and stats["flushes"] == 1, stats
+
+    def deliver(i):
+        store.save(f"user{i}@fake.test", ("acc", "mbx", "2024-01-02T00:00:00", ("m2",), ()), wait=True)
+        assert DeliveryStore(path).load(f"user{i}@fake.test")[3] == ("m2",)
+
+    threads = [threading.Thread(target=deliver, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    flushes = store.stats()["flushes"] - 1
+    assert 1 <= flushes < 20, flushes
+    print(f"✓ 100个状态批量写入1个事务，20个并发交付共用 {flushes} 个事务")
+
+
+EVENTLET_CODE = """
+from concurrency import setup_async_mode
+setup_async_mode()
+import sys, threading
+from delivery_store import DeliveryStore
+
+store = DeliveryStore(sys.argv[1], flush_interval=0.2)
+threads = [threading.Thread(target=store.save, args=(f"user{i}@fake.test", ("acc", "mbx", "", (), ())),
+                            kwargs={"wait": True}) for i in range(20)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+print(store.stats()["rows"])
+"""
+
+
+def test_group_commit_eventlet():
+    """eventlet下等待提交的交付能得到调度，后台线程不空转阻塞整个进程"""
+    env = dict(os.environ, ASYNC_MODE="eventlet")
+    result = subprocess.run([sys.executable, "-c", EVENTLET_CODE, temp_path()], env=env, capture_output=True,
+                            text=True, timeout=30, cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert result.stdout.split()[-1] == "20", result.stdout
+    print("✓ eventlet下20个并发交付全部提交")
+
+
+def test_prune():
+    """超过ttl未更新的状态被清理"""
+    store = DeliveryStore(temp_path(), ttl=0.1)
+    store.save("old@fake.test", ("acc", "mbx", "", (), ()))
+    store.flush()
+    time.sleep(0.2)
+    store.save("new@fake.test", ("acc", "mbx", "", (), ()))
+    store.flush()
+    assert store.prune() == 1
+    assert store.load("old@fake.test") is None and store.load("new@fake.test") is not None
+    print("✓ 过期状态清理")
+
+
+def test_restart_resumes_without_relisting():
+    """重启后直接恢复客户端：不访问上游，停机期间的新邮件照常交付，已交付的不再交付"""
+    fake = start_fake()
+    path = temp_path()
+    factory = lambda email, state: MailTmClient(email=email, state=state)
+    try:
+        email = "restart@fake.test"
+        fake.create_account(email, "password")
+        fake.deliver(email, subject="旧邮件")
+
+        store = DeliveryStore(path)
+        client = ClientRegistry(factory, store=store).get_or_create(email, prepare=MailTmClient.hydrate)
+        fake.deliver(email, subject="已交付")
+        message = client.get_latest_message()
+        assert message["subject"] == "已交付"
+        store.save(email, client.export_state(), wait=True)
+
+        # 模拟进程重启：新的存储实例和登记表，停机期间又到达一封
+        fake.deliver(email, subject="停机期间")
+        requests_before = fake.request_count
+        registry = ClientRegistry(factory, store=DeliveryStore(path))
+        client = registry.get_or_create(email)
+        assert fake.request_count == requests_before  # 恢复时没有查找账户或列出收件箱
+        assert registry.stats()["rehydrations"] == 1
+
+        message = client.get_latest_message()
+        assert message["subject"] == "停机期间", message["subject"]
+        assert client.get_latest_message() is None
+        print("✓ 重启后从本地状态恢复，停机期间的邮件只交付一次")
+    finally:
+        fake.stop()
+
+
+def test_commit_after_delivery():
+    """共享轮询先交付再提交；交付后、提交前崩溃时重启会再交付一次，不会丢失"""
+    fake = start_fake()
+    path = temp_path()
+    factory = lambda email, state: MailTmClient(email=email, state=state)
+    try:
+        import app as server
+        email = "ack@fake.test"
+        fake.create_account(email, "password")
+        store = DeliveryStore(path)
+        client = ClientRegistry(factory, store=store).get_or_create(email, prepare=MailTmClient.hydrate)
+        store.save(email, client.export_state(), wait=True)
+
+        # 交付后、提交前崩溃：状态未提交，重启后同一封邮件再交付一次
+        fake.deliver(email, subject="未提交")
+        assert client.get_latest_message()["subject"] == "未提交"
+        restarted = ClientRegistry(factory, store=DeliveryStore(path)).get_or_create(email)
+        assert restarted.get_latest_message()["subject"] == "未提交"
+
+        # 服务的共享轮询：等待者先收到邮件，之后才提交推进后的状态
+        events = []
+        server_store = DeliveryStore(path)
+        save = server_store.save
+        server_store.save = lambda key, state, wait=False: (events.append("commit"), save(key, state, wait))[1]
+        deliver = server.waiter_registry.deliver
+        server.waiter_registry.deliver = lambda *args, **kwargs: (events.append("deliver"), deliver(*args, **kwargs))[1]
+        original_store = server.delivery_store
+        server.delivery_store = server_store
+        try:
+            fake.deliver(email, subject="轮询")
+            server.email_clients.put(email, restarted)
+            assert server._poll_mailbox(email) == 0
+        finally:
+            server.delivery_store = original_store
+            del server.waiter_registry.deliver
+        assert events == ["deliver", "commit"], events
+        assert DeliveryStore(path).load(email)[4] == ()
+        print("✓ 交付后提交，崩溃时至少交付一次")
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    test_batched_and_group_commit()
+    test_group_commit_eventlet()
+    test_prune()
+    test_restart_resumes_without_relisting()
+    test_commit_after_delivery()
+    print("全部测试通过")
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+本地SMTP.dev替身与压测套件测试脚本
+验证替身的JSON-LD分页响应、延迟、故障率和新邮件到达速率配置，以及压测结果与基线的比较
+"""
+
+import time
+import requests
+from fake_smtp_dev import FakeSMTPDev
+from smtp_api import SMTPDevAPI
+from bench_suite import compare, param_mismatch, percentile, sent_latency
+
+
+def test_collection_pagination():
+    """集合接口与上游一样返回JSON-LD，有下一页时 view.next 指向它"""
+    fake = FakeSMTPDev().start()
+    try:
+        account = fake.create_account("page@fake.test")
+        for i in range(FakeSMTPDev.PAGE_SIZE + 5):
+            fake.deliver("page@fake.test", subject=f"m{i}")
+        session = requests.Session()
+        mailboxes = session.get(f"{fake.base_url}/accounts/{account['id']}/mailboxes").json()
+        assert mailboxes["totalItems"] == len(mailboxes["member"]) and "next" not in mailboxes["view"]
+        inbox = next(m for m in mailboxes["member"] if m["path"] == "INBOX")
+
+        url = f"{fake.base_url}/accounts/{account['id']}/mailboxes/{inbox['id']}/messages"
+        first, second = (session.get(url, params={"page": page}).json() for page in (1, 2))
+        assert first["totalItems"] == FakeSMTPDev.PAGE_SIZE + 5
+        assert SMTPDevAPI.parse_messages_page(first)[1] and first["view"]["next"].endswith("page=2")
+        messages, has_next = SMTPDevAPI.parse_messages_page(second)
+        assert len(messages) == 5 and not has_next
+        assert first["member"][0]["subject"] == f"m{FakeSMTPDev.PAGE_SIZE + 4}"  # 新邮件在前
+        print("✓ JSON-LD集合与 view.next 分页")
+    finally:
+        fake.stop()
+
+
+def test_latency_and_error_rate():
+    """每个请求按配置延迟，并按故障率随机返回503"""
+    fake = FakeSMTPDev(latency=0.05, error_rate=0.5, seed=7).start()
+    try:
+        session = requests.Session()
+        statuses = []
+        started = time.monotonic()
+        for _ in range(20):
+            statuses.append(session.get(f"{fake.base_url}/accounts").status_code)
+        elapsed = time.monotonic() - started
+        assert elapsed >= 20 * 0.05, elapsed
+        assert 3 <= statuses.count(503) <= 17, statuses
+        assert set(statuses) == {200, 503}
+        print(f"✓ 延迟与故障率：20个请求耗时 {elapsed:.2f} 秒，{statuses.count(503)} 个失败")
+    finally:
+        fake.stop()
+
+
+def test_arrivals():
+    """按到达速率向指定账户投递带投递时间的新邮件"""
+    fake = FakeSMTPDev(seed=3).start()
+    try:
+        addresses = ["a@fake.test", "b@fake.test"]
+        for address in addresses:
+            fake.create_account(address)
+        fake.create_account("other@fake.test")
+        fake.start_arrivals(50, addresses)
+        time.sleep(1)
+        fake.stop_arrivals()
+        count = fake.arrivals
+        time.sleep(0.2)
+        assert fake.arrivals == count
+        assert 25 <= count <= 90, count
+
+        inboxes = {address: fake.mailboxes[fake.addresses[address]][0]["id"] for address in addresses + ["other@fake.test"]}
+        delivered = [message for address in addresses for message in fake.messages[inboxes[address]]]
+        assert len(delivered) == count
+        assert not fake.messages[inboxes["other@fake.test"]]
+        assert 0 <= sent_latency(delivered[-1]["html"][0]) < 2
+        print(f"✓ 新邮件到达：1秒内投递 {count} 封")
+    finally:
+        fake.stop()
+
+
+def test_baseline_compare():
+    """超出容差且超过绝对差值的变差才算回退"""
+    assert percentile([5, 1, 3, 2, 4], 50) == 3
+    assert percentile(list(range(1, 101)), 99) == 99
+    baseline = {"create": {"throughput": 100, "p99_ms": 300, "threads": 20}}
+    assert compare({"create": {"throughput": 90, "p99_ms": 340, "threads": 25}}, baseline, 0.25) == []
+    regressions = compare({"create": {"throughput": 70, "p99_ms": 500, "threads": 26}}, baseline, 0.25)
+    assert [line.split(":")[0] for line in regressions] == ["create.throughput", "create.p99_ms"]
+    params = {"pollers": 200, "duration": 10}
+    assert param_mismatch(params, dict(params)) == []
+    assert param_mismatch(dict(params, pollers=50), params) == ["pollers: 50 (基线 200)"]
+    assert param_mismatch(params, dict(params, startup_runs=5)) == ["startup_runs: None (基线 5)"]
+    print("✓ 基线比较")
+
+
+if __name__ == "__main__":
+    test_collection_pagination()
+    test_latency_and_error_rate()
+    test_arrivals()
+    test_baseline_compare()
+    print("全部测试通过")
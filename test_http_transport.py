@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+共享HTTP传输层测试脚本
+使用本地SMTP.dev替身（fake_smtp_dev.py），验证所有API实例共用一个连接池、keep-alive复用连接、
+连接池饱和统计以及真实生效的读取超时
+"""
+
+import threading
+import time
+import requests
+from conftest import start_fake
+from smtp_api import SMTPDevAPI
+from http_transport import HTTPTransport, get_transport
+import rate_budget
+from rate_budget import RateBudget
+
+
+def test_shared_transport():
+    """每个SMTPDevAPI实例都使用进程共享的传输层，而不是各自的Session"""
+    first, second = SMTPDevAPI(), SMTPDevAPI()
+    assert first.transport is second.transport is get_transport()
+    print("✓ API实例共用传输层")
+
+
+def test_keepalive_and_saturation():
+    """顺序请求复用同一个连接；并发超过连接池大小时排队等待并计入饱和统计"""
+    fake = start_fake(latency=0.05)
+    rate_budget._budget = RateBudget(rate=0)
+    try:
+        transport = HTTPTransport(pool_maxsize=2, pool_block=True)
+        url = f"{fake.base_url}/accounts"
+        for _ in range(10):
+            assert transport.get(url, headers=SMTPDevAPI.DEFAULT_HEADERS).status_code == 200
+        assert transport.stats()["connections_created"] == 1
+
+        threads = [threading.Thread(target=transport.get, args=(url,),
+                                    kwargs={"headers": SMTPDevAPI.DEFAULT_HEADERS}) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = transport.stats()
+        assert stats["connections_created"] <= 2, stats
+        assert stats["saturated"] > 0 and stats["peak_in_flight"] > 2
+        assert stats["requests"] == 18 and stats["in_flight"] == 0 and stats["errors"] == 0
+        print(f"✓ 18 个请求共建立 {stats['connections_created']} 个连接")
+    finally:
+        rate_budget._budget = None
+        fake.stop()
+
+
+def test_read_timeout():
+    """每次请求带上 (连接超时, 读取超时)，上游过慢时按读取超时失败"""
+    fake = start_fake(latency=1.0)
+    rate_budget._budget = RateBudget(rate=0)
+    try:
+        transport = HTTPTransport(connect_timeout=1, read_timeout=0.2)
+        assert transport.timeout == (1, 0.2)
+        started = time.monotonic()
+        try:
+            transport.get(f"{fake.base_url}/accounts", headers=SMTPDevAPI.DEFAULT_HEADERS)
+            raise AssertionError("应按读取超时失败")
+        except requests.exceptions.ReadTimeout:
+            pass
+        assert time.monotonic() - started < 0.8
+        assert transport.stats()["errors"] == 1
+        print("✓ 读取超时生效")
+    finally:
+        rate_budget._budget = None
+        fake.stop()
+
+
+if __name__ == "__main__":
+    test_shared_transport()
+    test_keepalive_and_saturation()
+    test_read_timeout()
+    print("全部测试通过")
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+增量邮件列表测试脚本
+使用本地SMTP.dev替身（fake_smtp_dev.py），验证分页水位线扫描，以及按地址的客户端延迟初始化
+"""
+
+import threading
+import time
+from config import Config
+from conftest import start_fake
+from smtp_api import MailboxNotFoundError
+from mail_client import MailTmClient
+from client_registry import ClientRegistry
+
+
+def test_burst_across_pages():
+    """一次到达超过一页的新邮件不会丢失，并按到达顺序返回"""
+    fake = start_fake()
+    try:
+        client = MailTmClient(username="burst")
+        for i in range(75):
+            fake.deliver(client.email, subject=f"m{i}")
+
+        subjects = []
+        while True:
+            message = client.get_latest_message()
+            if not message:
+                break
+            subjects.append(message["subject"])
+        assert subjects == [f"m{i}" for i in range(75)]
+        print("✓ 跨页新邮件全部取回")
+    finally:
+        fake.stop()
+
+
+def test_constant_poll_cost():
+    """邮箱很大时，无新邮件的轮询只请求第一页"""
+    fake = start_fake()
+    try:
+        client = MailTmClient(username="large")
+        for i in range(200):
+            fake.deliver(client.email, subject=f"old{i}")
+        existing = MailTmClient(email=client.email)
+        assert existing.get_latest_message() is None
+
+        before = fake.request_count
+        for _ in range(5):
+            assert existing.get_latest_message() is None
+        assert fake.request_count - before == 5
+
+        fake.deliver(client.email, subject="new")
+        assert existing.get_latest_message()["subject"] == "new"
+        assert len(existing.cursor.recent_ids) <= Config.MESSAGE_RECENT_IDS
+        print("✓ 轮询开销与邮箱大小无关")
+    finally:
+        fake.stop()
+
+
+def test_export_state_roundtrip():
+    """导出状态恢复后既不重复也不遗漏"""
+    fake = start_fake()
+    try:
+        client = MailTmClient(username="state")
+        fake.deliver(client.email, subject="a")
+        fake.deliver(client.email, subject="b")
+        assert client.get_latest_message()["subject"] == "a"
+
+        restored = MailTmClient(email=client.email, state=client.export_state())
+        fake.deliver(client.email, subject="c")
+        assert restored.get_latest_message()["subject"] == "b"
+        assert restored.get_latest_message()["subject"] == "c"
+        assert restored.get_latest_message() is None
+        print("✓ 状态导出与恢复")
+    finally:
+        fake.stop()
+
+
+def test_export_during_polling():
+    """轮询线程取邮件时并发导出状态：不抛异常，导出的状态中越过水位线的新邮件都在待取队列里或已交付"""
+    fake = start_fake()
+    try:
+        client = MailTmClient(username="export")
+        client.hydrate()
+        new_ids = {fake.deliver(client.email, subject=f"m{i}")["id"] for i in range(60)}
+        delivered = set()
+        done = threading.Event()
+
+        def poll():
+            try:
+                while True:
+                    message = client.get_latest_message()
+                    if not message:
+                        break
+                    delivered.add(message["id"])
+            finally:
+                done.set()
+
+        worker = threading.Thread(target=poll)
+        worker.start()
+        snapshots = 0
+        while not done.is_set():
+            _, _, _, recent_ids, pending_ids = client.export_state()
+            delivered_after = set(delivered)
+            lost = (set(recent_ids) & new_ids) - set(pending_ids) - delivered_after
+            assert not lost, lost
+            snapshots += 1
+        worker.join()
+        assert delivered == new_ids
+        print(f"✓ 轮询期间并发导出 {snapshots} 次状态")
+    finally:
+        fake.stop()
+
+
+def test_lazy_handle():
+    """按地址创建的客户端在用到时才访问上游：按ID取信只解析账户，不列出收件箱"""
+    fake = start_fake()
+    try:
+        email = "lazy@fake.test"
+        fake.create_account(email, "password")
+        message_id = fake.deliver(email, subject="old")["id"]
+
+        before = fake.request_count
+        client = MailTmClient(email=email)
+        assert fake.request_count == before and not client.hydrated
+        assert client.get_message(message_id)["subject"] == "old"
+        resolved = fake.request_count - before
+        assert not client.hydrated
+
+        client.hydrate()
+        assert fake.request_count - before == resolved + 1  # 建立水位线只需一次列表请求
+        fake.deliver(email, subject="new")
+        assert client.get_latest_message()["subject"] == "new"
+        print(f"✓ 延迟初始化：按ID取信 {resolved} 个上游请求，建立水位线再加1个")
+    finally:
+        fake.stop()
+
+
+def test_prefetch_parallel():
+    """多个地址的客户端并发初始化，总耗时接近单个地址"""
+    latency = 0.1
+    fake = start_fake(latency=latency)
+    try:
+        emails = [f"prefetch{i}@fake.test" for i in range(8)]
+        for email in emails:
+            fake.create_account(email, "password")
+        registry = ClientRegistry(lambda email, state: MailTmClient(email=email, state=state))
+
+        started = time.monotonic()
+        futures = registry.prefetch(emails, MailTmClient.hydrate)
+        clients = [futures[email].result() for email in emails]
+        elapsed = time.monotonic() - started
+        assert all(client.hydrated for client in clients)
+        # 每个地址串行需要3次往返（查找账户、邮箱列表、第一页邮件）
+        assert elapsed < len(emails) * 3 * latency / 2, elapsed
+
+        missing = registry.prefetch(["missing@fake.test"], MailTmClient.hydrate)["missing@fake.test"]
+        assert isinstance(missing.exception(), Exception)
+        assert registry.stats()["size"] == len(emails)  # 初始化失败的客户端不留在登记表中
+        print(f"✓ 并发初始化 {len(emails)} 个地址用时 {elapsed:.2f} 秒")
+    finally:
+        fake.stop()
+
+
+def test_recreated_mailbox():
+    """地址在上游被删除后重建时，轮询和按ID取件丢弃缓存的解析结果并使用新的账户"""
+    fake = start_fake()
+    try:
+        client = MailTmClient(username="recreated")
+        fake.deliver(client.email, subject="old")
+        existing = MailTmClient(email=client.email)
+        assert existing.get_latest_message() is None
+        old_account = existing.account_id
+
+        fake.delete_account(client.email)
+        fake.create_account(client.email)
+        message = fake.deliver(client.email, subject="after")
+        assert existing.get_latest_message()["subject"] == "after"
+        assert existing.account_id != old_account
+
+        # 另一个客户端从解析缓存读到的仍是新的账户，按ID取件无需再次重新解析
+        other = MailTmClient(email=client.email)
+        other.resolve()
+        assert other.account_id == existing.account_id
+        assert other.get_message(message["id"])["subject"] == "after"
+
+        fake.delete_account(client.email)
+        try:
+            existing.get_latest_message()
+            raise AssertionError("地址已不存在时应抛出异常")
+        except MailboxNotFoundError:
+            pass
+        print("✓ 上游返回404时重新解析邮箱")
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    test_burst_across_pages()
+    test_constant_poll_cost()
+    test_export_state_roundtrip()
+    test_export_during_polling()
+    test_lazy_handle()
+    test_prefetch_parallel()
+    test_recreated_mailbox()
+    print("全部测试通过")
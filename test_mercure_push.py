@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Mercure实时推送测试脚本
+使用本地Mercure Hub替身（fake_mercure.py），无需连接真实的SMTP.dev服务
+"""
+
+import threading
+import time
+from config import Config
+from fake_mercure import FakeMercureHub
+from mercure_listener import MercureListener
+
+
+def wait_until(predicate, timeout=5):
+    """等待条件成立"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+class Recorder:
+    """记录监听器回调"""
+
+    def __init__(self):
+        self.messages = []
+        self.states = []
+        self.lock = threading.Lock()
+
+    def on_message(self, email):
+        with self.lock:
+            self.messages.append(email)
+
+    def on_state(self, email, live):
+        with self.lock:
+            self.states.append((email, live))
+
+
+def start_listener(hub, recorder):
+    return MercureListener(
+        on_message=recorder.on_message,
+        on_state=recorder.on_state,
+        url=hub.url,
+        api_key="test_key",
+        enabled=True
+    )
+
+
+def test_message_event_wakes_matching_account():
+    """多路复用连接上的Message事件只唤醒对应账户"""
+    hub = FakeMercureHub(api_key="test_key", heartbeat=0.5).start()
+    recorder = Recorder()
+    listener = start_listener(hub, recorder)
+    try:
+        listener.watch("acc1", "a@example.com")
+        listener.watch("acc2", "b@example.com")
+        assert wait_until(lambda: listener.is_live("acc1") and listener.is_live("acc2"))
+        assert listener.stats()["streams"] == 1
+
+        # 非Message事件被忽略
+        hub.publish("/accounts/acc2", {"@type": "Account", "id": "acc2"})
+        hub.publish("/accounts/acc2", {
+            "@type": "Message",
+            "to": [{"address": "b@example.com"}],
+            "subject": "hello"
+        })
+        assert wait_until(lambda: recorder.messages == ["b@example.com"])
+        print("✓ Message事件唤醒对应账户")
+    finally:
+        listener.unwatch("acc1")
+        listener.unwatch("acc2")
+        hub.stop()
+
+
+def test_reconnect_and_replay_after_outage():
+    """连接中断时回退为不可用，重连后通过Last-Event-ID补发中断期间的事件"""
+    original_delay = Config.MERCURE_RECONNECT_DELAY
+    Config.MERCURE_RECONNECT_DELAY = 0.5
+    hub = FakeMercureHub(api_key="test_key", heartbeat=0.5).start()
+    recorder = Recorder()
+    listener = start_listener(hub, recorder)
+    try:
+        listener.watch("acc1", "a@example.com")
+        assert wait_until(lambda: listener.is_live("acc1"))
+        hub.publish("/accounts/acc1", {"type": "Message", "id": "m1"})
+        assert wait_until(lambda: len(recorder.messages) == 1)
+
+        hub.disconnect_all()
+        assert wait_until(lambda: ("a@example.com", False) in recorder.states)
+        hub.publish("/accounts/acc1", {"type": "Message", "id": "m2"})
+
+        assert wait_until(lambda: listener.is_live("acc1"))
+        assert wait_until(lambda: len(recorder.messages) == 2)
+        print("✓ 断线回退与重连补发")
+    finally:
+        Config.MERCURE_RECONNECT_DELAY = original_delay
+        listener.unwatch("acc1")
+        hub.stop()
+
+
+def test_unwatch_closes_stream():
+    """引用计数归零后关闭连接"""
+    hub = FakeMercureHub(api_key="test_key", heartbeat=0.5).start()
+    recorder = Recorder()
+    listener = start_listener(hub, recorder)
+    try:
+        listener.watch("acc1", "a@example.com")
+        listener.watch("acc1", "a@example.com")
+        assert wait_until(lambda: hub.subscriber_count() == 1)
+        listener.unwatch("acc1")
+        assert listener.stats()["accounts"] == 1
+        listener.unwatch("acc1")
+        assert wait_until(lambda: hub.subscriber_count() == 0)
+        assert listener.stats()["streams"] == 0
+        print("✓ 取消订阅后关闭连接")
+    finally:
+        hub.stop()
+
+
+if __name__ == "__main__":
+    test_message_event_wakes_matching_account()
+    test_reconnect_and_replay_after_outage()
+    test_unwatch_closes_stream()
+    print("全部测试通过")
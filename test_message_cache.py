@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+邮件详情缓存测试脚本
+"""
+
+from conftest import start_fake
+from smtp_api import SMTPDevAPIError
+from mail_client import MailTmClient
+from message_cache import MessageCache, get_message_cache
+from resolution_cache import get_resolution_cache
+import resilience
+from resilience import Resilience
+
+
+def test_byte_budget_and_compression():
+    """按字节预算淘汰，压缩后占用更少空间"""
+    body = "<p>" + "验证码 123456 " * 200 + "</p>"
+    plain = MessageCache(max_bytes=20000, compress=False)
+    packed = MessageCache(max_bytes=20000, compress=True, compress_min_bytes=1024)
+    for i in range(10):
+        message = {"id": f"m{i}", "html": [body]}
+        plain.put(f"m{i}", "inbox", message)
+        packed.put(f"m{i}", "inbox", message)
+
+    assert plain.stats()["bytes"] <= 20000 and plain.stats()["evictions"] > 0
+    assert plain.get("m0") is None and plain.get("m9")["html"] == [body]
+    assert packed.stats()["evictions"] == 0 and packed.stats()["bytes"] < packed.stats()["raw_bytes"]
+    assert packed.get("m0")["html"] == [body]
+    assert packed.get("m0", "other-inbox") is None  # 不属于该邮箱的邮件不返回
+    print("✓ 字节预算与压缩")
+
+
+def test_detail_fetched_once():
+    """同一封邮件多次获取只访问上游一次"""
+    fake = start_fake()
+    try:
+        client = MailTmClient(username="cached")
+        sent = fake.deliver(client.email, subject="hello")
+        assert client.get_latest_message()["subject"] == "hello"
+
+        hits = get_message_cache().stats()["hits"]
+        before = fake.request_count
+        for _ in range(3):
+            assert client.get_message(sent["id"])["subject"] == "hello"
+        assert fake.request_count == before
+        assert get_message_cache().stats()["hits"] == hits + 3
+        print("✓ 邮件详情只获取一次")
+    finally:
+        fake.stop()
+
+
+def test_unknown_id_keeps_resolution():
+    """不存在的邮件ID只请求一次上游且不清除解析缓存；上游故障时返回502而不是404或500"""
+    fake = start_fake()
+    resilience._resilience = Resilience(retries=0)
+    try:
+        import app as server
+        email = "unknown-id@fake.test"
+        fake.create_account(email, "password")
+        client = MailTmClient(email=email)
+        client.resolve()
+        http = server.app.test_client()
+
+        for i in range(3):
+            before, hits = fake.request_count, get_resolution_cache().stats()["hits"]
+            assert client.get_message(f"bogus{i}") is None
+            assert fake.request_count - before == 1
+            assert get_resolution_cache().get(email) == (client.account_id, client.mailbox_id)
+            assert get_resolution_cache().stats()["hits"] == hits + 1
+
+        assert http.get(f"/api/email/{email}/messages/bogus").status_code == 404
+        assert http.get(f"/api/email/{email}/messages/bogus/download").status_code == 404
+        assert get_resolution_cache().get(email) == (client.account_id, client.mailbox_id)
+
+        fake.fail_next = 1
+        try:
+            client.get_message("bogus")
+            raise AssertionError("上游故障时应抛出异常")
+        except SMTPDevAPIError:
+            pass
+        fake.fail_next = 1
+        assert http.get(f"/api/email/{email}/messages/bogus").status_code == 502
+        print("✓ 无效邮件ID不清除解析缓存")
+    finally:
+        resilience._resilience = None
+        fake.stop()
+
+
+if __name__ == "__main__":
+    test_byte_budget_and_compression()
+    test_detail_fetched_once()
+    test_unknown_id_keeps_resolution()
+    print("全部测试通过")
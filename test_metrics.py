@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+运行指标测试脚本
+验证Prometheus文本格式输出、上游请求/轮询/长轮询指标，以及埋点开销
+"""
+
+import threading
+import time
+from conftest import start_fake
+from metrics import MetricsRegistry, Histogram
+
+
+def sample(text, line_prefix):
+    """取出以 line_prefix 开头的样本值"""
+    for line in text.splitlines():
+        if line.startswith(line_prefix + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_exposition_format():
+    """直方图输出累积桶、总和与样本数，标签值被转义"""
+    registry = MetricsRegistry()
+    latency = registry.histogram("demo_seconds", "示例", ("path",), buckets=(0.1, 1))
+    hits = registry.counter("demo_total", "示例", ("path",))
+    registry.gauge("demo_size", "示例", lambda: 3)
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, 'a"b')
+    hits.inc("x")
+    hits.inc("x", amount=2)
+
+    text = registry.render()
+    assert "# TYPE demo_seconds histogram" in text
+    assert sample(text, 'demo_seconds_bucket{path="a\\"b",le="0.1"}') == 1
+    assert sample(text, 'demo_seconds_bucket{path="a\\"b",le="1"}') == 2
+    assert sample(text, 'demo_seconds_bucket{path="a\\"b",le="+Inf"}') == 3
+    assert sample(text, 'demo_seconds_count{path="a\\"b"}') == 3
+    assert sample(text, 'demo_total{path="x"}') == 3
+    assert sample(text, "demo_size") == 3
+    print("✓ Prometheus文本格式")
+
+
+def test_instrumentation_overhead():
+    """单次埋点的开销在微秒级，可以在生产环境常开"""
+    histogram = Histogram("overhead_seconds", "示例", ("endpoint", "status"))
+    child = histogram.labels("messages.list", "200")
+    count = 100000
+    started = time.perf_counter()
+    for i in range(count):
+        histogram.observe(0.01, "messages.list", "200")
+    per_call = (time.perf_counter() - started) / count
+    assert per_call < 20e-6, per_call
+    assert child.snapshot()[0][1] == count  # 0.01 落在 le="0.01" 桶
+    print(f"✓ 埋点开销: {per_call * 1e6:.2f} 微秒/次")
+
+
+def test_metrics_endpoint():
+    """/metrics 导出上游请求耗时、轮询结果、长轮询等待和交付延迟"""
+    fake = start_fake()
+    try:
+        import app as server
+        server.mercure_listener.enabled = False
+        http = server.app.test_client()
+        email = "metrics@fake.test"
+        fake.create_account(email, "password")
+
+        threading.Timer(0.5, fake.deliver, args=(email,), kwargs={"subject": "hi"}).start()
+        response = http.post('/api/emails/wait', json={"emails": [email], "timeout": 10})
+        assert response.status_code == 200, response.get_json()
+        response = http.post('/api/emails/wait', json={"emails": [email], "timeout": 0})
+        assert response.status_code == 404
+
+        response = http.get('/metrics')
+        assert response.status_code == 200
+        assert response.content_type.startswith("text/plain; version=0.0.4")
+        text = response.get_data(as_text=True)
+        assert sample(text, 'emailapi_upstream_request_duration_seconds_count{endpoint="messages.list",status="200"}') >= 1
+        assert sample(text, 'emailapi_polls_total{result="message"}') >= 1
+        assert sample(text, 'emailapi_polls_total{result="empty"}') >= 1
+        assert sample(text, 'emailapi_wait_duration_seconds_count{endpoint="group",outcome="message"}') == 1
+        assert sample(text, 'emailapi_wait_duration_seconds_count{endpoint="group",outcome="timeout"}') == 1
+        assert sample(text, 'emailapi_delivery_latency_seconds_count{channel="longpoll"}') == 1
+        assert sample(text, "emailapi_email_clients") >= 1
+        assert sample(text, "emailapi_monitors") == 0
+        print("✓ /metrics 指标导出")
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    test_exposition_format()
+    test_instrumentation_overhead()
+    test_metrics_endpoint()
+    print("全部测试通过")
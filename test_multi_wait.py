@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+多邮箱等待测试脚本
+使用本地SMTP.dev替身（fake_smtp_dev.py），验证 POST /api/emails/wait
+"""
+
+import threading
+import time
+from config import Config
+from conftest import start_fake
+from waiters import WaiterRegistry
+
+
+def test_group_quorum():
+    """达到quorum才唤醒，暂存邮件立即计入"""
+    registry = WaiterRegistry()
+    registry.deliver("a@x", {"id": "1"})
+    group = registry.register_group(["a@x", "b@x", "c@x"], quorum=2)
+    assert group.ready == 1 and not group.event.is_set()
+
+    threading.Timer(0.1, registry.deliver, args=("c@x", {"id": "2"})).start()
+    started = time.monotonic()
+    results = registry.wait_group(group, 5)
+    assert time.monotonic() - started < 1
+    assert set(results) == {"a@x", "c@x"}
+    assert registry.stats()["waiters"] == 0
+    print("✓ 达到quorum后唤醒")
+
+
+def test_stash_bounded():
+    """无人等待的暂存邮件会过期，暂存的邮箱数有上限，地址轮换时不会无限累积"""
+    registry = WaiterRegistry(stash_ttl=0.2, stash_max_addresses=3)
+    for i in range(10):
+        registry.deliver(f"churn{i}@x", {"id": str(i)})
+    assert registry.stats()["stashed"] == 3
+    waiter = registry.register("churn9@x")
+    assert waiter.message == {"id": "9"}
+    waiter = registry.register("churn0@x")
+    assert waiter.message is None
+    registry.wait(waiter, 0)
+
+    time.sleep(0.25)
+    waiter = registry.register("churn8@x")
+    assert waiter.message is None  # 已过期
+    registry.wait(waiter, 0)
+    registry.deliver("fresh@x", {"id": "new"})
+    assert registry.stats()["stashed"] == 1  # 新的暂存顺带清理过期邮箱
+    print("✓ 暂存邮件过期与数量上限")
+
+
+def test_wait_endpoint():
+    """一个请求等待多个邮箱，任意一个收到邮件即返回"""
+    fake = start_fake()
+    try:
+        import app as server
+        server.mercure_listener.enabled = False
+        http = server.app.test_client()
+        emails = [f"multi{i}@fake.test" for i in range(20)]
+        for email in emails:
+            fake.create_account(email, "password")
+
+        assert http.post('/api/emails/wait', json={"emails": []}).status_code == 400
+        assert http.post('/api/emails/wait', json={"emails": emails, "quorum": 21}).status_code == 400
+
+        # 超时为0：立即返回404，同时完成各邮箱客户端的初始化
+        response = http.post('/api/emails/wait', json={"emails": emails, "timeout": 0})
+        assert response.status_code == 404 and response.get_json()["received"] == 0
+
+        threading.Timer(0.5, fake.deliver, args=(emails[7],), kwargs={"subject": "hi"}).start()
+        started = time.monotonic()
+        response = http.post('/api/emails/wait', json={"emails": emails, "timeout": 10})
+        elapsed = time.monotonic() - started
+        data = response.get_json()
+        assert response.status_code == 200, data
+        assert [item["email"] for item in data["results"] if item["received"]] == [emails[7]]
+        assert data["results"][7]["content"] == "<p>hi</p>"
+        assert elapsed < Config.POLL_INTERVAL + 2
+        assert server.waiter_registry.stats()["waiters"] == 0
+        print(f"✓ 20个邮箱一次等待，{elapsed:.2f} 秒后返回")
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    test_group_quorum()
+    test_stash_bounded()
+    test_wait_endpoint()
+    print("全部测试通过")
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+共享轮询调度器测试脚本
+验证大量邮箱由固定数量的工作线程轮询、首次轮询分散在一个周期内，以及触发、取消和出错退避（无需真实服务）
+"""
+
+import threading
+import time
+from poll_scheduler import PollScheduler
+from rate_budget import RateBudget
+
+
+def unlimited():
+    return RateBudget(rate=0)
+
+
+def test_bounded_threads_and_spread():
+    """邮箱数远多于工作线程时线程数不随邮箱增长，每个邮箱都按周期轮询，首次轮询分散开"""
+    interval, workers, count = 0.2, 4, 300
+    scheduler = PollScheduler(interval=interval, max_workers=workers, budget=unlimited())
+    lock = threading.Lock()
+    polls = {}
+    state = {"running": 0, "peak": 0}
+
+    def make_job(key):
+        def job():
+            with lock:
+                polls.setdefault(key, []).append(time.monotonic())
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.001)
+            with lock:
+                state["running"] -= 1
+            return interval
+        return job
+
+    threads_before = threading.active_count()
+    started = time.monotonic()
+    for i in range(count):
+        scheduler.schedule(f"box{i}", make_job(f"box{i}"))
+    time.sleep(1.0)
+    threads = threading.active_count() - threads_before
+    for i in range(count):
+        scheduler.cancel(f"box{i}")
+
+    assert threads <= workers + 1, threads  # 调度线程 + 工作线程
+    assert state["peak"] <= workers
+    assert len(polls) == count and min(len(times) for times in polls.values()) >= 2
+    firsts = sorted(times[0] - started for times in polls.values())
+    assert firsts[-1] - firsts[0] > interval / 2  # 首次轮询在一个周期内随机分散，而不是同时发出
+    stats = scheduler.stats()
+    assert stats["workers"] == workers and stats["polls"] >= 2 * count
+    print(f"✓ {count} 个邮箱由 {threads} 个线程轮询")
+
+
+def test_trigger_and_cancel():
+    """trigger立即执行一次，执行期间被触发时完成后再执行一次；取消后不再执行"""
+    scheduler = PollScheduler(interval=0.05, max_workers=2, budget=unlimited())
+    runs = []
+    release = threading.Event()
+
+    def job():
+        runs.append(time.monotonic())
+        if len(runs) == 2:
+            release.wait(1)
+        return 100  # 不主动再次轮询
+
+    assert not scheduler.trigger("box")  # 未注册的任务
+    scheduler.schedule("box", job)
+    assert scheduler.is_scheduled("box")
+    deadline = time.monotonic() + 1
+    while not runs and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(runs) == 1
+
+    assert scheduler.trigger("box")
+    while len(runs) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    scheduler.trigger("box")  # 第二次执行尚未结束
+    release.set()
+    time.sleep(0.1)
+    assert len(runs) == 3, len(runs)
+
+    scheduler.cancel("box")
+    assert not scheduler.is_scheduled("box") and not scheduler.trigger("box")
+    time.sleep(0.1)
+    assert len(runs) == 3
+    print("✓ 触发与取消")
+
+
+def test_error_backoff():
+    """轮询出错时按出错间隔加倍退避，恢复后重置"""
+    scheduler = PollScheduler(interval=0.01, error_interval=0.05, max_workers=1, budget=unlimited())
+    runs = []
+    failing = threading.Event()
+    failing.set()
+
+    def job():
+        runs.append(time.monotonic())
+        if failing.is_set():
+            raise Exception("上游故障")
+        return 0.01
+
+    scheduler.schedule("box", job)
+    time.sleep(0.5)
+    failures = len(runs)
+    gaps = [b - a for a, b in zip(runs, runs[1:])]
+    assert 3 <= failures <= 6, failures  # 0.05、0.1、0.2 ... 逐次加倍
+    assert all(later >= earlier for earlier, later in zip(gaps, gaps[1:]))
+    assert scheduler.stats()["errors"] == failures
+
+    failing.clear()
+    scheduler.trigger("box")
+    time.sleep(0.2)
+    scheduler.cancel("box")
+    assert len(runs) - failures >= 5  # 恢复后按正常间隔轮询
+    print(f"✓ 出错退避：0.5秒内出错 {failures} 次")
+
+
+if __name__ == "__main__":
+    test_bounded_threads_and_spread()
+    test_trigger_and_cancel()
+    test_error_backoff()
+    print("全部测试通过")
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+上游重试与熔断测试脚本
+使用本地SMTP.dev替身（fake_smtp_dev.py），验证带抖动的退避重试、非幂等请求不重试以及按端点熔断
+"""
+
+import asyncio
+import time
+from config import Config
+import conftest
+from smtp_api import SMTPDevAPI, SMTPDevAPIError
+from async_smtp_api import AsyncSMTPDevAPI
+from mail_client import MailTmClient
+from async_mail_client import AsyncMailTmClient
+import resilience
+from resilience import CircuitBreaker, Resilience
+
+
+def start_fake():
+    fake = conftest.start_fake()
+    resilience._resilience = Resilience(retries=2, base_delay=0.01, max_delay=0.05)
+    return fake
+
+
+def stop_fake(fake):
+    resilience._resilience = None
+    fake.stop()
+
+
+def test_breaker_states():
+    """连续失败达到阈值后熔断，冷却后只放行一个探测请求，探测成功则关闭"""
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=0.2)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    for _ in range(3):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.25)
+    assert breaker.allow()
+    assert not breaker.allow()  # 探测期间其余请求仍被拒绝
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.25)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()["opens"] == 1
+
+    policy = Resilience(base_delay=1, max_delay=4)
+    for attempt, limit in [(0, 1), (1, 2), (5, 4)]:
+        delay = policy.backoff(attempt)
+        assert limit / 2 <= delay <= limit, (attempt, delay)
+    print("✓ 熔断器状态转换")
+
+
+def test_retry_idempotent_only():
+    """幂等请求在5xx时重试，创建账户不重试"""
+    fake = start_fake()
+    try:
+        api = SMTPDevAPI()
+        account = api.create_account("retry@fake.test", "password")
+
+        fake.fail_next = 2
+        before = fake.request_count
+        assert api.get_mailboxes(account["id"])
+        assert fake.request_count - before == 3
+
+        fake.fail_next = 1
+        before = fake.request_count
+        assert api.create_account("again@fake.test", "password") is None
+        assert fake.request_count - before == 1
+
+        stats = resilience.get_resilience().stats()
+        assert stats["mailboxes.list"]["retries"] == 2
+        assert stats["accounts.create"]["retries"] == 0
+
+        async def run():
+            async with AsyncSMTPDevAPI() as async_api:
+                fake.fail_next = 1
+                assert await async_api.get_mailboxes(account["id"])
+                fake.fail_next = 1
+                assert await async_api.create_account("async@fake.test", "password") is None
+
+        asyncio.run(run())
+        assert resilience.get_resilience().stats()["mailboxes.list"]["retries"] == 3
+        print("✓ 幂等请求重试，非幂等请求不重试")
+    finally:
+        stop_fake(fake)
+
+
+def test_probe_not_leaked():
+    """探测请求被取消或抛出非网络异常时归还探测名额，熔断器不会一直拒绝请求"""
+    breaker = CircuitBreaker("lost", failure_threshold=1, reset_timeout=0.1, probe_timeout=0.2)
+    breaker.record_failure()
+    time.sleep(0.15)
+    assert breaker.allow() and not breaker.allow()
+    time.sleep(0.25)
+    assert breaker.allow()  # 超时未结束的探测视为丢失
+    print("✓ 探测超时后放行新的探测")
+
+    policy = Resilience(retries=0)
+    breaker = policy.breaker("unexpected")
+    breaker.failure_threshold, breaker.reset_timeout = 1, 0.1
+    breaker.record_failure()
+    time.sleep(0.15)
+
+    def broken():
+        raise ValueError("响应无法解析")
+
+    try:
+        policy.call("unexpected", broken)
+        raise AssertionError("应抛出原始异常")
+    except ValueError:
+        pass
+    assert breaker.state == CircuitBreaker.OPEN  # 算作失败，重新熔断而不是卡在半开
+    time.sleep(0.15)
+    assert breaker.allow()
+    print("✓ 非网络异常结束探测后重新熔断")
+
+    fake = start_fake()
+    try:
+        account = fake.create_account("probe@fake.test", "password")
+        breaker = resilience.get_resilience().breaker("mailboxes.list")
+        breaker.failure_threshold, breaker.reset_timeout = 1, 0.1
+        breaker.record_failure()
+        time.sleep(0.15)
+
+        async def cancelled_probe():
+            async with AsyncSMTPDevAPI() as api:
+                try:
+                    await asyncio.wait_for(api.get_mailboxes(account["id"]), 0.1)
+                    raise AssertionError("探测应被取消")
+                except asyncio.TimeoutError:
+                    pass
+
+        fake.latency = 0.5
+        asyncio.run(cancelled_probe())
+        fake.latency = 0.0
+        # 取消的探测归还名额，同步客户端共享同一个熔断器，也能立即探测并恢复
+        assert SMTPDevAPI().get_mailboxes(account["id"])
+        assert breaker.state == CircuitBreaker.CLOSED
+        print("✓ 取消的异步探测归还名额")
+    finally:
+        stop_fake(fake)
+
+
+def test_circuit_opens_against_upstream():
+    """端点持续失败时熔断，不再请求上游；冷却后探测成功恢复"""
+    fake = start_fake()
+    saved = (Config.BREAKER_FAILURE_THRESHOLD, Config.BREAKER_RESET_TIMEOUT)
+    Config.BREAKER_FAILURE_THRESHOLD, Config.BREAKER_RESET_TIMEOUT = 3, 0.3
+    try:
+        api = SMTPDevAPI()
+        account = api.create_account("breaker@fake.test", "password")
+
+        fake.fail_next = 3
+        assert api.get_mailboxes(account["id"]) is None
+        before = fake.request_count
+        assert api.get_mailboxes(account["id"]) is None
+        assert fake.request_count == before
+        assert resilience.get_resilience().stats()["mailboxes.list"]["state"] == "open"
+
+        # 其他端点不受影响
+        assert api.get_account_by_email("breaker@fake.test")
+
+        time.sleep(0.35)
+        assert api.get_mailboxes(account["id"])
+        assert resilience.get_resilience().stats()["mailboxes.list"]["state"] == "closed"
+        print("✓ 端点熔断与恢复")
+    finally:
+        Config.BREAKER_FAILURE_THRESHOLD, Config.BREAKER_RESET_TIMEOUT = saved
+        stop_fake(fake)
+
+
+def test_failed_fetch_keeps_pending():
+    """取邮件详情失败时抛出异常并保留待取邮件，下次轮询不丢邮件"""
+    fake = start_fake()
+    try:
+        client = MailTmClient(username="pending")
+        fake.deliver(client.email, subject="kept")
+        client.fetch_new_messages(enqueue=True)
+
+        fake.fail_next = 3  # 首次请求和两次重试都失败
+        try:
+            client.get_latest_message()
+            raise AssertionError("应抛出SMTPDevAPIError")
+        except SMTPDevAPIError:
+            pass
+        assert len(client.pending_ids) == 1
+        assert client.get_latest_message()["subject"] == "kept"
+        assert not client.pending_ids
+        print("✓ 上游故障时保留待取邮件")
+    finally:
+        stop_fake(fake)
+
+
+def test_async_failed_fetch_keeps_pending():
+    """异步客户端：列表或详情请求失败时抛出异常，不当作没有新邮件，也不丢弃待取邮件"""
+    fake = start_fake()
+
+    async def run():
+        async with AsyncSMTPDevAPI() as api:
+            client = await AsyncMailTmClient.create(username="async_pending", api=api)
+            fake.deliver(client.email, subject="kept")
+
+            fake.fail_next = 3
+            try:
+                await client.get_latest_message()
+                raise AssertionError("列表请求失败应抛出SMTPDevAPIError")
+            except SMTPDevAPIError:
+                pass
+            assert not client.pending_ids and not client.cursor.watermark  # 水位线未推进
+
+            client.pending_ids.extend(message["id"] for message in await client.fetch_new_messages())
+            fake.fail_next = 3
+            try:
+                await client.get_latest_message()
+                raise AssertionError("详情请求失败应抛出SMTPDevAPIError")
+            except SMTPDevAPIError:
+                pass
+            assert len(client.pending_ids) == 1
+            assert (await client.get_latest_message())["subject"] == "kept"
+            assert not client.pending_ids
+
+            fake.fail_next = 3
+            try:
+                await AsyncMailTmClient.create(email=client.email, api=api)
+                raise AssertionError("建立水位线失败应抛出SMTPDevAPIError")
+            except SMTPDevAPIError:
+                pass
+
+    try:
+        asyncio.run(run())
+        print("✓ 异步客户端上游故障时保留待取邮件")
+    finally:
+        stop_fake(fake)
+
+
+if __name__ == "__main__":
+    test_breaker_states()
+    test_retry_idempotent_only()
+    test_probe_not_leaked()
+    test_circuit_opens_against_upstream()
+    test_failed_fetch_keeps_pending()
+    test_async_failed_fetch_keeps_pending()
+    print("全部测试通过")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+邮箱解析缓存测试脚本
+验证正向结果的TTL、不存在地址的负缓存、失效和磁盘快照（无需真实服务）
+"""
+
+import os
+import tempfile
+import time
+from resolution_cache import ResolutionCache, NOT_FOUND
+
+
+def test_ttl_and_negative_cache():
+    """正向结果和负缓存按各自的TTL过期，超过容量时按LRU淘汰"""
+    cache = ResolutionCache(ttl=0.2, negative_ttl=0.1, max_entries=2, snapshot_path="")
+    cache.put("a@fake.test", "acc-a", "mbx-a")
+    cache.put_missing("gone@fake.test")
+    assert cache.get("a@fake.test") == ("acc-a", "mbx-a")
+    assert cache.get("gone@fake.test") is NOT_FOUND
+    assert cache.get("b@fake.test") is None
+
+    time.sleep(0.12)
+    assert cache.get("gone@fake.test") is None  # 负缓存先过期
+    assert cache.get("a@fake.test") == ("acc-a", "mbx-a")
+    time.sleep(0.1)
+    assert cache.get("a@fake.test") is None
+
+    for name in ("a", "b", "c"):
+        cache.put(f"{name}@fake.test", f"acc-{name}", f"mbx-{name}")
+    assert cache.get("a@fake.test") is None and cache.stats()["entries"] == 2
+    stats = cache.stats()
+    assert stats["negative_hits"] == 1 and stats["hits"] == 2
+    print("✓ TTL、负缓存与LRU淘汰")
+
+
+def test_invalidate():
+    """失效后下次查找未命中，可以写入新的解析结果"""
+    cache = ResolutionCache(ttl=60, negative_ttl=60, snapshot_path="")
+    cache.put("a@fake.test", "acc-old", "mbx-old")
+    cache.invalidate("a@fake.test")
+    cache.invalidate("missing@fake.test")  # 不存在的地址直接忽略
+    assert cache.get("a@fake.test") is None
+    cache.put("a@fake.test", "acc-new", "mbx-new")
+    assert cache.get("a@fake.test") == ("acc-new", "mbx-new")
+    print("✓ 失效与重新写入")
+
+
+def test_snapshot_roundtrip():
+    """快照只保存未过期的正向结果，重启后加载"""
+    path = os.path.join(tempfile.mkdtemp(), "resolution.json")
+    cache = ResolutionCache(ttl=60, negative_ttl=60, snapshot_path=path)
+    cache.put("a@fake.test", "acc-a", "mbx-a")
+    cache.put("b@fake.test", "acc-b", "mbx-b")
+    cache.put_missing("gone@fake.test")
+    cache.invalidate("b@fake.test")
+    cache.save_snapshot()
+
+    restored = ResolutionCache(ttl=60, negative_ttl=60, snapshot_path=path)
+    assert restored.get("a@fake.test") == ("acc-a", "mbx-a")
+    assert restored.get("b@fake.test") is None
+    assert restored.get("gone@fake.test") is None  # 负缓存不写入快照
+    assert restored.stats()["entries"] == 1
+
+    # 已过期的条目不加载，损坏的快照被忽略
+    expired = ResolutionCache(ttl=0.05, negative_ttl=60, snapshot_path=path + ".2")
+    expired.put("c@fake.test", "acc-c", "mbx-c")
+    expired.save_snapshot()
+    time.sleep(0.1)
+    assert ResolutionCache(snapshot_path=path + ".2").stats()["entries"] == 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{not json")
+    assert ResolutionCache(snapshot_path=path).stats()["entries"] == 0
+    print("✓ 快照保存与加载")
+
+
+if __name__ == "__main__":
+    test_ttl_and_negative_cache()
+    test_invalidate()
+    test_snapshot_roundtrip()
+    print("全部测试通过")
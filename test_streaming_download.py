@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+原文/附件流式下载测试脚本
+使用本地SMTP.dev替身（fake_smtp_dev.py），验证流式转发、Range和磁盘缓存
+"""
+
+import os
+import tempfile
+import tracemalloc
+from conftest import start_fake
+import download_spool
+
+
+def drain(response):
+    """逐块读取响应，返回总字节数和前16个字节"""
+    size, head = 0, b""
+    for chunk in response.response:
+        if len(head) < 16:
+            head += chunk[:16 - len(head)]
+        size += len(chunk)
+    response.close()
+    return size, head
+
+
+def test_stream_constant_memory():
+    """大附件逐块转发，内存占用远小于附件大小；Range透传上游"""
+    fake = start_fake()
+    download_spool._spool = download_spool.DownloadSpool(directory="")
+    try:
+        import app as server
+        server.mercure_listener.enabled = False
+        http = server.app.test_client()
+        fake.create_account("big@fake.test", "password")
+        payload = os.urandom(1024) * (20 * 1024)  # 20MB
+        message = fake.deliver("big@fake.test", attachments=[("big.bin", "application/octet-stream", payload)])
+        url = f"/api/email/big@fake.test/messages/{message['id']}/attachments/{message['attachments'][0]['id']}"
+
+        tracemalloc.start()
+        response = http.get(url, buffered=False)
+        assert response.status_code == 200
+        assert response.headers["Content-Length"] == str(len(payload))
+        size, head = drain(response)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert size == len(payload) and head == payload[:16]
+        assert peak < 4 * 1024 * 1024, peak
+
+        response = http.get(url, headers={"Range": "bytes=100-199"})
+        assert response.status_code == 206 and response.data == payload[100:200]
+        assert response.headers["Content-Range"] == f"bytes 100-199/{len(payload)}"
+
+        assert http.get(f"/api/email/big@fake.test/messages/{message['id']}/download").data.startswith(b"From:")
+        assert http.get("/api/email/big@fake.test/messages/missing/source").status_code == 404
+        print(f"✓ 20MB附件流式转发，峰值内存 {peak / 1024:.0f}KB")
+    finally:
+        download_spool._spool = None
+        fake.stop()
+
+
+def test_spool_repeat_download():
+    """重复下载直接从磁盘缓存发送，同样支持Range"""
+    fake = start_fake()
+    with tempfile.TemporaryDirectory() as directory:
+        download_spool._spool = download_spool.DownloadSpool(directory=directory)
+        try:
+            import app as server
+            server.mercure_listener.enabled = False
+            http = server.app.test_client()
+            fake.create_account("spool@fake.test", "password")
+            message = fake.deliver("spool@fake.test", subject="spooled")
+            url = f"/api/email/spool@fake.test/messages/{message['id']}/source"
+
+            first = http.get(url).data
+            before = fake.request_count
+            assert http.get(url).data == first
+            response = http.get(url, headers={"Range": "bytes=0-4"})
+            assert response.status_code == 206 and response.data == first[:5]
+            assert fake.request_count == before
+            assert download_spool.get_download_spool().stats()["hits"] == 2
+            print("✓ 磁盘缓存命中")
+        finally:
+            download_spool._spool = None
+            fake.stop()
+
+
+if __name__ == "__main__":
+    test_stream_constant_memory()
+    test_spool_repeat_download()
+    print("全部测试通过")
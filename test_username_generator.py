@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+随机用户名签发测试脚本
+验证布隆过滤器、批量签发不重复、避开已知存在的用户名，以及批量生成的速度
+"""
+
+import random
+import time
+from username_generator import BloomFilter, UsernameIssuer, WordGenerator
+
+
+def test_bloom_filter():
+    """加入过的一定命中，未加入的误判率接近配置值"""
+    bloom = BloomFilter(10000, 0.01)
+    names = [f"user{i}" for i in range(10000)]
+    for name in names:
+        assert not bloom.add(name) or name in bloom
+    assert all(name in bloom for name in names)
+    assert bloom.add("user0")
+
+    false_positives = sum(f"other{i}" in bloom for i in range(20000))
+    assert false_positives / 20000 < 0.02, false_positives
+    print(f"✓ 布隆过滤器：{len(bloom._bits)} 字节，误判率 {false_positives / 20000:.4f}")
+
+
+def test_seeded_generator():
+    """同一种子生成相同的用户名序列，且不依赖全局random状态"""
+    first = WordGenerator(seed=42)
+    names = [first.generate_combined_username(1) for _ in range(20)]
+    random.seed(0)
+    second = WordGenerator(seed=42)
+    assert [second.generate_combined_username(1) for _ in range(20)] == names
+    assert all(name.count("_") == 1 and name.islower() for name in names), names
+    print(f"✓ 固定种子可复现，例如 {names[0]}")
+
+
+def test_batch_unique_and_avoids_existing():
+    """批量签发互不重复，跨批次不重复，且避开已知存在的用户名"""
+    issuer = UsernameIssuer(WordGenerator(seed=7), capacity=100000, error_rate=0.001)
+    # 与签发器同种子的生成器产生的名字，就是签发器接下来会生成的候选名
+    twin = WordGenerator(seed=7)
+    existing = [twin.generate_combined_username(1) for _ in range(50)]
+    for name in existing:
+        issuer.mark_existing(name)
+
+    names = issuer.generate_batch(5000) + issuer.generate_batch(5000)
+    assert len(set(names)) == 10000
+    assert not set(existing) & set(names)
+    stats = issuer.stats()
+    assert stats["issued"] == 10000 and stats["rejected"] >= 50, stats
+    print(f"✓ 签发10000个用户名无重复，跳过 {stats['rejected']} 个候选名")
+
+
+def test_batch_speed():
+    """批量签发（含去重）每个用户名的开销在微秒级，远小于一次上游往返"""
+    generator = WordGenerator(seed=1)
+    issuer = UsernameIssuer(WordGenerator(seed=1), capacity=100000, error_rate=0.001)
+    count = 20000
+
+    started = time.perf_counter()
+    for _ in range(count):
+        generator.generate_combined_username(1)
+    plain = time.perf_counter() - started
+
+    started = time.perf_counter()
+    issuer.generate_batch(count)
+    batched = time.perf_counter() - started
+    assert batched / count < 50e-6, batched
+    print(f"✓ 生成 {plain / count * 1e6:.1f} 微秒/个，签发（含去重）{batched / count * 1e6:.1f} 微秒/个")
+
+
+if __name__ == "__main__":
+    test_bloom_filter()
+    test_seeded_generator()
+    test_batch_unique_and_avoids_existing()
+    test_batch_speed()
+    print("全部测试通过")
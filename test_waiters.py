@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+长轮询等待者登记表测试脚本
+验证等待者按到达顺序被唤醒、超时后的邮件暂存给下一个请求，以及长轮询接口共享邮箱轮询
+（接口部分使用本地SMTP.dev替身，无需真实服务）
+"""
+
+import threading
+import time
+from conftest import start_fake
+from waiters import WaiterRegistry
+
+
+def test_deliver_wakes_in_order():
+    """新邮件交给最早登记的等待者，每封只交给一个"""
+    registry = WaiterRegistry()
+    first = registry.register("a@fake.test", timeout=30)
+    second = registry.register("a@fake.test", timeout=5)
+    assert registry.has_waiters("a@fake.test") and not registry.has_waiters("b@fake.test")
+    assert registry.deadline("a@fake.test") == second.deadline
+    assert registry.deadline("b@fake.test") is None
+
+    threading.Timer(0.05, registry.deliver, args=("a@fake.test", {"id": "m1"})).start()
+    assert registry.wait(first, 1) == {"id": "m1"}
+    assert registry.deliver("a@fake.test", {"id": "m2"})
+    assert registry.wait(second, 0) == {"id": "m2"}
+    stats = registry.stats()
+    assert stats["waiters"] == 0 and stats["delivered"] == 2 and stats["timeouts"] == 0
+    print("✓ 按登记顺序唤醒")
+
+
+def test_timeout_and_stash():
+    """超时返回None；无人等待时的新邮件暂存给下一个请求，stash=False时不暂存"""
+    registry = WaiterRegistry()
+    waiter = registry.register("a@fake.test", timeout=0.05)
+    started = time.monotonic()
+    assert registry.wait(waiter, 0.05) is None
+    assert time.monotonic() - started < 0.5
+    assert not registry.has_waiters("a@fake.test") and registry.stats()["timeouts"] == 1
+
+    assert not registry.deliver("a@fake.test", {"id": "late"})
+    assert not registry.deliver("b@fake.test", {"id": "dropped"}, stash=False)
+    assert registry.stats()["stashed"] == 1
+    waiter = registry.register("a@fake.test")
+    assert waiter.event.is_set()  # 暂存的邮件在登记时立即交付
+    assert registry.wait(waiter, 0) == {"id": "late"}
+    assert registry.wait(registry.register("b@fake.test"), 0) is None
+    print("✓ 超时与暂存")
+
+
+def test_longpoll_endpoint():
+    """同一邮箱的多个长轮询请求共用一个轮询任务，每个请求收到不同的新邮件"""
+    fake = start_fake()
+    try:
+        import app as server
+        server.mercure_listener.enabled = False
+        email = "parked@fake.test"
+        fake.create_account(email, "password")
+        http = server.app.test_client()
+        count = 5
+        results = []
+
+        def request():
+            response = http.get(f"/api/email/{email}")
+            results.append((response.status_code, response.get_json().get("content")))
+
+        threads = [threading.Thread(target=request) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while server.waiter_registry.stats()["waiters"] < count and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert server.waiter_registry.stats()["waiters"] == count
+        assert server.poll_scheduler.is_scheduled(email)
+
+        for i in range(count):
+            fake.deliver(email, subject=f"m{i}", html=f"<p>{i}</p>")
+        for thread in threads:
+            thread.join(10)
+        assert sorted(results) == [(200, f"<p>{i}</p>") for i in range(count)], results
+        assert server.waiter_registry.stats()["waiters"] == 0
+        assert not server.poll_scheduler.is_scheduled(email)  # 最后一个等待者离开后注销轮询任务
+        print(f"✓ {count} 个长轮询请求共享一个邮箱轮询任务")
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    test_deliver_wakes_in_order()
+    test_timeout_and_stash()
+    test_longpoll_endpoint()
+    print("全部测试通过")
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+WebSocket房间广播测试脚本
+使用本地SMTP.dev替身（fake_smtp_dev.py），验证新邮件推送以房间广播方式只编码一次
+"""
+
+from conftest import start_fake
+
+
+def test_room_broadcast_encodes_once():
+    """同一邮箱的所有订阅者通过一次房间广播收到推送"""
+    fake = start_fake()
+    subscribers = 200
+    try:
+        import app as server
+        server.mercure_listener.enabled = False
+        fake.create_account("room@fake.test", "password")
+        fake.create_account("other@fake.test", "password")
+
+        clients = [server.socketio.test_client(server.app) for _ in range(subscribers)]
+        for client in clients:
+            client.emit('authenticate', {'email': 'room@fake.test'})
+        # 切换到其他邮箱的连接应离开原房间
+        clients[-1].emit('authenticate', {'email': 'other@fake.test'})
+        for client in clients:
+            client.get_received()
+        assert len(server.ws_connections['room@fake.test']) == subscribers - 1
+
+        # 记录发给各订阅者的Engine.IO数据包：同一份编码结果应被所有订阅者复用
+        sent = []
+        sio_server = server.socketio.server
+        original_send = sio_server._send_eio_packet
+
+        def recording_send(eio_sid, eio_pkt):
+            sent.append(eio_pkt)
+            return original_send(eio_sid, eio_pkt)
+
+        sio_server._send_eio_packet = recording_send
+        try:
+            monitor = server.monitoring_threads['room@fake.test']
+            monitor._push_new_email({'subject': 'hello', 'html': ['<p>hello</p>']})
+        finally:
+            sio_server._send_eio_packet = original_send
+
+        assert len(sent) == subscribers - 1
+        assert len({id(pkt) for pkt in sent}) == 1
+        received = [client.get_received() for client in clients]
+        assert all(r and r[0]['name'] == 'email_notification' for r in received[:-1])
+        assert received[-1] == []
+
+        for client in clients:
+            client.disconnect()
+        assert 'room@fake.test' not in server.ws_connections
+        assert 'room@fake.test' not in server.monitoring_threads
+        print(f"✓ {subscribers - 1} 个订阅者一次编码完成推送")
+    finally:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    test_room_broadcast_encodes_once()
+    print("全部测试通过")
@@ -1,8 +1,59 @@
+import hashlib
+import math
 import random
+import threading
+from config import Config
+
+
+class BloomFilter:
+    """紧凑的布隆过滤器，记录已签发或已知存在的用户名
+
+    - 不会漏判：加入过的用户名一定返回存在
+    - 按容量和误判率确定位数组大小和哈希次数，100万个用户名、0.1%误判率约占1.8MB
+    - 误判只会让生成器多丢弃一个候选名，不影响正确性；超过容量后误判率逐渐升高
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # 双重哈希：一次blake2b摘要拆成两个64位值，组合出hashes个位置
+        digest = int.from_bytes(hashlib.blake2b(item.encode(), digest_size=16).digest(), "little")
+        h1 = digest & 0xFFFFFFFFFFFFFFFF
+        h2 = (digest >> 64) | 1
+        return range(h1, h1 + self.hashes * h2, h2)
+
+    def __contains__(self, item):
+        bits, size = self._bits, self.size
+        for p in self._positions(item):
+            p %= size
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def add(self, item):
+        """加入一项，返回该项此前是否（可能）已存在"""
+        bits, size = self._bits, self.size
+        present = True
+        for p in self._positions(item):
+            p %= size
+            mask = 1 << (p & 7)
+            if not bits[p >> 3] & mask:
+                bits[p >> 3] |= mask
+                present = False
+        if not present:
+            self.count += 1
+        return present
 
 
 class WordGenerator:
-    def __init__(self):
+    def __init__(self, seed=None):
+        # 独立的随机数生成器，指定种子时生成结果可复现
+        self.random = random.Random(seed)
         # 常用辅音字母
         self.consonants = "bcdfghjklmnpqrstvwxyz"
         # 元音字母
@@ -37,55 +88,146 @@ class WordGenerator:
             "best",
         ]
 
-    def generate_syllable(self):
-        """生成一个音节"""
-        if random.random() < 0.3 and self.common_pairs:  # 30% 概率使用常用字母组合
-            return random.choice(self.common_pairs) + random.choice(self.vowels)
-        else:
-            return random.choice(self.consonants) + random.choice(self.vowels)
+        # 预先展开音节表：常用字母组合+元音与辅音+元音按 3:4 重复，使前者恰好占30%，
+        # 之后每个音节只需一次整数取模查表，不再逐个字母调用 random.choice
+        pair_syllables = [pair + vowel for pair in self.common_pairs for vowel in self.vowels]
+        plain_syllables = [consonant + vowel for consonant in self.consonants for vowel in self.vowels]
+        self.syllable_table = pair_syllables * 3 + plain_syllables * 4
+        # 数字后缀按补零位数展开：0-999 补齐到2或3位
+        self.number_suffixes = [str(n).zfill(width) for width in (2, 3) for n in range(1000)]
 
-    def generate_word(self, min_length=4, max_length=8):
-        """生成一个随机单词"""
+    def _word(self, bits, min_length, max_length):
+        """从一个64位随机数依次取模解码出一个单词"""
+        table, table_size = self.syllable_table, len(self.syllable_table)
+        bits, span = divmod(bits, max_length - min_length + 1)
+        target_length = min_length + span
         word = ""
-        target_length = random.randint(min_length, max_length)
-
         # 添加音节直到达到目标长度附近
-        while len(word) < target_length - 2:
-            word += self.generate_syllable()
+        for _ in range((target_length - 1) // 2 or 1):
+            bits, index = divmod(bits, table_size)
+            word += table[index]
 
-        # 可能添加常用词尾
-        if random.random() < 0.3 and len(word) < max_length - 2:
-            word += random.choice(self.common_endings)
+        # 可能添加常用词尾（30%）
+        bits, roll = divmod(bits, 10)
+        if roll < 3 and len(word) < max_length - 2:
+            word += self.common_endings[bits % len(self.common_endings)]
         elif len(word) < target_length:
-            word += random.choice(self.consonants)
+            word += self.consonants[bits % len(self.consonants)]
+        return word
 
-        return word.lower()
+    def _suffix(self, bits):
+        """50% 不加后缀，35% 加数字，15% 加特殊后缀"""
+        bits, roll = divmod(bits, 20)
+        if roll < 10:
+            return ""
+        if roll < 17:
+            return self.number_suffixes[bits % len(self.number_suffixes)]
+        return self.username_suffixes[bits % len(self.username_suffixes)]
 
-    def generate_random_username(self, min_length=3, max_length=8):
-        """生成随机用户名"""
-        username = self.generate_word(min_length, max_length)
+    def generate_syllable(self):
+        """生成一个音节"""
+        return self.syllable_table[self.random.randrange(len(self.syllable_table))]
 
-        # 50% 的概率添加数字或特殊后缀
-        if random.random() < 0.5:
-            if random.random() < 0.7:  # 70% 概率添加数字
-                username += str(random.randint(0, 999)).zfill(random.randint(2, 3))
-            else:  # 30% 概率添加特殊后缀
-                username += random.choice(self.username_suffixes)
+    def generate_word(self, min_length=4, max_length=8):
+        """生成一个随机单词"""
+        return self._word(self.random.getrandbits(64), min_length, max_length)
 
-        return username
+    def generate_random_username(self, min_length=3, max_length=8):
+        """生成随机用户名"""
+        bits = self.random.getrandbits(96)
+        return self._word(bits >> 32, min_length, max_length) + self._suffix(bits & 0xFFFFFFFF)
 
     def generate_combined_username(self, num_words=1, separator="_"):
         """生成完整的组合用户名"""
-        # 首先生成基础用户名
-        base_username = self.generate_random_username()
+        return self.generate_usernames(1, num_words, separator)[0]
+
+    def generate_usernames(self, count, num_words=1, separator="_"):
+        """
+        一次生成count个组合用户名（批内可能重复，由签发器去重）
+
+        整批只向随机数生成器取一次随机字节，每个用户名按固定宽度切出若干64位随机数解码
+        """
+        chunk = 8 * (num_words + 2)
+        data = self.random.randbytes(chunk * count)
+        from_bytes = int.from_bytes
+        names = []
+        for offset in range(0, chunk * count, chunk):
+            # 基础用户名（单词+后缀）和额外的随机单词
+            control = from_bytes(data[offset:offset + 8], "little")
+            base_username = self._word(from_bytes(data[offset + 8:offset + 16], "little"), 3, 8)
+            words = [self._word(from_bytes(data[start:start + 8], "little"), 4, 8)
+                     for start in range(offset + 16, offset + chunk, 8)]
+            base_username += self._suffix(control >> 1)
+
+            # 随机决定用户名放在前面还是后面
+            if control & 1:
+                words.append(base_username)
+            else:
+                words.insert(0, base_username)
+            names.append(separator.join(words))
+        return names
+
+
+class UsernameIssuer:
+    """批量签发互不重复的随机用户名
+
+    - 一次生成一整批候选名，跳过批内重复和布隆过滤器中已有的名字，不足时再补一批
+    - 签发的用户名和已知存在的用户名（如按地址初始化的现有账户）都记入过滤器，
+      批量创建和账户池补充不会因用户名冲突多付一次上游往返
+    - 过滤器只在进程内有效；多worker时各进程的随机种子不同，跨进程冲突仍由创建失败后的重试兜底
+    """
+
+    def __init__(self, generator=None, capacity=None, error_rate=None):
+        self.generator = generator or WordGenerator(Config.USERNAME_SEED or None)
+        self.filter = BloomFilter(capacity or Config.USERNAME_FILTER_CAPACITY,
+                                  error_rate or Config.USERNAME_FILTER_ERROR_RATE)
+        self._lock = threading.Lock()
+        self._issued = 0
+        self._rejected = 0
+
+    def generate_batch(self, count, num_words=1, separator="_"):
+        """生成count个互不重复、且未签发过的用户名"""
+        names = []
+        with self._lock:
+            while len(names) < count:
+                for name in self.generator.generate_usernames(count - len(names), num_words, separator):
+                    if self.filter.add(name):
+                        self._rejected += 1
+                    else:
+                        names.append(name)
+            self._issued += count
+        return names
+
+    def next_username(self):
+        """签发一个用户名"""
+        return self.generate_batch(1)[0]
+
+    def mark_existing(self, username):
+        """记录上游已存在的用户名，之后不再签发"""
+        with self._lock:
+            self.filter.add(username.lower())
+
+    def stats(self):
+        """返回签发统计信息"""
+        with self._lock:
+            return {
+                "issued": self._issued,
+                "rejected": self._rejected,
+                "filter_entries": self.filter.count,
+                "filter_capacity": self.filter.capacity,
+                "filter_bytes": len(self.filter._bits),
+            }
+
 
-        # 生成额外的随机单词
-        words = [self.generate_word() for _ in range(num_words)]
+_issuer = None
+_issuer_lock = threading.Lock()
 
-        # 随机决定用户名放在前面还是后面
-        if random.random() < 0.5:
-            words.append(base_username)
-        else:
-            words.insert(0, base_username)
 
-        return separator.join(words)
\ No newline at end of file
+def get_username_issuer():
+    """获取进程共享的用户名签发器"""
+    global _issuer
+    if _issuer is None:
+        with _issuer_lock:
+            if _issuer is None:
+                _issuer = UsernameIssuer()
+    return _issuer
@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import deque
+from loguru import logger
+from config import Config
+
+
+class Waiter:
+    """一个挂起的长轮询请求"""
+
+    __slots__ = ("email", "event", "message", "group", "deadline")
+
+    def __init__(self, email, group=None, deadline=None):
+        self.email = email
+        self.event = threading.Event()
+        self.message = None
+        self.group = group  # 属于多地址等待时指向所在的WaitGroup
+        self.deadline = deadline  # 等待截止时间（monotonic），轮询调度器据此安排优先级
+
+
+class WaitGroup:
+    """一个同时等待多个邮箱的请求，收到邮件的邮箱数达到quorum时唤醒"""
+
+    __slots__ = ("waiters", "quorum", "ready", "event")
+
+    def __init__(self, quorum):
+        self.waiters = []
+        self.quorum = quorum
+        self.ready = 0
+        self.event = threading.Event()  # 组内所有等待者共享的就绪信号
+
+
+class WaiterRegistry:
+    """长轮询等待者登记表
+
+    请求线程只在自己的Event上挂起，不做任何轮询；
+    邮箱的共享轮询任务或推送事件发现新邮件后调用 deliver() 唤醒最早的等待者。
+    多地址等待（register_group）的各个等待者共享一个就绪信号，一个请求线程即可等待任意数量的邮箱。
+    """
+
+    def __init__(self, stash_size=10, stash_ttl=None, stash_max_addresses=None):
+        self.stash_size = stash_size
+        self.stash_ttl = stash_ttl or Config.WAIT_STASH_TTL
+        self.stash_max_addresses = stash_max_addresses or Config.WAIT_STASH_MAX_ADDRESSES
+        self._lock = threading.Lock()
+        self._waiters = {}  # {email: deque[Waiter]}
+        # {email: deque[(暂存时间, message)]} 暂无等待者时保留的新邮件，按最近暂存时间排序；
+        # 地址不断轮换时，不再有人等待的邮箱的暂存邮件会过期或被挤出，不会无限累积
+        self._stash = {}
+        self._delivered = 0
+        self._timeouts = 0
+
+    def register(self, email, timeout=None):
+        """登记等待者（timeout为将要等待的秒数）；若有暂存的新邮件则立即完成"""
+        waiter = Waiter(email, deadline=self._deadline(timeout))
+        with self._lock:
+            self._enqueue(waiter)
+        return waiter
+
+    def register_group(self, emails, quorum=1, timeout=None):
+        """登记多地址等待，有暂存新邮件的邮箱立即就绪"""
+        group = WaitGroup(max(1, min(quorum, len(emails))))
+        deadline = self._deadline(timeout)
+        with self._lock:
+            for email in emails:
+                waiter = Waiter(email, group, deadline)
+                group.waiters.append(waiter)
+                self._enqueue(waiter)
+        return group
+
+    def wait(self, waiter, timeout):
+        """挂起直到收到邮件或超时，返回邮件或None"""
+        waiter.event.wait(timeout)
+        with self._lock:
+            # 超时后仍可能在出锁前被投递，以message为准，保证邮件不丢失
+            self._discard(waiter)
+            if waiter.message is None:
+                self._timeouts += 1
+            return waiter.message
+
+    def wait_group(self, group, timeout):
+        """挂起直到达到quorum或超时，返回 {email: 邮件}（只包含已收到邮件的邮箱）"""
+        group.event.wait(timeout)
+        with self._lock:
+            results = {}
+            for waiter in group.waiters:
+                self._discard(waiter)
+                if waiter.message is not None:
+                    results[waiter.email] = waiter.message
+            if group.ready < group.quorum:
+                self._timeouts += 1
+            return results
+
+    def deliver(self, email, message, stash=True):
+        """把新邮件交给最早的等待者；无等待者时按需暂存，返回是否已交付"""
+        with self._lock:
+            queue = self._waiters.get(email)
+            if queue:
+                waiter = queue.popleft()
+                if not queue:
+                    del self._waiters[email]
+                self._complete(waiter, message)
+                return True
+
+            if stash:
+                now = time.monotonic()
+                stashed = self._stash.pop(email, None) or deque(maxlen=self.stash_size)
+                if len(stashed) == stashed.maxlen:
+                    logger.warning(f"邮箱 {email} 暂存邮件已满，丢弃最早的一封")
+                stashed.append((now, message))
+                self._stash[email] = stashed  # 移到末尾，保持按最近暂存时间排序
+                self._prune_stash(now)
+            return False
+
+    def has_waiters(self, email):
+        with self._lock:
+            return bool(self._waiters.get(email))
+
+    def deadline(self, email):
+        """邮箱最近的等待截止时间；没有等待者时返回None，等待者未指定超时时返回inf"""
+        with self._lock:
+            queue = self._waiters.get(email)
+            if not queue:
+                return None
+            return min(float("inf") if w.deadline is None else w.deadline for w in queue)
+
+    def stats(self):
+        """返回等待者统计信息"""
+        with self._lock:
+            return {
+                "addresses": len(self._waiters),
+                "waiters": sum(len(queue) for queue in self._waiters.values()),
+                "stashed": sum(len(queue) for queue in self._stash.values()),
+                "delivered": self._delivered,
+                "timeouts": self._timeouts,
+            }
+
+    @staticmethod
+    def _deadline(timeout):
+        return None if timeout is None else time.monotonic() + timeout
+
+    def _enqueue(self, waiter):
+        """有暂存邮件时立即完成，否则加入等待队列（调用方需持有锁）"""
+        stashed = self._stash.get(waiter.email)
+        message = None
+        if stashed is not None:
+            expired_before = time.monotonic() - self.stash_ttl
+            while stashed and stashed[0][0] < expired_before:
+                stashed.popleft()
+            if stashed:
+                message = stashed.popleft()[1]
+            if not stashed:
+                del self._stash[waiter.email]
+        if message is not None:
+            self._complete(waiter, message)
+        else:
+            self._waiters.setdefault(waiter.email, deque()).append(waiter)
+
+    def _prune_stash(self, now):
+        """从最久未暂存的邮箱开始，移除过期或超出地址上限的暂存（调用方需持有锁）"""
+        expired_before = now - self.stash_ttl
+        while self._stash:
+            email = next(iter(self._stash))
+            if len(self._stash) <= self.stash_max_addresses and self._stash[email][-1][0] >= expired_before:
+                break
+            del self._stash[email]
+
+    def _complete(self, waiter, message):
+        """把邮件交给等待者并唤醒（调用方需持有锁）"""
+        waiter.message = message
+        self._delivered += 1
+        group = waiter.group
+        if group is None:
+            waiter.event.set()
+            return
+        group.ready += 1
+        if group.ready >= group.quorum:
+            group.event.set()
+
+    def _discard(self, waiter):
+        """从等待队列中移除（调用方需持有锁）"""
+        queue = self._waiters.get(waiter.email)
+        if not queue:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        if not queue:
+            del self._waiters[waiter.email]